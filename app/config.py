@@ -9,13 +9,93 @@ class Settings(BaseModel):
     yandex_secret_key: str = ""
     yandex_folder_id: str = ""
     yandex_model: str = "yandexgpt-lite"
+    # REST completion API вместо SDK (пусто - используется SDK)
+    yandex_gpt_url: str = ""
     translater_api_key: str = ""
     translater_folder_id: str = ""
+    translate_api_url: str = "https://translate.api.cloud.yandex.net/translate/v2/translate"
 
     database_url: str = "sqlite:///./vibetel.db"
+    # Количество read-only соединений SQLite (0 - читать через соединение писателя)
+    db_read_pool_size: int = 4
+    # Период фоновой сверки счетчиков статистики с таблицей sentences, сек
+    stats_reconcile_interval: float = 600.0
+    # Сколько последних предложений держать векторизованными для выбора контекста промпта
+    context_pool_size: int = 500
+    # Локальный генератор: подбор готовых предложений из корпуса sentences до запроса к YandexGPT.
+    # Выключен по умолчанию: отдает сохраненные предложения дословно, а не новые от модели
+    local_generator: bool = False
+    # Минимальная оценка соответствия набору объектов (0..1), ниже - запрос к YandexGPT
+    local_generator_min_score: float = 0.6
+    # Сколько последних предложений держать в индексе
+    local_generator_corpus_size: int = 20000
+
+    # Ретеншн таблицы sentences (0 - политика отключена)
+    retention_max_age_days: int = 0
+    retention_max_rows: int = 0
+    retention_interval: float = 3600.0
+    retention_batch_size: int = 200
+    retention_batch_pause: float = 0.05
+    retention_vacuum_pages: int = 256
 
     tts_base_url: str = ""
 
+    # Число процессов-воркеров (run.py; >1 - prefork с общими весами модели)
+    workers: int = 1
+    # Потоки инференса на воркер (0 - по умолчанию библиотеки)
+    inference_threads: int = 0
+    # Потоков декодирования изображений на процесс
+    decode_threads: int = 2
+    # Декодеры по форматам: 'jpeg=turbojpeg,png=opencv,webp=auto' (auto/пусто - самотест при старте)
+    image_decoders: str = ""
+    decoder_benchmark: bool = True
+    # Крупные изображения декодируются в 1/2-1/8 размера, но не меньше этой стороны (0 - полный размер)
+    decode_max_side: int = 1280
+
+    # Токен для /admin ручек (пустой - админ-API отключено)
+    admin_token: str = ""
+    # Сколько последних трасс запросов хранить в памяти
+    trace_buffer_size: int = 1000
+
+    # Кэш ответов GET-ручек в памяти процесса (0 - отключен) и время жизни записи, сек
+    response_cache_size: int = 256
+    response_cache_ttl: float = 300.0
+    # Минимальный размер тела для сжатия br/gzip, байт
+    compression_min_size: int = 1024
+
+    # Idempotency-Key: сколько хранить ответ, сек; размер кэша ответов в памяти;
+    # через сколько секунд захват ключа упавшим воркером считается брошенным
+    idempotency_ttl: float = 86400.0
+    idempotency_cache_size: int = 1000
+    idempotency_pending_timeout: float = 120.0
+
+    # Очередь задач: исполнителей на процесс, максимум незавершенных задач (дальше 429),
+    # интервал опроса очереди, сек, и сколько хранить результат, сек
+    job_workers: int = 2
+    job_queue_max_size: int = 100
+    job_poll_interval: float = 0.5
+    job_result_ttl: float = 3600.0
+
+    # Бюджет запроса по умолчанию, сек (0 - без deadline, только по заголовку);
+    # заголовок X-Request-Timeout-Ms задает свой, но не больше request_timeout_max
+    request_timeout: float = 0.0
+    request_timeout_max: float = 60.0
+    # Бюджет задачи из очереди, сек
+    job_timeout: float = 60.0
+    # Сколько бюджета оставлять после генерации на перевод и запись результата, сек
+    deadline_reserve: float = 0.5
+
+    # Логи пишет фоновый поток через очередь (log_queue_size записей, при переполнении - сброс).
+    # log_format: json или text; log_max_message - обрезка длинных сообщений, символов (0 - нет);
+    # log_sampling - доля INFO/DEBUG записей по логгерам: 'app.services.translator_service=0.1';
+    # log_debug - DEBUG приложения без выборки и обрезки
+    log_level: str = "INFO"
+    log_format: str = "text"
+    log_max_message: int = 2000
+    log_sampling: str = ""
+    log_queue_size: int = 10000
+    log_debug: bool = False
+
     def __init__(self):
         super().__init__(
             local=os.getenv('LOCAL', 'true').lower() == 'true',
@@ -23,10 +103,54 @@ class Settings(BaseModel):
             yandex_secret_key=os.getenv('YANDEX_SECRET_KEY', ''),
             yandex_folder_id=os.getenv('YANDEX_FOLDER_ID', ''),
             yandex_model=os.getenv('MODEL', 'yandexgpt-lite'),
+            yandex_gpt_url=os.getenv('URL', ''),
             translater_api_key=os.getenv('TRANSLATER_API_KEY', ''),
             translater_folder_id=os.getenv('TRANSLATER_FOLDER_ID', ''),
+            translate_api_url=os.getenv(
+                'TRANSLATE_API_URL', 'https://translate.api.cloud.yandex.net/translate/v2/translate'
+            ),
             database_url=os.getenv('DATABASE_URL', 'sqlite:///./vibetel.db'),
-            tts_base_url=os.getenv('TTS_BASE_URL', '')
+            db_read_pool_size=int(os.getenv('DB_READ_POOL_SIZE', '4')),
+            stats_reconcile_interval=float(os.getenv('STATS_RECONCILE_INTERVAL', '600')),
+            context_pool_size=int(os.getenv('CONTEXT_POOL_SIZE', '500')),
+            local_generator=os.getenv('LOCAL_GENERATOR', 'false').lower() == 'true',
+            local_generator_min_score=float(os.getenv('LOCAL_GENERATOR_MIN_SCORE', '0.6')),
+            local_generator_corpus_size=int(os.getenv('LOCAL_GENERATOR_CORPUS_SIZE', '20000')),
+            retention_max_age_days=int(os.getenv('RETENTION_MAX_AGE_DAYS', '0')),
+            retention_max_rows=int(os.getenv('RETENTION_MAX_ROWS', '0')),
+            retention_interval=float(os.getenv('RETENTION_INTERVAL', '3600')),
+            retention_batch_size=int(os.getenv('RETENTION_BATCH_SIZE', '200')),
+            retention_batch_pause=float(os.getenv('RETENTION_BATCH_PAUSE', '0.05')),
+            retention_vacuum_pages=int(os.getenv('RETENTION_VACUUM_PAGES', '256')),
+            tts_base_url=os.getenv('TTS_BASE_URL', ''),
+            workers=int(os.getenv('WORKERS', '1')),
+            inference_threads=int(os.getenv('INFERENCE_THREADS', '0')),
+            decode_threads=int(os.getenv('DECODE_THREADS', '2')),
+            image_decoders=os.getenv('IMAGE_DECODERS', ''),
+            decoder_benchmark=os.getenv('DECODER_BENCHMARK', 'true').lower() == 'true',
+            decode_max_side=int(os.getenv('DECODE_MAX_SIDE', '1280')),
+            admin_token=os.getenv('ADMIN_TOKEN', ''),
+            trace_buffer_size=int(os.getenv('TRACE_BUFFER_SIZE', '1000')),
+            response_cache_size=int(os.getenv('RESPONSE_CACHE_SIZE', '256')),
+            response_cache_ttl=float(os.getenv('RESPONSE_CACHE_TTL', '300')),
+            compression_min_size=int(os.getenv('COMPRESSION_MIN_SIZE', '1024')),
+            idempotency_ttl=float(os.getenv('IDEMPOTENCY_TTL', '86400')),
+            idempotency_cache_size=int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '1000')),
+            idempotency_pending_timeout=float(os.getenv('IDEMPOTENCY_PENDING_TIMEOUT', '120')),
+            job_workers=int(os.getenv('JOB_WORKERS', '2')),
+            job_queue_max_size=int(os.getenv('JOB_QUEUE_MAX_SIZE', '100')),
+            job_poll_interval=float(os.getenv('JOB_POLL_INTERVAL', '0.5')),
+            job_result_ttl=float(os.getenv('JOB_RESULT_TTL', '3600')),
+            request_timeout=float(os.getenv('REQUEST_TIMEOUT', '0')),
+            request_timeout_max=float(os.getenv('REQUEST_TIMEOUT_MAX', '60')),
+            job_timeout=float(os.getenv('JOB_TIMEOUT', '60')),
+            deadline_reserve=float(os.getenv('DEADLINE_RESERVE', '0.5')),
+            log_level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+            log_format=os.getenv('LOG_FORMAT', 'text').lower(),
+            log_max_message=int(os.getenv('LOG_MAX_MESSAGE', '2000')),
+            log_sampling=os.getenv('LOG_SAMPLING', ''),
+            log_queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+            log_debug=os.getenv('LOG_DEBUG', 'false').lower() == 'true'
         )
 
 
@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+from typing import Dict, List
+
+
+@dataclass(slots=True)
+class Detection:
+    """Детекция YOLO: русское название класса, уверенность и bbox [x1, y1, x2, y2] в долях [0, 1]"""
+    class_ru: str
+    confidence: float
+    bbox: List[float]
+
+
+def compact_detections(detections: List[Detection]) -> Dict[str, list]:
+    """Параллельные массивы вместо списка объектов; bbox - плоский массив с шагом 4"""
+    bbox: List[float] = []
+    for d in detections:
+        bbox.extend(d.bbox)
+    return {
+        'class_ru': [d.class_ru for d in detections],
+        'confidence': [d.confidence for d in detections],
+        'bbox': bbox
+    }
+
+
+def encode_detections(detections: List[Detection], detections_format: str = 'objects'):
+    """Детекции для ответа: список Detection (orjson сериализует dataclass сам) или compact"""
+    if detections_format == 'compact':
+        return compact_detections(detections)
+    return detections
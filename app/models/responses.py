@@ -1,10 +1,23 @@
 from enum import Enum
 
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional, Union
 from datetime import datetime
 
 
+class DetectionRecord(BaseModel):
+    class_ru: str
+    confidence: float
+    bbox: List[float]  # [x1, y1, x2, y2] в долях [0, 1]
+
+
+class CompactDetections(BaseModel):
+    """detections_format=compact: параллельные массивы, bbox - плоский с шагом 4"""
+    class_ru: List[str]
+    confidence: List[float]
+    bbox: List[float]
+
+
 class ProcessImageResponse(BaseModel):
     objects_ru: List[str]
     objects_tt: List[str]
@@ -12,12 +25,17 @@ class ProcessImageResponse(BaseModel):
     sentence_tt: str
     target_word_ru: str
     target_word_tt: str
-    detections: List[Dict[str, Any]]
+    detections: Union[List[DetectionRecord], CompactDetections]
     # Метаданные для фронтенда
     image_width: int
     image_height: int
     bbox_format: str = "xyxy"  # [x1,y1,x2,y2] в пикселях
     normalized: bool = True
+    # Направление перевода *_tt полей (по умолчанию ru -> tt)
+    source_language: str
+    target_language: str
+    # Этапы, упрощенные из-за нехватки бюджета запроса (X-Request-Timeout-Ms)
+    degraded_stages: List[str] = []
 
 
 class SentenceRecord(BaseModel):
@@ -30,6 +48,18 @@ class SentenceRecord(BaseModel):
 
 class SentencesResponse(BaseModel):
     sentences: List[SentenceRecord]
+    # Курсор следующей страницы (None - страниц больше нет)
+    next_cursor: Optional[str] = None
+
+
+class ObjectCount(BaseModel):
+    object: str
+    count: int
+
+
+class TopObjectsResponse(BaseModel):
+    hours: int
+    objects: List[ObjectCount]
 
 
 class TranslationDirectionResponse(BaseModel):
@@ -44,13 +74,16 @@ class TranslationDirectionRequest(BaseModel):
 
 class ObjectsResponse(BaseModel):
     objects: List[str]
-    objects_tt: List[str] = []  # переводы на татарский
-    detections: List[Dict[str, Any]]
+    objects_tt: List[str] = []  # переводы на target_language (по умолчанию татарский)
+    detections: Union[List[DetectionRecord], CompactDetections]
     # Метаданные для фронтенда
     image_width: int
     image_height: int
     bbox_format: str = "xyxy"
     normalized: bool = True
+    source_language: str
+    target_language: str
+    degraded_stages: List[str] = []
 
 
 class SentenceGenerationRequest(BaseModel):
@@ -58,9 +91,16 @@ class SentenceGenerationRequest(BaseModel):
     previous_sentences: List[str] = []
 
 
+class BilingualSentenceRequest(SentenceGenerationRequest):
+    # Направление перевода для этого запроса (не задано - /translator/direction)
+    source_language: Optional[str] = None
+    target_language: Optional[str] = None
+
+
 class SentenceGenerationResponse(BaseModel):
     sentence: str
     target_word: str
+    degraded_stages: List[str] = []
 
 
 # Новая модель ответа: сразу две версии предложения (RU и TT)
@@ -69,6 +109,9 @@ class BilingualSentenceResponse(BaseModel):
     sentence_tt: str
     target_word_ru: str
     target_word_tt: str
+    source_language: str
+    target_language: str
+    degraded_stages: List[str] = []
 
 
 class TranslationRequest(BaseModel):
@@ -82,6 +125,21 @@ class TranslationResponse(BaseModel):
     translated_text: str
     source_language: str
     target_language: str
+    degraded_stages: List[str] = []
+
+
+class TranslationBatchRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1, max_length=100)
+    target_languages: List[str] = Field(..., min_length=1, max_length=20)
+    # Не задан - исходный язык из /translator/direction
+    source_language: Optional[str] = None
+
+
+class TranslationBatchResponse(BaseModel):
+    source_language: str
+    # Язык -> переводы в порядке texts
+    translations: Dict[str, List[str]]
+    degraded_stages: List[str] = []
 
 
 class Speaker(Enum):
@@ -101,9 +159,47 @@ class AudioResponse(BaseModel):
 class AlbumMemoryRequest(BaseModel):
     objects: List[str]
     album_theme: str = ""
+    source_language: Optional[str] = None
+    target_language: Optional[str] = None
 
 
 class AlbumMemoryResponse(BaseModel):
     memory_ru: str
     memory_tt: str
     used_objects: List[str]
+    source_language: str
+    target_language: str
+    degraded_stages: List[str] = []
+
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    state: str
+    status_url: str
+    events_url: str
+
+
+class JobError(BaseModel):
+    status_code: int
+    detail: str
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    state: str  # queued, running, done, failed
+    # Для queued - число задач впереди в очереди
+    position: Optional[int] = None
+    # Тело ответа синхронной ручки (ProcessImageResponse / AlbumMemoryResponse)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[JobError] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+class ModelDeployRequest(BaseModel):
+    # Путь к весам/каталогу модели или имя модели ultralytics
+    path: str
+    # 100 - заменить основную модель; меньше - кандидат на этой доле трафика (A/B)
+    traffic_percent: int = Field(100, ge=1, le=100)
@@ -1,9 +1,19 @@
+import asyncio
+import time
+
 from aiohttp import ClientSession, ClientTimeout
 
 from app.config import settings
 from app.models.responses import AudioRequest, AudioResponse
+from app.utils.metrics import timed, upstream_responses
+from app.utils.deadline import DeadlineExceeded, remaining
+from app.utils.performance import tts_limiter
+from app.utils.admission import admission, TTS
+
+TTS_TIMEOUT = 20
 
 
+@timed("generate_audio")
 async def generate_audio(request: AudioRequest) -> AudioResponse:
     if not request.text:
         raise ValueError("Текст для генерации не может быть пустым")
@@ -18,16 +28,41 @@ async def generate_audio(request: AudioRequest) -> AudioResponse:
         'text': request.text,
     }
 
-    timeout = ClientTimeout(total=20)
-    async with ClientSession(timeout=timeout) as session:
-        async with session.get(url, params=params) as resp:
-            body_text = await resp.text()
-            if resp.status != 200:
-                raise RuntimeError(f"Ошибка TTS API {resp.status}: {body_text}")
-            try:
-                data = await resp.json()
-            except Exception:
-                raise RuntimeError("Некорректный JSON ответ от TTS API")
+    # Ожидание места в лимитере TTS - тоже в пределах бюджета запроса
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Бюджет запроса исчерпан до генерации аудио")
+    try:
+        await asyncio.wait_for(tts_limiter.__aenter__(), timeout=left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Бюджет запроса исчерпан в очереди к TTS")
+
+    try:
+        # Запрос к TTS не дольше остатка бюджета после ожидания
+        total = TTS_TIMEOUT
+        left = remaining()
+        if left is not None:
+            if left <= 0:
+                raise DeadlineExceeded("Бюджет запроса исчерпан до генерации аудио")
+            total = min(total, left)
+
+        # Для контроля допуска - только сам запрос к TTS, без ожидания в лимитере
+        started = time.perf_counter()
+        try:
+            async with ClientSession(timeout=ClientTimeout(total=total)) as session:
+                async with session.get(url, params=params) as resp:
+                    upstream_responses.inc('tts', str(resp.status))
+                    body_text = await resp.text()
+                    if resp.status != 200:
+                        raise RuntimeError(f"Ошибка TTS API {resp.status}: {body_text}")
+                    try:
+                        data = await resp.json()
+                    except Exception:
+                        raise RuntimeError("Некорректный JSON ответ от TTS API")
+        finally:
+            admission.observe(TTS, time.perf_counter() - started)
+    finally:
+        await tts_limiter.__aexit__(None, None, None)
 
     audio_b64 = data.get('wav_base64') or data.get('audio_base64') or data.get('audio')
     if not audio_b64:
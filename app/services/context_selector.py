@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import math
+import re
+import zlib
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.utils.shared_state import data_version
+
+logger = logging.getLogger(__name__)
+
+# Хэширование символьных триграмм слов в вектор фиксированной длины (hashing trick)
+NGRAM = 3
+DIMENSIONS = 1024
+# Прибавка к сходству за свежесть (0..1 от самой старой до самой новой строки)
+RECENCY_WEIGHT = 0.1
+# Ниже этого сходства предложение не считается связанным с объектами
+MIN_SIMILARITY = 0.05
+# Грубая оценка токенов YandexGPT для русского текста
+CHARS_PER_TOKEN = 4
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _features(text: str) -> List[int]:
+    indices = []
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f' {word} '
+        for start in range(len(padded) - NGRAM + 1):
+            # crc32 одинаков во всех процессах, в отличие от hash() строки
+            indices.append(zlib.crc32(padded[start:start + NGRAM].encode('utf-8')) % DIMENSIONS)
+    return indices
+
+
+def vectorize(texts: List[str]) -> np.ndarray:
+    """Нормированные векторы триграмм: скалярное произведение - косинусное сходство"""
+    matrix = np.zeros((len(texts), DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        indices = _features(text)
+        if indices:
+            np.add.at(matrix[row], indices, 1.0)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-9)
+
+
+class ContextSelector:
+    """Выбор предыдущих предложений для промпта по сходству с набором объектов.
+
+    Последние capacity предложений хранятся кольцом вместе с векторами в матрице NumPy:
+    заполняется из БД при старте и пополняется при каждом save_sentence. Выбор - одно
+    умножение матрицы на вектор объектов, затем жадный набор лучших в пределах бюджета
+    токенов. Выбранные предложения возвращаются в хронологическом порядке.
+
+    При prefork предложения других воркеров догружаются в фоне, когда растет
+    data_version (как индекс локального генератора); после ретеншна кольцо строится заново.
+    """
+
+    def __init__(
+        self, capacity: int = 500,
+        loader: Optional[Callable[[int, int], Awaitable[List[Tuple[int, str]]]]] = None
+    ):
+        self.capacity = max(1, capacity)
+        self._matrix = np.zeros((self.capacity, DIMENSIONS), dtype=np.float32)
+        self._texts: List[Optional[str]] = [None] * self.capacity
+        # Порядковый номер записи: по нему свежесть и хронологический порядок
+        self._sequence = np.zeros(self.capacity, dtype=np.int64)
+        self._next = 0
+        # (after_id, limit) -> [(id, предложение)] с id > after_id, не больше limit последних, от старых к новым
+        self._loader = loader
+        self._last_id = 0
+        self._generation = -1
+        # Свои сохранения, уже добавленные в кольцо: при догрузке пропускаются
+        self._own_ids: Set[int] = set()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def refresh(self):
+        """Догружает предложения, сохраненные после последней загрузки (в т.ч. другими воркерами)"""
+        generation = data_version.generation
+        if generation != self._generation:
+            self._clear()
+            self._generation = generation
+        rows = await self._loader(self._last_id, self.capacity)
+        sentences = [sentence for sentence_id, sentence in rows if sentence_id not in self._own_ids]
+        if rows:
+            self._last_id = max(self._last_id, rows[-1][0])
+        self._own_ids = {sentence_id for sentence_id in self._own_ids if sentence_id > self._last_id}
+        if sentences:
+            self._push(sentences[-self.capacity:], vectorize(sentences[-self.capacity:]))
+
+    def _clear(self):
+        self._texts = [None] * self.capacity
+        self._next = 0
+        self._last_id = 0
+        self._own_ids.clear()
+
+    def _push(self, sentences: List[str], vectors: np.ndarray):
+        for sentence, vector in zip(sentences, vectors):
+            slot = self._next % self.capacity
+            self._matrix[slot] = vector
+            self._texts[slot] = sentence
+            self._sequence[slot] = self._next
+            self._next += 1
+
+    def append(self, sentence: str, sentence_id: Optional[int] = None):
+        """Свое только что сохраненное предложение - сразу, не дожидаясь догрузки"""
+        self._push([sentence], vectorize([sentence]))
+        if sentence_id is not None:
+            self._own_ids.add(sentence_id)
+
+    def _schedule_refresh(self):
+        if self._loader is None:
+            return
+        stale = data_version.generation != self._generation or data_version.last_sentence_id > self._last_id
+        if stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._refresh_in_background())
+
+    async def _refresh_in_background(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error(f"Ошибка обновления кольца контекста: {e}")
+
+    def __len__(self) -> int:
+        return min(self._next, self.capacity)
+
+    def recent(self, limit: int) -> List[str]:
+        """До limit последних предложений, от новых к старым"""
+        self._schedule_refresh()
+        count = min(limit, len(self))
+        return [self._texts[(self._next - 1 - offset) % self.capacity] for offset in range(count)]
+
+    def select(
+        self, objects: List[str], max_tokens: int, max_sentences: int, candidates: List[str] = None
+    ) -> List[str]:
+        """Самые похожие на объекты предложения суммарно не длиннее max_tokens.
+
+        candidates - свой список (например, previous_sentences клиента в хронологическом
+        порядке), иначе выбор идет из кольца последних сохраненных предложений.
+        """
+        if max_tokens <= 0 or max_sentences <= 0 or not objects:
+            return []
+        self._schedule_refresh()
+
+        if candidates is not None:
+            texts = list(candidates)
+            if not texts:
+                return []
+            matrix = vectorize(texts)
+            order = np.arange(len(texts))
+        else:
+            count = len(self)
+            if count == 0:
+                return []
+            texts = self._texts[:count]
+            matrix = self._matrix[:count]
+            order = self._sequence[:count]
+
+        query = vectorize([' '.join(objects)])[0]
+        similarity = matrix @ query
+        span = max(1, int(order.max() - order.min()))
+        scores = similarity + RECENCY_WEIGHT * (order - order.min()) / span
+
+        chosen, used_tokens = [], 0
+        for index in np.argsort(-scores):
+            if similarity[index] < MIN_SIMILARITY:
+                continue
+            tokens = estimate_tokens(texts[index])
+            if used_tokens + tokens > max_tokens or texts[index] in (texts[i] for i in chosen):
+                continue
+            chosen.append(index)
+            used_tokens += tokens
+            if len(chosen) >= max_sentences:
+                break
+
+        return [texts[index] for index in sorted(chosen, key=lambda index: order[index])]
@@ -1,25 +1,143 @@
+import asyncio
 import aiosqlite
 import json
 import os
+import time
+import zlib
 import logging
-from typing import List, Dict, Any
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from datetime import datetime
+from app.config import settings
+from app.services.statistics_service import StatisticsService
+from app.services.context_selector import ContextSelector
+from app.utils.metrics import timed, db_pool_wait
+from app.utils.shared_state import data_version
 
 logger = logging.getLogger(__name__)
 
+# Версия схемы хранится в PRAGMA user_version; миграции применяются по порядку
+SCHEMA_VERSION = 2
+
+
+def pack_archive_payload(sentence: str, objects_json: str) -> bytes:
+    """Сжимает текст предложения и JSON объектов для sentences_archive"""
+    payload = json.dumps({'sentence': sentence, 'objects': json.loads(objects_json)}, ensure_ascii=False)
+    return zlib.compress(payload.encode('utf-8'))
+
+
+def unpack_archive_payload(payload: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+
+class PoolWaitStats:
+    """Накопительная статистика ожидания свободного read-соединения"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'wait_count': self.count,
+            'wait_seconds_total': self.total_seconds,
+            'wait_seconds_max': self.max_seconds,
+            'wait_seconds_avg': self.total_seconds / self.count if self.count else 0.0
+        }
+
+
 class DatabaseService:
     def __init__(self):
         self.db_path = os.getenv('DATABASE_URL', 'sqlite:///./vibetel.db').replace('sqlite:///', '')
+        # Единственное соединение на запись
         self.connection = None
+        # Пул read-only соединений: каждое aiosqlite соединение живет в своем потоке
+        self.read_pool_size = settings.db_read_pool_size
+        self._reader_connections: List[aiosqlite.Connection] = []
+        self._readers: asyncio.Queue = None
+        self.pool_wait_stats = PoolWaitStats()
+        self.statistics = StatisticsService()
+        self.context_selector = ContextSelector(settings.context_pool_size, loader=self._query_sentences_after)
+        # Схема, миграции и статистика уже подготовлены (при prefork - в мастере до fork):
+        # воркеры наследуют флаг и только открывают соединения и заполняют кэши
+        self.schema_ready = False
     
     async def init_db(self):
         try:
             self.connection = await aiosqlite.connect(self.db_path)
-            await self._create_tables()
+            if not self.schema_ready:
+                await self._prepare_schema()
+            # synchronous действует на соединение, а не на файл базы
+            await self.connection.execute("PRAGMA synchronous=NORMAL")
+            await self._open_read_pool()
+            await self.context_selector.refresh()
+            logger.info(f"Кольцо контекста заполнено: {len(self.context_selector)} предложений")
+            cursor = await self.connection.execute("SELECT MAX(id) FROM sentences")
+            data_version.observe_sentence_id((await cursor.fetchone())[0] or 0)
             logger.info("База данных инициализирована")
         except Exception as e:
             logger.error(f"Ошибка инициализации базы данных: {e}")
             raise
+
+    async def _prepare_schema(self):
+        # Действует только для новой базы: позволяет возвращать место через incremental_vacuum
+        await self.connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL позволяет читателям работать параллельно с писателем; режим сохраняется в файле
+        await self.connection.execute("PRAGMA journal_mode=WAL")
+        await self._create_tables()
+        self.schema_ready = True
+
+    async def _open_read_pool(self):
+        self._readers = asyncio.Queue()
+
+        # In-memory база не разделяется между соединениями - читаем через писателя
+        if self.read_pool_size <= 0 or self.db_path == ':memory:':
+            self._readers.put_nowait(self.connection)
+            logger.info("Пул чтения отключен, чтение через соединение записи")
+            return
+
+        for _ in range(self.read_pool_size):
+            reader = await self._open_read_connection()
+            self._reader_connections.append(reader)
+            self._readers.put_nowait(reader)
+
+        logger.info(f"Открыт пул чтения: {self.read_pool_size} соединений")
+
+    async def _open_read_connection(self) -> aiosqlite.Connection:
+        uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+        reader = await aiosqlite.connect(uri, uri=True)
+        await reader.execute("PRAGMA query_only=ON")
+        return reader
+
+    @asynccontextmanager
+    async def _reader(self):
+        """Выдает свободное read-соединение из пула, учитывая время ожидания"""
+        started = time.perf_counter()
+        connection = await self._readers.get()
+        waited = time.perf_counter() - started
+        self.pool_wait_stats.observe(waited)
+        db_pool_wait.observe(waited)
+        try:
+            yield connection
+        finally:
+            self._readers.put_nowait(connection)
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        size = len(self._reader_connections) or (1 if self._readers is not None else 0)
+        available = self._readers.qsize() if self._readers is not None else 0
+        return {
+            'size': size,
+            'in_use': size - available,
+            **self.pool_wait_stats.as_dict()
+        }
     
     async def _create_tables(self):
         create_sentences_table = """
@@ -31,127 +149,424 @@ class DatabaseService:
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )
         """
+
+        # Нормализованный список объектов предложения (objects хранится и как JSON для совместимости)
+        create_sentence_objects_table = """
+        CREATE TABLE IF NOT EXISTS sentence_objects (
+            sentence_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            object_name TEXT NOT NULL,
+            PRIMARY KEY (sentence_id, position)
+        ) WITHOUT ROWID
+        """
+
+        # Переводы предложений: objects - JSON-список в порядке sentence_objects
+        create_translations_table = """
+        CREATE TABLE IF NOT EXISTS sentence_translations (
+            sentence_id INTEGER NOT NULL,
+            language TEXT NOT NULL,
+            sentence TEXT NOT NULL,
+            target_word TEXT NOT NULL,
+            objects TEXT NOT NULL,
+            PRIMARY KEY (sentence_id, language)
+        ) WITHOUT ROWID
+        """
+
+        # Архив старых строк: фильтруемые поля открыто, текст и объекты сжаты zlib
+        create_archive_table = """
+        CREATE TABLE IF NOT EXISTS sentences_archive (
+            id INTEGER PRIMARY KEY,
+            target_word TEXT NOT NULL,
+            created_at DATETIME,
+            archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            payload BLOB NOT NULL
+        )
+        """
+        
+        # Ответы на запросы с Idempotency-Key (state: pending - выполняется, done - готов)
+        create_idempotency_table = """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            state TEXT NOT NULL,
+            status_code INTEGER,
+            body BLOB,
+            media_type TEXT,
+            expires_at REAL NOT NULL
+        )
+        """
+        
+        # Очередь асинхронных задач (state: queued -> running -> done/failed)
+        create_jobs_table = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            state TEXT NOT NULL,
+            params BLOB NOT NULL,
+            payload BLOB,
+            result BLOB,
+            error TEXT,
+            status_code INTEGER,
+            owner TEXT,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+        """
         
         await self.connection.execute(create_sentences_table)
+        await self.connection.execute(create_sentence_objects_table)
+        await self.connection.execute(create_translations_table)
+        await self.connection.execute(create_archive_table)
+        await self.connection.execute(create_idempotency_table)
+        await self.connection.execute(create_jobs_table)
+        await self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sentences_created_at ON sentences (created_at, id)"
+        )
+        await self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sentence_objects_name ON sentence_objects (object_name, sentence_id)"
+        )
+        await self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sentences_archive_word ON sentences_archive (target_word)"
+        )
+        await self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys (expires_at)"
+        )
+        await self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, created_at)"
+        )
+        await self._migrate()
+        await self.statistics.create_tables(self.connection)
+
+        # Первичное заполнение счетчиков для уже существующей базы
+        if not await self.statistics.is_initialized(self.connection):
+            await self.statistics.rebuild(self.connection)
+            logger.info("Счетчики статистики построены по таблице sentences")
+
         await self.connection.commit()
+
+    async def _migrate(self):
+        cursor = await self.connection.execute("PRAGMA user_version")
+        version = (await cursor.fetchone())[0]
+
+        if version < 1:
+            # Переносим JSON-списки объектов существующих строк в sentence_objects
+            cursor = await self.connection.execute("""
+            INSERT OR IGNORE INTO sentence_objects (sentence_id, position, object_name)
+            SELECT s.id, j.key, j.value FROM sentences s, json_each(s.objects) j
+            """)
+            logger.info(f"Миграция 1: перенесено объектов в sentence_objects: {cursor.rowcount}")
+
+        if version < 2:
+            # Источник предложения: yandex_gpt, fallback, local (NULL - строки до миграции)
+            cursor = await self.connection.execute("PRAGMA table_info(sentences)")
+            if 'source' not in [row[1] for row in await cursor.fetchall()]:
+                await self.connection.execute("ALTER TABLE sentences ADD COLUMN source TEXT")
+            logger.info("Миграция 2: добавлена колонка sentences.source")
+
+        if version != SCHEMA_VERSION:
+            await self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     
-    async def save_sentence(self, sentence: str, target_word: str, objects: List[str]):
+    @timed("db.save_sentence")
+    async def save_sentence(
+        self, sentence: str, target_word: str, objects: List[str],
+        source: Optional[str] = None, translation: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """Сохраняет предложение; translation - {'language', 'sentence', 'target_word', 'objects'}"""
         try:
             objects_json = json.dumps(objects, ensure_ascii=False)
             
             query = """
-            INSERT INTO sentences (sentence, target_word, objects)
-            VALUES (?, ?, ?)
+            INSERT INTO sentences (sentence, target_word, objects, source)
+            VALUES (?, ?, ?, ?)
             """
             
-            await self.connection.execute(query, (sentence, target_word, objects_json))
-            await self.connection.commit()
+            # Предложение, объекты, перевод и счетчики - одна транзакция: при ошибке откатываем,
+            # иначе частичные строки зафиксировал бы следующий commit на общем соединении записи
+            try:
+                cursor = await self.connection.execute(query, (sentence, target_word, objects_json, source))
+                sentence_id = cursor.lastrowid
+                await self.connection.executemany(
+                    "INSERT INTO sentence_objects (sentence_id, position, object_name) VALUES (?, ?, ?)",
+                    [(sentence_id, position, name) for position, name in enumerate(objects)]
+                )
+                if translation:
+                    await self.connection.execute("""
+                    INSERT OR REPLACE INTO sentence_translations (sentence_id, language, sentence, target_word, objects)
+                    VALUES (?, ?, ?, ?, ?)
+                    """, (
+                        sentence_id, translation['language'], translation['sentence'], translation['target_word'],
+                        json.dumps(translation.get('objects') or [], ensure_ascii=False)
+                    ))
+                await self.statistics.record_sentence(self.connection, target_word)
+                await self.connection.commit()
+            except Exception:
+                await self.connection.rollback()
+                raise
+
+            # Кольцо в памяти и версия данных - только после успешного commit
+            self.context_selector.append(sentence, sentence_id)
+            # Инвалидирует ETag и кэш ответов во всех воркерах
+            data_version.record_sentence(sentence_id)
             
             logger.info(f"Предложение сохранено: {sentence}")
+            return sentence_id
             
         except Exception as e:
             logger.error(f"Ошибка сохранения предложения: {e}")
             raise
     
-    async def get_recent_sentences(self, limit: int = 10) -> List[str]:
+    async def _query_sentences_after(self, after_id: int, limit: int) -> List[Tuple[int, str]]:
+        """(id, предложение) с id > after_id: не больше limit последних, от старых к новым"""
+        query = """
+        SELECT id, sentence FROM (
+            SELECT id, sentence FROM sentences WHERE id > ? ORDER BY id DESC LIMIT ?
+        ) ORDER BY id
+        """
+
+        async with self._reader() as reader:
+            cursor = await reader.execute(query, (after_id, limit))
+            rows = await cursor.fetchall()
+
+        return [(row[0], row[1]) for row in rows]
+    
+    @timed("db.get_corpus_sentences")
+    async def get_corpus_sentences(self, after_id: int = 0, limit: int = 20000) -> List[Dict[str, Any]]:
+        """Предложения модели (не шаблонные и не локальные) с id > after_id и их переводы.
+
+        Для индекса локального генератора: не больше limit последних, от старых к новым.
+        """
+        query = """
+        SELECT id, sentence, target_word, objects FROM sentences
+        WHERE id > ? AND (source IS NULL OR source = 'yandex_gpt') AND target_word != 'album_memory'
+        ORDER BY id DESC
+        LIMIT ?
+        """
+
+        async with self._reader() as reader:
+            cursor = await reader.execute(query, (after_id, limit))
+            rows = await cursor.fetchall()
+            if not rows:
+                return []
+
+            cursor = await reader.execute("""
+            SELECT sentence_id, language, sentence, target_word, objects FROM sentence_translations
+            WHERE sentence_id >= ?
+            """, (rows[-1][0],))
+            translation_rows = await cursor.fetchall()
+
+        translations: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        for sentence_id, language, sentence, target_word, objects in translation_rows:
+            translations.setdefault(sentence_id, {})[language] = {
+                'sentence': sentence,
+                'target_word': target_word,
+                'objects': json.loads(objects)
+            }
+
+        return [
+            {
+                'id': row[0],
+                'sentence': row[1],
+                'target_word': row[2],
+                'objects': json.loads(row[3]),
+                'translations': translations.get(row[0], {})
+            }
+            for row in reversed(rows)
+        ]
+    
+    async def _attach_objects(self, reader: aiosqlite.Connection, rows) -> List[Dict[str, Any]]:
+        """Собирает словари предложений, подтягивая объекты одним запросом к sentence_objects"""
+        sentences = []
+        by_id: Dict[int, Dict[str, Any]] = {}
+        for row in rows:
+            sentence_data = {
+                'id': row[0],
+                'sentence': row[1],
+                'target_word': row[2],
+                'objects': [],
+                'created_at': row[3]
+            }
+            sentences.append(sentence_data)
+            by_id[row[0]] = sentence_data
+
+        if by_id:
+            placeholders = ','.join('?' * len(by_id))
+            cursor = await reader.execute(f"""
+            SELECT sentence_id, object_name FROM sentence_objects
+            WHERE sentence_id IN ({placeholders})
+            ORDER BY sentence_id, position
+            """, tuple(by_id))
+            for sentence_id, object_name in await cursor.fetchall():
+                by_id[sentence_id]['objects'].append(object_name)
+
+        return sentences
+
+    @timed("db.get_sentences_with_details")
+    async def get_sentences_with_details(
+        self, limit: int = 20, before: Optional[Tuple[str, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Страница предложений от новых к старым.
+
+        before - позиция (created_at, id) последней строки предыдущей страницы:
+        keyset-пагинация по индексу idx_sentences_created_at без OFFSET.
+        """
         try:
-            query = """
-            SELECT sentence FROM sentences 
-            ORDER BY created_at DESC 
+            if before is None:
+                where, params = "", (limit,)
+            else:
+                where, params = "WHERE (created_at, id) < (?, ?)", (*before, limit)
+
+            query = f"""
+            SELECT id, sentence, target_word, created_at 
+            FROM sentences 
+            {where} 
+            ORDER BY created_at DESC, id DESC 
             LIMIT ?
             """
             
-            cursor = await self.connection.execute(query, (limit,))
-            rows = await cursor.fetchall()
-            
-            sentences = [row[0] for row in rows]
-            return sentences
+            async with self._reader() as reader:
+                cursor = await reader.execute(query, params)
+                rows = await cursor.fetchall()
+                return await self._attach_objects(reader, rows)
             
         except Exception as e:
-            logger.error(f"Ошибка получения предложений: {e}")
+            logger.error(f"Ошибка получения детальных данных предложений: {e}")
             return []
+
+    async def iter_sentences_ndjson(self, batch_size: int = 500) -> AsyncIterator[str]:
+        """Потоково отдает все предложения (от старых к новым) строками NDJSON.
+
+        JSON строки собирается внутри SQLite, в памяти держится только текущая пачка.
+        Экспорт идет через отдельное read-соединение, чтобы не занимать пул.
+        """
+        query = """
+        SELECT json_object(
+            'id', id,
+            'sentence', sentence,
+            'target_word', target_word,
+            'objects', json(objects),
+            -- ISO 8601, как created_at в /sentences (sentence_records)
+            'created_at', strftime('%Y-%m-%dT%H:%M:%S', created_at)
+        )
+        FROM sentences
+        ORDER BY created_at, id
+        """
+
+        connection = self.connection if self.db_path == ':memory:' else await self._open_read_connection()
+        try:
+            cursor = await connection.execute(query)
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield ''.join(row[0] + '\n' for row in rows)
+            await cursor.close()
+        finally:
+            if connection is not self.connection:
+                await connection.close()
     
-    async def get_sentences_with_details(self, limit: int = 20) -> List[Dict[str, Any]]:
+    @timed("db.get_sentences_by_word")
+    async def get_sentences_by_word(self, word: str, limit: int = 10) -> List[Dict[str, Any]]:
         try:
             query = """
-            SELECT id, sentence, target_word, objects, created_at 
+            SELECT id, sentence, target_word, created_at 
             FROM sentences 
-            ORDER BY created_at DESC 
+            WHERE target_word LIKE ? 
+            ORDER BY created_at DESC, id DESC 
             LIMIT ?
             """
             
-            cursor = await self.connection.execute(query, (limit,))
-            rows = await cursor.fetchall()
+            async with self._reader() as reader:
+                cursor = await reader.execute(query, (f'%{word}%', limit))
+                rows = await cursor.fetchall()
+                return await self._attach_objects(reader, rows)
             
-            sentences = []
-            for row in rows:
-                sentence_data = {
-                    'id': row[0],
-                    'sentence': row[1],
-                    'target_word': row[2],
-                    'objects': json.loads(row[3]),
-                    'created_at': row[4]
-                }
-                sentences.append(sentence_data)
+        except Exception as e:
+            logger.error(f"Ошибка поиска предложений по слову: {e}")
+            return []
+
+    @timed("db.get_sentences_by_object")
+    async def get_sentences_by_object(self, object_name: str, limit: int = 10) -> List[Dict[str, Any]]:
+        try:
+            query = """
+            SELECT id, sentence, target_word, created_at 
+            FROM sentences 
+            WHERE id IN (SELECT sentence_id FROM sentence_objects WHERE object_name = ?) 
+            ORDER BY created_at DESC, id DESC 
+            LIMIT ?
+            """
             
-            return sentences
+            async with self._reader() as reader:
+                cursor = await reader.execute(query, (object_name, limit))
+                rows = await cursor.fetchall()
+                return await self._attach_objects(reader, rows)
             
         except Exception as e:
-            logger.error(f"Ошибка получения детальных данных предложений: {e}")
+            logger.error(f"Ошибка поиска предложений по объекту: {e}")
             return []
-    
-    async def get_sentences_by_word(self, word: str, limit: int = 10) -> List[Dict[str, Any]]:
+
+    @timed("db.get_top_objects")
+    async def get_top_objects(self, hours: int = 24, limit: int = 10) -> List[Dict[str, Any]]:
         try:
             query = """
-            SELECT id, sentence, target_word, objects, created_at 
-            FROM sentences 
-            WHERE target_word LIKE ? 
-            ORDER BY created_at DESC 
+            SELECT o.object_name, COUNT(DISTINCT o.sentence_id) AS cnt 
+            FROM sentences s 
+            JOIN sentence_objects o ON o.sentence_id = s.id 
+            WHERE s.created_at >= datetime('now', ?) 
+            GROUP BY o.object_name 
+            ORDER BY cnt DESC, o.object_name 
             LIMIT ?
             """
             
-            cursor = await self.connection.execute(query, (f'%{word}%', limit))
-            rows = await cursor.fetchall()
+            async with self._reader() as reader:
+                cursor = await reader.execute(query, (f'-{hours} hours', limit))
+                rows = await cursor.fetchall()
+            
+            return [{'object': row[0], 'count': row[1]} for row in rows]
+            
+        except Exception as e:
+            logger.error(f"Ошибка получения популярных объектов: {e}")
+            return []
+    
+    @timed("db.get_archived_sentences")
+    async def get_archived_sentences(self, word: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Предложения из архива (от новых к старым), опционально с фильтром по target_word"""
+        try:
+            where, params = ("WHERE target_word LIKE ?", (f'%{word}%', limit)) if word else ("", (limit,))
+            query = f"""
+            SELECT id, target_word, created_at, payload 
+            FROM sentences_archive 
+            {where} 
+            ORDER BY created_at DESC, id DESC 
+            LIMIT ?
+            """
+            
+            async with self._reader() as reader:
+                cursor = await reader.execute(query, params)
+                rows = await cursor.fetchall()
             
             sentences = []
             for row in rows:
-                sentence_data = {
+                payload = unpack_archive_payload(row[3])
+                sentences.append({
                     'id': row[0],
-                    'sentence': row[1],
-                    'target_word': row[2],
-                    'objects': json.loads(row[3]),
-                    'created_at': row[4]
-                }
-                sentences.append(sentence_data)
+                    'sentence': payload['sentence'],
+                    'target_word': row[1],
+                    'objects': payload['objects'],
+                    'created_at': row[2]
+                })
             
             return sentences
             
         except Exception as e:
-            logger.error(f"Ошибка поиска предложений по слову: {e}")
+            logger.error(f"Ошибка чтения архива предложений: {e}")
             return []
     
+    @timed("db.get_statistics")
     async def get_statistics(self) -> Dict[str, Any]:
         try:
-            total_query = "SELECT COUNT(*) FROM sentences"
-            cursor = await self.connection.execute(total_query)
-            total_sentences = (await cursor.fetchone())[0]
-            
-            words_query = "SELECT COUNT(DISTINCT target_word) FROM sentences"
-            cursor = await self.connection.execute(words_query)
-            unique_words = (await cursor.fetchone())[0]
-            
-            recent_query = """
-            SELECT COUNT(*) FROM sentences 
-            WHERE created_at >= datetime('now', '-24 hours')
-            """
-            cursor = await self.connection.execute(recent_query)
-            recent_sentences = (await cursor.fetchone())[0]
-            
-            return {
-                'total_sentences': total_sentences,
-                'unique_words': unique_words,
-                'sentences_today': recent_sentences
-            }
+            async with self._reader() as reader:
+                return await self.statistics.get_statistics(reader)
             
         except Exception as e:
             logger.error(f"Ошибка получения статистики: {e}")
@@ -160,8 +575,52 @@ class DatabaseService:
                 'unique_words': 0,
                 'sentences_today': 0
             }
+
+    async def reconcile_statistics(self) -> bool:
+        """Сверяет счетчики с таблицей sentences, при расхождении пересобирает их.
+
+        Сравнение выполняется в одном read-снимке, поэтому параллельные вставки
+        не дают ложных расхождений. Возвращает True, если счетчики совпали.
+        """
+        async with self._reader() as reader:
+            # Без пула reader совпадает с писателем, у которого может быть открыта транзакция
+            snapshot = not reader.in_transaction
+            if snapshot:
+                await reader.execute("BEGIN")
+            try:
+                expected = await self.statistics.compute_from_source(reader)
+                actual = await self.statistics.get_statistics(reader)
+            finally:
+                if snapshot:
+                    await reader.execute("COMMIT")
+
+        await self.statistics.prune_buckets(self.connection)
+        if expected != actual:
+            logger.warning(f"Расхождение статистики: счетчики {actual}, таблица {expected}. Пересборка")
+            await self.statistics.rebuild(self.connection)
+        await self.connection.commit()
+        if expected != actual:
+            data_version.bump()
+
+        return expected == actual
+
+    async def run_statistics_reconciler(self, interval_seconds: float):
+        """Фоновая периодическая сверка счетчиков статистики"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.reconcile_statistics()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка сверки статистики: {e}")
     
     async def close(self):
+        for reader in self._reader_connections:
+            await reader.close()
+        self._reader_connections = []
+
         if self.connection:
             await self.connection.close()
+            self.connection = None
             logger.info("Соединение с базой данных закрыто")
@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+import aiosqlite
+import orjson
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from app.config import settings
+from app.services.database_service import DatabaseService
+from app.utils.performance import performance
+
+logger = logging.getLogger(__name__)
+
+REPLAYED_HEADER = 'Idempotent-Replayed'
+# Как часто владелец ключа в другом воркере проверяет, готов ли результат
+PENDING_POLL_INTERVAL = 0.1
+CLEANUP_INTERVAL = 60.0
+
+
+def request_fingerprint(*parts: bytes) -> str:
+    """Отпечаток тела запроса: тот же ключ с другим запросом - ошибка клиента"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+@dataclass
+class StoredResponse:
+    status_code: int
+    body: bytes
+    media_type: str
+
+    def to_response(self, replayed: bool) -> Response:
+        headers = {REPLAYED_HEADER: 'true'} if replayed else None
+        return Response(self.body, status_code=self.status_code, media_type=self.media_type, headers=headers)
+
+
+class IdempotencyService:
+    """Повторы запросов с заголовком Idempotency-Key.
+
+    - одновременные дубликаты в процессе ждут Future первого выполнения;
+    - готовые ответы (2xx/4xx) хранятся в ограниченном LRU с TTL и в таблице
+      idempotency_keys, чтобы повтор, попавший в другой воркер, тоже их получил;
+    - запись 'pending' в таблице - захват ключа между воркерами;
+    - 5xx не сохраняются: ключ освобождается, и клиент может повторить запрос.
+    """
+
+    def __init__(self, database_service: DatabaseService):
+        self.database_service = database_service
+        self.ttl = settings.idempotency_ttl
+        self.pending_timeout = settings.idempotency_pending_timeout
+        self._connection: Optional[aiosqlite.Connection] = None
+        self._own_connection = False
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self._completed: "OrderedDict[str, tuple]" = OrderedDict()
+        self._last_cleanup = 0.0
+        self.replays = 0
+
+    async def start(self):
+        # Собственное соединение: короткие commit'ы не вмешиваются в транзакции save_sentence
+        if self.database_service.db_path == ':memory:':
+            self._connection = self.database_service.connection
+        else:
+            self._connection = await aiosqlite.connect(self.database_service.db_path)
+            self._own_connection = True
+
+    async def close(self):
+        if self._own_connection and self._connection:
+            await self._connection.close()
+        self._connection = None
+
+    async def execute(
+        self, key: str, fingerprint: str, handler: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        """Выполняет handler не больше одного раза на ключ за время TTL"""
+        future = self._in_flight.get(key)
+        if future is not None:
+            self._check_fingerprint(key, self._fingerprints[key], fingerprint)
+            stored = await asyncio.shield(future)
+            return self._replay(stored)
+
+        stored = self._get_completed(key, fingerprint)
+        if stored is not None:
+            return self._replay(stored)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        self._fingerprints[key] = fingerprint
+        try:
+            stored = await self._claim_or_wait(key, fingerprint)
+            if stored is not None:
+                future.set_result(stored)
+                return self._replay(stored)
+
+            try:
+                stored = await self._run_handler(handler)
+            except BaseException:
+                await self._release(key)
+                raise
+
+            if stored.status_code >= 500:
+                await self._release(key)
+            else:
+                await self._save(key, fingerprint, stored)
+            future.set_result(stored)
+            return stored.to_response(replayed=False)
+
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Исключение получают ожидающие дубликаты; без них не логируем "never retrieved"
+                future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+            self._fingerprints.pop(key, None)
+
+    async def _run_handler(self, handler: Callable[[], Awaitable[Response]]) -> StoredResponse:
+        try:
+            response = await handler()
+        except HTTPException as e:
+            if e.status_code >= 500:
+                raise
+            # Детерминированные ошибки клиента сохраняются так же, как успешные ответы
+            return StoredResponse(e.status_code, orjson.dumps(jsonable_encoder({'detail': e.detail})), 'application/json')
+        return StoredResponse(response.status_code, bytes(response.body), response.media_type or 'application/json')
+
+    def _replay(self, stored: StoredResponse) -> Response:
+        self.replays += 1
+        return stored.to_response(replayed=True)
+
+    @staticmethod
+    def _check_fingerprint(key: str, expected: str, actual: str):
+        if expected != actual:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Idempotency-Key {key} уже использован с другим запросом"
+            )
+
+    def _get_completed(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        item = self._completed.get(key)
+        if item is None:
+            return None
+        expires_at, stored_fingerprint, stored = item
+        if expires_at < time.time():
+            del self._completed[key]
+            return None
+        self._check_fingerprint(key, stored_fingerprint, fingerprint)
+        self._completed.move_to_end(key)
+        return stored
+
+    def _remember(self, key: str, expires_at: float, fingerprint: str, stored: StoredResponse):
+        cache_size = performance.get().idempotency_cache_size
+        if cache_size > 0:
+            self._completed[key] = (expires_at, fingerprint, stored)
+            self._completed.move_to_end(key)
+        while len(self._completed) > cache_size:
+            self._completed.popitem(last=False)
+
+    async def _claim_or_wait(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """None - ключ захвачен этим процессом; иначе сохраненный ответ другого воркера"""
+        await self._cleanup()
+        while True:
+            now = time.time()
+            cursor = await self._connection.execute("""
+            INSERT OR IGNORE INTO idempotency_keys (key, fingerprint, state, expires_at)
+            VALUES (?, ?, 'pending', ?)
+            """, (key, fingerprint, now + self.pending_timeout))
+            await self._connection.commit()
+            if cursor.rowcount == 1:
+                return None
+
+            cursor = await self._connection.execute("""
+            SELECT fingerprint, state, status_code, body, media_type, expires_at
+            FROM idempotency_keys WHERE key = ?
+            """, (key,))
+            row = await cursor.fetchone()
+            if row is None:
+                continue
+
+            stored_fingerprint, state, status_code, body, media_type, expires_at = row
+            if expires_at < now:
+                # Просроченный ответ или зависший захват (воркер упал) - освобождаем ключ
+                await self._connection.execute(
+                    "DELETE FROM idempotency_keys WHERE key = ? AND expires_at < ?", (key, now)
+                )
+                await self._connection.commit()
+                continue
+
+            self._check_fingerprint(key, stored_fingerprint, fingerprint)
+            if state == 'done':
+                stored = StoredResponse(status_code, body, media_type)
+                self._remember(key, expires_at, stored_fingerprint, stored)
+                return stored
+
+            await asyncio.sleep(PENDING_POLL_INTERVAL)
+
+    async def _save(self, key: str, fingerprint: str, stored: StoredResponse):
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, fingerprint, stored)
+        try:
+            await self._connection.execute("""
+            UPDATE idempotency_keys
+            SET state = 'done', status_code = ?, body = ?, media_type = ?, expires_at = ?
+            WHERE key = ?
+            """, (stored.status_code, stored.body, stored.media_type, expires_at, key))
+            await self._connection.commit()
+        except Exception as e:
+            # Ответ уже получен - ошибка хранилища не должна его терять
+            logger.error(f"Ошибка сохранения ответа для Idempotency-Key {key}: {e}")
+
+    async def _release(self, key: str):
+        try:
+            await self._connection.execute(
+                "DELETE FROM idempotency_keys WHERE key = ? AND state = 'pending'", (key,)
+            )
+            await self._connection.commit()
+        except Exception as e:
+            logger.error(f"Ошибка освобождения Idempotency-Key {key}: {e}")
+
+    async def _cleanup(self):
+        now = time.time()
+        if now - self._last_cleanup < CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        cursor = await self._connection.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (now,))
+        await self._connection.commit()
+        if cursor.rowcount:
+            logger.info(f"Удалено просроченных ключей идемпотентности: {cursor.rowcount}")
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'in_flight': len(self._in_flight),
+            'cached': len(self._completed),
+            'replays': self.replays
+        }
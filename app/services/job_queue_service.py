@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import aiosqlite
+import orjson
+from fastapi import HTTPException
+
+from app.config import settings
+from app.services.database_service import DatabaseService
+from app.utils.deadline import Deadline, current_deadline
+from app.utils.metrics import job_queue_depth, job_wait, job_duration, jobs_finished
+from app.utils.shared_state import process_alive
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = ('done', 'failed')
+CLEANUP_INTERVAL = 60.0
+
+# Обработчик задачи: (params, payload) -> результат, сериализуемый orjson
+JobHandler = Callable[[Dict[str, Any], Optional[bytes]], Awaitable[Any]]
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobQueueService:
+    """Очередь тяжелых задач в таблице jobs с пулом исполнителей в каждом процессе.
+
+    - submit записывает задачу (параметры и тело, например изображение) и сразу
+      возвращает id; при job_queue_max_size незавершенных задач - QueueFullError (429);
+    - исполнители захватывают задачи атомарным UPDATE ... RETURNING, поэтому
+      несколько воркеров безопасно работают с одной таблицей;
+    - задачи, захваченные упавшим процессом, возвращаются в очередь при старте;
+    - результат и ошибка хранятся job_result_ttl секунд, тело задачи удаляется сразу.
+    """
+
+    def __init__(self, database_service: DatabaseService):
+        self.database_service = database_service
+        self.concurrency = settings.job_workers
+        self.max_size = settings.job_queue_max_size
+        self.poll_interval = settings.job_poll_interval
+        self.result_ttl = settings.job_result_ttl
+        self.job_timeout = settings.job_timeout
+        self.handlers: Dict[str, JobHandler] = {}
+        self._connection: Optional[aiosqlite.Connection] = None
+        self._own_connection = False
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._finished: Dict[str, asyncio.Event] = {}
+        self._last_cleanup = 0.0
+        self._owner = ''
+
+    def register(self, kind: str, handler: JobHandler):
+        self.handlers[kind] = handler
+
+    async def start(self):
+        if self.database_service.db_path == ':memory:':
+            self._connection = self.database_service.connection
+        else:
+            self._connection = await aiosqlite.connect(self.database_service.db_path)
+            self._own_connection = True
+
+        # pid берется после fork: при prefork сервис создается еще в мастере
+        self._owner = str(os.getpid())
+        await self._requeue_orphaned()
+        self._workers = [asyncio.create_task(self._worker_loop()) for _ in range(self.concurrency)]
+        logger.info(f"Очередь задач запущена: исполнителей {self.concurrency}, лимит {self.max_size}")
+
+    async def close(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # Прерванные задачи этого процесса возвращаются в очередь для других воркеров
+        await self._connection.execute(
+            "UPDATE jobs SET state = 'queued', started_at = NULL, owner = NULL WHERE state = 'running' AND owner = ?",
+            (self._owner,)
+        )
+        await self._connection.commit()
+        if self._own_connection and self._connection:
+            await self._connection.close()
+        self._connection = None
+
+    async def submit(self, kind: str, params: Dict[str, Any], payload: Optional[bytes] = None) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"Неизвестный тип задачи: {kind}")
+
+        depth = await self._pending_count()
+        if depth >= self.max_size:
+            raise QueueFullError(f"Очередь задач заполнена ({depth}/{self.max_size})")
+
+        job_id = uuid.uuid4().hex
+        await self._connection.execute("""
+        INSERT INTO jobs (id, kind, state, params, payload, created_at)
+        VALUES (?, ?, 'queued', ?, ?, ?)
+        """, (job_id, kind, orjson.dumps(params), payload, time.time()))
+        await self._connection.commit()
+        job_queue_depth.set(depth + 1)
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        cursor = await self._connection.execute("""
+        SELECT id, kind, state, result, error, status_code, created_at, started_at, finished_at
+        FROM jobs WHERE id = ?
+        """, (job_id,))
+        row = await cursor.fetchone()
+        if row is None:
+            return None
+
+        job = {
+            'job_id': row[0],
+            'kind': row[1],
+            'state': row[2],
+            'result': orjson.loads(row[3]) if row[3] is not None else None,
+            'error': None,
+            'created_at': row[6],
+            'started_at': row[7],
+            'finished_at': row[8]
+        }
+        if row[4] is not None:
+            job['error'] = {'status_code': row[5], 'detail': row[4]}
+        if row[2] == 'queued':
+            job['position'] = await self._queue_position(row[6])
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> None:
+        """Ждет завершения задачи не дольше timeout.
+
+        Задачу этого процесса будит событие, задачу другого воркера - интервал опроса.
+        """
+        event = self._finished.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=min(timeout, self.poll_interval))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # Событие живет не дольше одного ожидания, чтобы не копить записи по задачам других воркеров
+            if self._finished.get(job_id) is event:
+                del self._finished[job_id]
+
+    async def events(self, job_id: str, heartbeat: float = 15.0) -> AsyncIterator[str]:
+        """Поток Server-Sent Events: состояние задачи при каждом изменении, до завершения"""
+        last_state = None
+        last_sent = time.monotonic()
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {orjson.dumps({'detail': 'Задача не найдена'}).decode()}\n\n"
+                return
+            if job['state'] != last_state or job['state'] in TERMINAL_STATES:
+                last_state = job['state']
+                last_sent = time.monotonic()
+                yield f"event: {job['state']}\ndata: {orjson.dumps(job).decode()}\n\n"
+                if job['state'] in TERMINAL_STATES:
+                    return
+            elif time.monotonic() - last_sent >= heartbeat:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            await self.wait(job_id, heartbeat)
+
+    async def _pending_count(self) -> int:
+        cursor = await self._connection.execute(
+            "SELECT COUNT(*) FROM jobs WHERE state IN ('queued', 'running')"
+        )
+        return (await cursor.fetchone())[0]
+
+    async def _queue_position(self, created_at: float) -> int:
+        cursor = await self._connection.execute(
+            "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND created_at < ?", (created_at,)
+        )
+        return (await cursor.fetchone())[0]
+
+    async def _claim(self) -> Optional[tuple]:
+        cursor = await self._connection.execute("""
+        UPDATE jobs SET state = 'running', started_at = ?, owner = ?
+        WHERE id = (SELECT id FROM jobs WHERE state = 'queued' ORDER BY created_at LIMIT 1)
+          AND state = 'queued'
+        RETURNING id, kind, params, payload, created_at
+        """, (time.time(), self._owner))
+        row = await cursor.fetchone()
+        await self._connection.commit()
+        return row
+
+    async def _worker_loop(self):
+        while True:
+            try:
+                row = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка захвата задачи: {e}")
+                row = None
+
+            if row is None:
+                await self._cleanup()
+                self._wakeup.clear()
+                try:
+                    # Задачи других воркеров не будят это событие - подстраховка опросом
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(*row)
+
+    async def _run(self, job_id: str, kind: str, params: bytes, payload: Optional[bytes], created_at: float):
+        started = time.time()
+        job_wait.observe(max(0.0, started - created_at), kind)
+        result, error, status_code = None, None, None
+        # У задачи свой бюджет: этапы деградируют так же, как в синхронных ручках
+        token = current_deadline.set(Deadline(self.job_timeout) if self.job_timeout > 0 else None)
+        try:
+            result = orjson.dumps(await self.handlers[kind](orjson.loads(params), payload))
+            state = 'done'
+        except asyncio.CancelledError:
+            raise
+        except HTTPException as e:
+            state, error, status_code = 'failed', str(e.detail), e.status_code
+        except Exception as e:
+            logger.error(f"Ошибка выполнения задачи {job_id} ({kind}): {e}")
+            state, error, status_code = 'failed', f"Ошибка обработки: {e}", 500
+        finally:
+            current_deadline.reset(token)
+
+        job_duration.observe(time.time() - started, kind)
+        jobs_finished.inc(kind, state)
+        await self._connection.execute("""
+        UPDATE jobs SET state = ?, result = ?, error = ?, status_code = ?, finished_at = ?, payload = NULL
+        WHERE id = ?
+        """, (state, result, error, status_code, time.time(), job_id))
+        await self._connection.commit()
+        job_queue_depth.set(await self._pending_count())
+
+        event = self._finished.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def _requeue_orphaned(self):
+        """Возвращает в очередь задачи, которые выполнялись процессами, которых уже нет"""
+        cursor = await self._connection.execute("SELECT id, owner FROM jobs WHERE state = 'running'")
+        requeued = 0
+        for job_id, owner in await cursor.fetchall():
+            if owner and owner.isdigit() and process_alive(int(owner)):
+                continue
+            await self._connection.execute(
+                "UPDATE jobs SET state = 'queued', started_at = NULL, owner = NULL WHERE id = ? AND state = 'running'",
+                (job_id,)
+            )
+            requeued += 1
+        await self._connection.commit()
+        if requeued:
+            logger.warning(f"Возвращено в очередь незавершенных задач: {requeued}")
+
+    async def _cleanup(self):
+        now = time.time()
+        if now - self._last_cleanup < CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        await self._connection.execute(
+            "DELETE FROM jobs WHERE state IN ('done', 'failed') AND finished_at < ?", (now - self.result_ttl,)
+        )
+        await self._connection.commit()
+        job_queue_depth.set(await self._pending_count())
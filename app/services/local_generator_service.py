@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import random
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.services.database_service import DatabaseService
+from app.utils.metrics import timed, local_generator_lookups
+from app.utils.performance import performance
+from app.utils.shared_state import data_version
+
+logger = logging.getLogger(__name__)
+
+# Промпт просит 2-3 объекта в предложении: больше для полного покрытия не требуется
+MAX_OBJECTS_PER_SENTENCE = 3
+# Из скольких лучших кандидатов выбирать случайно, чтобы ответы не повторялись
+TOP_CANDIDATES = 5
+_ENDINGS = 'аеёиоуыэюяйь'
+
+
+def _stem(word: str) -> str:
+    """Грубая основа слова: без конечной гласной/й/ь (книга -> книг совпадет с 'книгу')"""
+    return word[:-1] if len(word) > 3 and word[-1] in _ENDINGS else word
+
+
+def mentions(sentence: str, obj: str) -> bool:
+    """Упоминается ли объект в тексте (все слова названия, с точностью до окончания)"""
+    text = sentence.lower()
+    return all(_stem(word) in text for word in obj.lower().split())
+
+
+@dataclass(slots=True)
+class CorpusEntry:
+    sentence: str
+    target_word: str
+    # Объекты, которые действительно упомянуты в тексте предложения
+    mentioned: Tuple[str, ...]
+    # Язык -> {русский текст: перевод} для предложения, целевого слова и объектов
+    translations: Dict[str, Dict[str, str]]
+
+
+class LocalSentenceGenerator:
+    """Первый уровень генерации: готовое предложение модели из корпуса sentences.
+
+    В памяти держится инвертированный индекс объект -> id предложений, в которых он
+    упомянут. Кандидат оценивается как покрытие запрошенных объектов (до трех) умноженное
+    на долю своих упоминаний, которые есть в запросе (предложение не должно говорить
+    о том, чего нет на фото). Кандидат ниже local_generator_min_score - промах, дальше
+    запрос идет в YandexGPT. Вместе с предложением отдаются сохраненные переводы.
+
+    Индекс догружается новыми строками в фоне, когда растет data_version, и строится
+    заново после ретеншна, поэтому поиск не ходит в базу.
+    """
+
+    def __init__(self, database_service: DatabaseService):
+        self.database_service = database_service
+        self.capacity = settings.local_generator_corpus_size
+        self._entries: Dict[int, CorpusEntry] = {}
+        self._order: Deque[int] = deque()
+        self._index: Dict[str, Set[int]] = {}
+        # Язык -> словарь переводов объектов, собранный по всему корпусу
+        self._words: Dict[str, Dict[str, str]] = {}
+        self._last_id = 0
+        self._generation = -1
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.refresh()
+        logger.info(f"Корпус локального генератора: {len(self._entries)} предложений, объектов {len(self._index)}")
+
+    async def refresh(self):
+        """Догружает новые предложения; после ретеншна/пересборки перестраивает индекс целиком"""
+        generation = data_version.generation
+        latest = data_version.last_sentence_id
+        if generation != self._generation:
+            self._clear()
+            self._generation = generation
+        rows = await self.database_service.get_corpus_sentences(self._last_id, self.capacity)
+        for row in rows:
+            self.add(row['id'], row['sentence'], row['target_word'], row['objects'], row['translations'])
+        # Шаблонные и локальные строки в корпус не попадают, но и перечитывать их не нужно
+        self._last_id = max(self._last_id, latest)
+
+    def _clear(self):
+        self._entries.clear()
+        self._order.clear()
+        self._index.clear()
+        self._words.clear()
+        self._last_id = 0
+
+    def add(
+        self, sentence_id: int, sentence: str, target_word: str, objects: List[str],
+        translations: Optional[Dict[str, Dict[str, Any]]] = None
+    ):
+        self._last_id = max(self._last_id, sentence_id)
+        mentioned = tuple(obj for obj in dict.fromkeys(objects) if mentions(sentence, obj))
+        if not mentioned or sentence_id in self._entries:
+            return
+
+        glossaries = {}
+        for language, translation in (translations or {}).items():
+            glossary = {sentence: translation['sentence'], target_word: translation['target_word']}
+            # Переводы объектов хранятся в том же порядке, что и объекты
+            if len(translation['objects']) == len(objects):
+                words = dict(zip(objects, translation['objects']))
+                glossary.update(words)
+                self._words.setdefault(language, {}).update(words)
+            glossaries[language] = glossary
+
+        self._entries[sentence_id] = CorpusEntry(sentence, target_word, mentioned, glossaries)
+        self._order.append(sentence_id)
+        for obj in mentioned:
+            self._index.setdefault(obj, set()).add(sentence_id)
+
+        while len(self._order) > self.capacity:
+            self._evict(self._order.popleft())
+
+    def _evict(self, sentence_id: int):
+        entry = self._entries.pop(sentence_id)
+        for obj in entry.mentioned:
+            ids = self._index.get(obj)
+            if ids is not None:
+                ids.discard(sentence_id)
+                if not ids:
+                    del self._index[obj]
+
+    def _schedule_refresh(self):
+        stale = data_version.generation != self._generation or data_version.last_sentence_id > self._last_id
+        if stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._refresh_in_background())
+
+    async def _refresh_in_background(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error(f"Ошибка обновления корпуса локального генератора: {e}")
+
+    @timed("local_generate_sentence")
+    def generate(self, objects: List[str], previous_sentences: List[str] = None) -> Optional[Dict[str, Any]]:
+        """Лучшее подходящее предложение из корпуса или None, если нет достаточно хорошего"""
+        config = performance.get()
+        if not config.local_generator:
+            return None
+
+        self._schedule_refresh()
+        requested = list(dict.fromkeys(objects))
+        matches = Counter()
+        for obj in requested:
+            matches.update(self._index.get(obj, ()))
+
+        needed = min(len(requested), MAX_OBJECTS_PER_SENTENCE)
+        recent = set(previous_sentences or ())
+        candidates = []
+        for sentence_id, matched in matches.items():
+            entry = self._entries[sentence_id]
+            if entry.sentence in recent:
+                continue
+            score = min(matched, needed) / needed * matched / len(entry.mentioned)
+            if score >= config.local_generator_min_score:
+                candidates.append((score, sentence_id))
+
+        if not candidates:
+            local_generator_lookups.inc('miss')
+            return None
+
+        candidates.sort(reverse=True)
+        score, sentence_id = random.choice(candidates[:TOP_CANDIDATES])
+        local_generator_lookups.inc('hit')
+        return self._adapt(self._entries[sentence_id], requested, score)
+
+    def _adapt(self, entry: CorpusEntry, requested: List[str], score: float) -> Dict[str, Any]:
+        """Целевое слово - из запрошенных объектов; переводы - сохраненные и из словаря корпуса"""
+        target_word = entry.target_word
+        if target_word not in requested:
+            target_word = random.choice([obj for obj in entry.mentioned if obj in requested])
+
+        translations = {}
+        for language, glossary in entry.translations.items():
+            words = self._words.get(language, {})
+            adapted = {entry.sentence: glossary[entry.sentence]}
+            if target_word in glossary:
+                adapted[target_word] = glossary[target_word]
+            for obj in requested:
+                if obj in words:
+                    adapted[obj] = words[obj]
+            translations[language] = adapted
+
+        return {
+            "sentence": entry.sentence,
+            "target_word": target_word,
+            "source": "local",
+            "score": round(score, 3),
+            "translations": translations
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': performance.get().local_generator,
+            'sentences': len(self._entries),
+            'objects': len(self._index),
+            'languages': {language: len(words) for language, words in self._words.items()}
+        }
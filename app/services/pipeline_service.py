@@ -0,0 +1,172 @@
+import logging
+from typing import Any, Dict, List
+
+from fastapi import HTTPException
+
+from app.models.detection import encode_detections
+from app.services.database_service import DatabaseService
+from app.services.translator_service import TranslatorService
+from app.services.yandex_gpt_service import YandexGPTService
+from app.services.yolo_service import YOLOService
+from app.utils.deadline import DeadlineExceeded, degraded_stages
+from app.utils.image_processor import ImageProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineService:
+    """Тяжелые сценарии целиком: общие для синхронных ручек и очереди задач.
+
+    Возвращают словари, готовые к сериализации; ошибки - HTTPException
+    (4xx - ошибка входных данных, 5xx - сбой обработки).
+    """
+
+    def __init__(
+        self,
+        yolo_service: YOLOService,
+        yandex_gpt_service: YandexGPTService,
+        translator_service: TranslatorService,
+        database_service: DatabaseService,
+        image_processor: ImageProcessor
+    ):
+        self.yolo_service = yolo_service
+        self.yandex_gpt_service = yandex_gpt_service
+        self.translator_service = translator_service
+        self.database_service = database_service
+        self.image_processor = image_processor
+
+    async def process_image(
+        self, image_data: bytes, detections_format: str = 'objects',
+        source_lang: str = None, target_lang: str = None
+    ) -> Dict[str, Any]:
+        """Объекты на изображении -> предложение -> перевод -> запись в базу"""
+        # Направление фиксируется на весь запрос, смена языка по умолчанию его не затронет
+        source_lang, target_lang = self.translator_service.resolve_direction(source_lang, target_lang)
+        try:
+            image = await self.image_processor.process_uploaded_image(image_data)
+
+            # Получаем детекции с координатами
+            detections = await self.yolo_service.classify_objects(image)
+            if not detections:
+                raise HTTPException(status_code=400, detail="Объекты на изображении не обнаружены")
+
+            # Список уникальных русских названий объектов по убыванию уверенности
+            objects_ru = []
+            for d in detections:
+                name = d.class_ru
+                if name and name not in objects_ru:
+                    objects_ru.append(name)
+
+            # Контекст промпта выбирается из последних сохраненных предложений по сходству
+            sentence_data = await self.yandex_gpt_service.generate_sentence(objects=objects_ru)
+
+            sentence_ru, target_word_ru = sentence_data["sentence"], sentence_data["target_word"]
+            translated = await self.translate_with_glossary(
+                objects_ru + [sentence_ru, target_word_ru],
+                sentence_data.get("translations", {}).get(target_lang, {}),
+                source_lang, target_lang
+            )
+            objects_tt = [translated[name] for name in objects_ru]
+            sentence_tt, target_word_tt = translated[sentence_ru], translated[target_word_ru]
+
+            # Перевод ответа модели сохраняется для локального генератора
+            translation = None
+            if sentence_data.get("source") == "yandex_gpt" and sentence_tt != sentence_ru:
+                translation = {
+                    "language": target_lang,
+                    "sentence": sentence_tt,
+                    "target_word": target_word_tt,
+                    "objects": objects_tt
+                }
+
+            await self.database_service.save_sentence(
+                sentence=sentence_ru,
+                target_word=target_word_ru,
+                objects=objects_ru,
+                source=sentence_data.get("source"),
+                translation=translation
+            )
+
+            return {
+                "objects_ru": objects_ru,
+                "objects_tt": objects_tt,
+                "sentence_ru": sentence_ru,
+                "sentence_tt": sentence_tt,
+                "target_word_ru": target_word_ru,
+                "target_word_tt": target_word_tt,
+                "detections": encode_detections(detections, detections_format),
+                "image_width": image.width,
+                "image_height": image.height,
+                "bbox_format": "xyxy",
+                "normalized": True,
+                "source_language": source_lang,
+                "target_language": target_lang,
+                "degraded_stages": degraded_stages()
+            }
+
+        except HTTPException as e:
+            # Пробрасываем уже сформированные 4xx/5xx ошибки как есть
+            raise e
+        except DeadlineExceeded as e:
+            # Бюджет запроса исчерпан до этапа, у которого нет дешевого пути (распознавание)
+            raise HTTPException(status_code=504, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Ошибка обработки: {str(e)}")
+
+    async def translate_with_glossary(
+        self, texts: List[str], glossary: Dict[str, str], source_lang: str, target_lang: str
+    ) -> Dict[str, str]:
+        """Переводы текстов: известные из корпуса берутся как есть, остальные - одним запросом"""
+        translated = dict(glossary)
+        missing = [text for text in dict.fromkeys(texts) if text not in translated]
+        if missing:
+            translated.update(zip(
+                missing, await self.translator_service.translate_multiple(missing, target_lang, source_lang)
+            ))
+        return translated
+
+    async def album_memory(
+        self, objects: List[str], album_theme: str = "", source_lang: str = None, target_lang: str = None
+    ) -> Dict[str, Any]:
+        """Абзац-воспоминание для альбома на русском и языке перевода, с записью в базу"""
+        source_lang, target_lang = self.translator_service.resolve_direction(source_lang, target_lang)
+        try:
+            if not objects:
+                raise HTTPException(status_code=400, detail="Список объектов не может быть пустым")
+
+            if len(objects) < 2:
+                raise HTTPException(status_code=400, detail="Для альбома нужно минимум 2 объекта")
+
+            memory_data = await self.yandex_gpt_service.generate_album_memory(
+                objects=objects,
+                album_theme=album_theme,
+            )
+
+            memory_ru = memory_data["memory"]
+            used_objects = memory_data["used_objects"]
+
+            # Переводим абзац (по умолчанию на татарский)
+            memory_tt = await self.translator_service.translate_text(
+                memory_ru, target_lang=target_lang, source_lang=source_lang
+            )
+
+            # Сохраняем русскую версию в БД как специальное воспоминание альбома
+            await self.database_service.save_sentence(
+                sentence=memory_ru,
+                target_word="album_memory",  # Специальный маркер для абзацев альбома
+                objects=used_objects
+            )
+
+            return {
+                "memory_ru": memory_ru,
+                "memory_tt": memory_tt,
+                "used_objects": used_objects,
+                "source_language": source_lang,
+                "target_language": target_lang,
+                "degraded_stages": degraded_stages()
+            }
+
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Ошибка генерации воспоминания альбома: {str(e)}")
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+import aiosqlite
+
+from app.config import settings
+from app.services.database_service import DatabaseService, pack_archive_payload
+from app.utils.shared_state import data_version
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA auto_vacuum: 2 = INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class RetentionService:
+    """Фоновый перенос старых предложений в sentences_archive и возврат места.
+
+    Политики (0 - отключено):
+    - retention_max_age_days: архивировать строки старше N дней;
+    - retention_max_rows: оставлять в sentences не больше N последних строк.
+
+    Работает через собственное соединение небольшими пачками с паузами между ними,
+    поэтому запись на пути запроса ждет не дольше одной короткой транзакции.
+    """
+
+    def __init__(self, database_service: DatabaseService):
+        self.database_service = database_service
+        self.max_age_days = settings.retention_max_age_days
+        self.max_rows = settings.retention_max_rows
+        self.interval = settings.retention_interval
+        self.batch_size = settings.retention_batch_size
+        self.batch_pause = settings.retention_batch_pause
+        self.vacuum_pages = settings.retention_vacuum_pages
+        self._connection: Optional[aiosqlite.Connection] = None
+        self.last_run: Dict[str, Any] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age_days > 0 or self.max_rows > 0
+
+    async def run(self):
+        """Периодический цикл обслуживания (запускается из lifespan)"""
+        if self.database_service.db_path == ':memory:':
+            logger.info("Ретеншн отключен для in-memory базы")
+            return
+
+        self._connection = await aiosqlite.connect(self.database_service.db_path)
+        try:
+            while True:
+                try:
+                    self.last_run = await self.run_once()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Ошибка обслуживания таблицы sentences: {e}")
+                await asyncio.sleep(self.interval)
+        finally:
+            await self._connection.close()
+            self._connection = None
+
+    async def run_once(self) -> Dict[str, Any]:
+        archived = 0
+        if self.enabled:
+            boundary = await self._row_limit_boundary()
+            while True:
+                rows = await self._select_batch(boundary)
+                if not rows:
+                    break
+                await self._archive(rows)
+                archived += len(rows)
+                await asyncio.sleep(self.batch_pause)
+
+        freed_pages = await self._incremental_vacuum()
+
+        if archived or freed_pages:
+            logger.info(f"Ретеншн: перенесено в архив {archived} строк, освобождено страниц {freed_pages}")
+        return {'archived': archived, 'freed_pages': freed_pages}
+
+    async def _row_limit_boundary(self) -> Optional[Tuple[str, int]]:
+        """Самая новая строка, которая уже не помещается в retention_max_rows"""
+        if self.max_rows <= 0:
+            return None
+
+        cursor = await self._connection.execute("""
+        SELECT created_at, id FROM sentences
+        ORDER BY created_at DESC, id DESC
+        LIMIT 1 OFFSET ?
+        """, (self.max_rows,))
+        row = await cursor.fetchone()
+        return (row[0], row[1]) if row else None
+
+    async def _select_batch(self, boundary: Optional[Tuple[str, int]]) -> List[tuple]:
+        conditions, params = [], []
+        if self.max_age_days > 0:
+            conditions.append("created_at < datetime('now', ?)")
+            params.append(f'-{self.max_age_days} days')
+        if boundary is not None:
+            conditions.append("(created_at, id) <= (?, ?)")
+            params.extend(boundary)
+
+        if not conditions:
+            return []
+
+        cursor = await self._connection.execute(f"""
+        SELECT id, sentence, target_word, objects, created_at FROM sentences
+        WHERE {' OR '.join(conditions)}
+        ORDER BY created_at, id
+        LIMIT ?
+        """, (*params, self.batch_size))
+        return await cursor.fetchall()
+
+    async def _archive(self, rows: List[tuple]):
+        archive_rows = [
+            (row[0], row[2], row[4], pack_archive_payload(row[1], row[3]))
+            for row in rows
+        ]
+        ids = [(row[0],) for row in rows]
+
+        try:
+            await self._connection.executemany("""
+            INSERT OR REPLACE INTO sentences_archive (id, target_word, created_at, payload)
+            VALUES (?, ?, ?, ?)
+            """, archive_rows)
+            await self._connection.executemany("DELETE FROM sentence_objects WHERE sentence_id = ?", ids)
+            await self._connection.executemany("DELETE FROM sentence_translations WHERE sentence_id = ?", ids)
+            await self._connection.executemany("DELETE FROM sentences WHERE id = ?", ids)
+            await self._connection.commit()
+        except Exception:
+            await self._connection.rollback()
+            raise
+        data_version.bump()
+
+    async def _incremental_vacuum(self) -> int:
+        cursor = await self._connection.execute("PRAGMA auto_vacuum")
+        if (await cursor.fetchone())[0] != AUTO_VACUUM_INCREMENTAL:
+            # Для существующей базы режим включается только полным VACUUM (вручную, вне нагрузки)
+            return 0
+
+        freed = 0
+        while True:
+            cursor = await self._connection.execute("PRAGMA freelist_count")
+            free_pages = (await cursor.fetchone())[0]
+            if free_pages == 0:
+                break
+
+            cursor = await self._connection.execute(f"PRAGMA incremental_vacuum({self.vacuum_pages})")
+            # Прагма освобождает по странице на шаг - дочитываем курсор до конца
+            await cursor.fetchall()
+            await self._connection.commit()
+            freed += min(free_pages, self.vacuum_pages)
+            await asyncio.sleep(self.batch_pause)
+
+        return freed
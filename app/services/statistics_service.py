@@ -0,0 +1,143 @@
+import logging
+from typing import Dict, Any
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# Формат часового бакета совпадает с форматом CURRENT_TIMESTAMP (UTC)
+BUCKET_FORMAT = '%Y-%m-%d %H:00:00'
+# Сколько часовых бакетов храним (с запасом относительно окна в 24 часа)
+BUCKET_RETENTION_HOURS = 48
+# Источник для сверки: живые и архивированные предложения (архивация не уменьшает статистику)
+SOURCE_SENTENCES = """(
+    SELECT target_word, created_at FROM sentences
+    UNION ALL
+    SELECT target_word, created_at FROM sentences_archive
+)"""
+
+
+class StatisticsService:
+    """Счетчики статистики, которые обновляются при вставке предложения.
+
+    Вместо COUNT-сканов таблицы sentences поддерживаются:
+    - stats_counters: общее количество предложений и уникальных слов;
+    - stats_words: количество предложений на каждое target_word;
+    - stats_hourly: количество предложений по часовым бакетам для окна в 24 часа.
+
+    Все методы работают с переданным соединением и не делают commit сами:
+    обновления выполняются в той же транзакции, что и вставка предложения.
+    Строки, перенесенные в sentences_archive, продолжают учитываться.
+    """
+
+    async def create_tables(self, connection: aiosqlite.Connection):
+        await connection.execute("""
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        """)
+        await connection.execute("""
+        CREATE TABLE IF NOT EXISTS stats_words (
+            target_word TEXT PRIMARY KEY,
+            count INTEGER NOT NULL
+        )
+        """)
+        await connection.execute("""
+        CREATE TABLE IF NOT EXISTS stats_hourly (
+            bucket TEXT PRIMARY KEY,
+            count INTEGER NOT NULL
+        )
+        """)
+
+    async def is_initialized(self, connection: aiosqlite.Connection) -> bool:
+        cursor = await connection.execute("SELECT COUNT(*) FROM stats_counters")
+        return (await cursor.fetchone())[0] > 0
+
+    async def record_sentence(self, connection: aiosqlite.Connection, target_word: str):
+        """Учитывает одно новое предложение (вызывается внутри транзакции вставки)"""
+        cursor = await connection.execute(
+            "INSERT OR IGNORE INTO stats_words (target_word, count) VALUES (?, 0)",
+            (target_word,)
+        )
+        if cursor.rowcount == 1:
+            await connection.execute(
+                "UPDATE stats_counters SET value = value + 1 WHERE name = 'unique_words'"
+            )
+
+        await connection.execute(
+            "UPDATE stats_words SET count = count + 1 WHERE target_word = ?",
+            (target_word,)
+        )
+        await connection.execute(
+            "UPDATE stats_counters SET value = value + 1 WHERE name = 'total_sentences'"
+        )
+        await connection.execute(f"""
+        INSERT INTO stats_hourly (bucket, count)
+        VALUES (strftime('{BUCKET_FORMAT}', 'now'), 1)
+        ON CONFLICT(bucket) DO UPDATE SET count = count + 1
+        """)
+
+    async def get_statistics(self, connection: aiosqlite.Connection) -> Dict[str, Any]:
+        """Читает статистику за O(1): две строки счетчиков и не более 24 бакетов"""
+        cursor = await connection.execute("SELECT name, value FROM stats_counters")
+        counters = dict(await cursor.fetchall())
+
+        cursor = await connection.execute(f"""
+        SELECT COALESCE(SUM(count), 0) FROM stats_hourly
+        WHERE bucket >= strftime('{BUCKET_FORMAT}', 'now', '-23 hours')
+        """)
+        sentences_today = (await cursor.fetchone())[0]
+
+        return {
+            'total_sentences': counters.get('total_sentences', 0),
+            'unique_words': counters.get('unique_words', 0),
+            'sentences_today': sentences_today
+        }
+
+    async def compute_from_source(self, connection: aiosqlite.Connection) -> Dict[str, Any]:
+        """Считает те же показатели полным сканом sentences и архива (для сверки)"""
+        cursor = await connection.execute(
+            f"SELECT COUNT(*), COUNT(DISTINCT target_word) FROM {SOURCE_SENTENCES}"
+        )
+        total_sentences, unique_words = await cursor.fetchone()
+
+        cursor = await connection.execute(f"""
+        SELECT COUNT(*) FROM {SOURCE_SENTENCES}
+        WHERE created_at >= strftime('{BUCKET_FORMAT}', 'now', '-23 hours')
+        """)
+        sentences_today = (await cursor.fetchone())[0]
+
+        return {
+            'total_sentences': total_sentences,
+            'unique_words': unique_words,
+            'sentences_today': sentences_today
+        }
+
+    async def rebuild(self, connection: aiosqlite.Connection):
+        """Полностью пересобирает счетчики из таблиц sentences и sentences_archive"""
+        await connection.execute("DELETE FROM stats_words")
+        await connection.execute(f"""
+        INSERT INTO stats_words (target_word, count)
+        SELECT target_word, COUNT(*) FROM {SOURCE_SENTENCES} GROUP BY target_word
+        """)
+
+        await connection.execute("DELETE FROM stats_hourly")
+        await connection.execute(f"""
+        INSERT INTO stats_hourly (bucket, count)
+        SELECT strftime('{BUCKET_FORMAT}', created_at), COUNT(*) FROM {SOURCE_SENTENCES}
+        WHERE created_at >= strftime('{BUCKET_FORMAT}', 'now', '-{BUCKET_RETENTION_HOURS} hours')
+        GROUP BY 1
+        """)
+
+        await connection.execute(f"""
+        INSERT OR REPLACE INTO stats_counters (name, value) VALUES
+            ('total_sentences', (SELECT COUNT(*) FROM {SOURCE_SENTENCES})),
+            ('unique_words', (SELECT COUNT(*) FROM stats_words))
+        """)
+
+    async def prune_buckets(self, connection: aiosqlite.Connection):
+        await connection.execute(f"""
+        DELETE FROM stats_hourly
+        WHERE bucket < strftime('{BUCKET_FORMAT}', 'now', '-{BUCKET_RETENTION_HOURS} hours')
+        """)
@@ -1,41 +1,76 @@
 import asyncio
+import time
 import aiohttp
 import logging
-from typing import Optional, List
+from typing import Dict, Optional, List, Tuple
 from app.config import settings
+from app.utils.metrics import timed, upstream_responses, fallback_activations
+from app.utils.shared_state import translation_direction
+from app.utils.deadline import DeadlineExceeded, has_budget, within_budget
+from app.utils.performance import translate_limiter
+from app.utils.admission import admission, TRANSLATE
 
 logger = logging.getLogger(__name__)
 
+# Меньше этого остатка бюджета запроса перевод пропускается, сек
+TRANSLATE_MIN_BUDGET = 0.3
+
 class TranslatorService:
     def __init__(self):
-        self.source_language = 'ru'  # Исходный язык по умолчанию - русский
-        self.target_language = 'tt'  # Целевой язык по умолчанию - татарский
+        # Направление перевода (по умолчанию ru -> tt) хранится в разделяемой памяти,
+        # чтобы /translator/direction действовал на все воркеры сразу
+        self.direction = translation_direction
         self.api_key = settings.translater_api_key
         self.folder_id = settings.translater_folder_id
-        self.api_url = "https://translate.api.cloud.yandex.net/translate/v2/translate"
+        self.api_url = settings.translate_api_url
     
+    def resolve_direction(self, source_lang: str = None, target_lang: str = None) -> Tuple[str, str]:
+        """Направление для одного запроса: переданные языки, недостающие - текущие по умолчанию"""
+        default_source, default_target = self.direction.get()
+        return source_lang or default_source, target_lang or default_target
+
+    @property
+    def source_language(self) -> str:
+        return self.direction.get()[0]
+
+    @property
+    def target_language(self) -> str:
+        return self.direction.get()[1]
+
     async def translate_text(self, text: str, target_lang: str = None, source_lang: str = None) -> str:
         if not text:
             return ""
         
         if not self.api_key or not self.folder_id:
             logger.warning("Yandex Translate API не настроен")
+            fallback_activations.inc('translate_untranslated')
             return text
         
-        target_lang = target_lang or self.target_language
-        source_lang = source_lang or self.source_language
+        if not has_budget("translate", TRANSLATE_MIN_BUDGET):
+            fallback_activations.inc('translate_untranslated')
+            return text
+
+        source_lang, target_lang = self.resolve_direction(source_lang, target_lang)
         
         try:
-            result = await self._translate_yandex([text], target_lang, source_lang)
+            result = await within_budget("translate", self._translate_yandex([text], target_lang, source_lang))
             translated_text = result[0] if result else text
             
-            logger.info(f"Переведен текст: '{text}' ({source_lang} -> {target_lang}) -> '{translated_text}'")
+            logger.debug("Переведен текст: '%s' (%s -> %s) -> '%s'", text, source_lang, target_lang, translated_text)
             return translated_text
-            
+
+        except DeadlineExceeded as e:
+            # Бюджет запроса кончился - это деградация, а не ошибка Translate API
+            logger.warning(f"Перевод пропущен: {e}")
+            fallback_activations.inc('translate_untranslated')
+            return text
         except Exception as e:
             logger.error(f"Ошибка перевода текста '{text}': {e}")
+            upstream_responses.inc('yandex_translate', 'error')
+            fallback_activations.inc('translate_untranslated')
             return text
     
+    @timed("translate_yandex")
     async def _translate_yandex(self, texts: List[str], target_lang: str, source_lang: str) -> List[str]:
         """Переводит список текстов через Yandex Translate API"""
         body = {
@@ -51,37 +86,78 @@ class TranslatorService:
             "Authorization": f"Api-Key {self.api_key}",
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.api_url, json=body, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return [translation["text"] for translation in data["translations"]]
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Ошибка Yandex Translate API: {response.status} - {error_text}")
-                    return texts
+        started = time.perf_counter()
+        try:
+            async with translate_limiter, aiohttp.ClientSession() as session:
+                async with session.post(self.api_url, json=body, headers=headers) as response:
+                    upstream_responses.inc('yandex_translate', str(response.status))
+                    if response.status == 200:
+                        data = await response.json()
+                        return [translation["text"] for translation in data["translations"]]
+                    else:
+                        error_text = await response.text()
+                        logger.error(f"Ошибка Yandex Translate API: {response.status} - {error_text}")
+                        fallback_activations.inc('translate_untranslated')
+                        return texts
+        finally:
+            # Для контроля допуска - вместе с ожиданием в лимитере
+            admission.observe(TRANSLATE, time.perf_counter() - started)
     
-    async def translate_multiple(self, texts: list, target_lang: str = None) -> list:
+    async def translate_multiple(self, texts: list, target_lang: str = None, source_lang: str = None) -> list:
         if not texts:
             return []
         
         if not self.api_key or not self.folder_id:
             logger.warning("Yandex Translate API не настроен")
+            fallback_activations.inc('translate_untranslated')
             return texts
         
-        target_lang = target_lang or self.target_language
-        source_lang = self.source_language
+        if not has_budget("translate", TRANSLATE_MIN_BUDGET):
+            fallback_activations.inc('translate_untranslated')
+            return texts
+
+        source_lang, target_lang = self.resolve_direction(source_lang, target_lang)
         
         try:
             # Yandex API может обрабатывать множественные тексты в одном запросе
-            results = await self._translate_yandex(texts, target_lang, source_lang)
+            results = await within_budget("translate", self._translate_yandex(texts, target_lang, source_lang))
             logger.info(f"Переведено {len(texts)} текстов ({source_lang} -> {target_lang})")
             return results
-            
+
+        except DeadlineExceeded as e:
+            logger.warning(f"Перевод пропущен: {e}")
+            fallback_activations.inc('translate_untranslated')
+            return texts
         except Exception as e:
             logger.error(f"Ошибка множественного перевода: {e}")
+            upstream_responses.inc('yandex_translate', 'error')
+            fallback_activations.inc('translate_untranslated')
             return texts
     
+    async def translate_batch(
+        self, texts: List[str], target_languages: List[str], source_lang: str = None
+    ) -> Dict[str, List[str]]:
+        """Тексты на несколько языков: язык -> переводы в порядке texts.
+
+        Повторяющиеся тексты переводятся один раз, на каждый язык - один запрос к API,
+        запросы по языкам выполняются параллельно (в пределах translate_concurrency).
+        """
+        source_lang, _ = self.resolve_direction(source_lang)
+        unique = [text for text in dict.fromkeys(texts) if text]
+        targets = list(dict.fromkeys(target_languages))
+
+        async def translate_to(target_lang: str) -> List[str]:
+            if target_lang == source_lang or not unique:
+                return unique
+            return await self.translate_multiple(unique, target_lang, source_lang)
+
+        results = await asyncio.gather(*(translate_to(target_lang) for target_lang in targets))
+        matrix = {}
+        for target_lang, translated in zip(targets, results):
+            by_text = dict(zip(unique, translated))
+            matrix[target_lang] = [by_text.get(text, text) for text in texts]
+        return matrix
+    
     async def detect_language(self, text: str) -> Optional[str]:
         if not text:
             return None
@@ -96,22 +172,22 @@ class TranslatorService:
             return None
     
     def set_target_language(self, language_code: str):
-        self.target_language = language_code
+        self.direction.set(target_language=language_code)
         logger.info(f"Целевой язык изменен на: {language_code}")
     
     def set_source_language(self, language_code: str):
-        self.source_language = language_code
+        self.direction.set(source_language=language_code)
         logger.info(f"Исходный язык изменен на: {language_code}")
     
     def set_translation_direction(self, source_lang: str, target_lang: str):
-        self.source_language = source_lang
-        self.target_language = target_lang
+        self.direction.set(source_language=source_lang, target_language=target_lang)
         logger.info(f"Направление перевода: {source_lang} -> {target_lang}")
     
     def get_translation_direction(self) -> dict:
+        source_language, target_language = self.direction.get()
         return {
-            'source_language': self.source_language,
-            'target_language': self.target_language
+            'source_language': source_language,
+            'target_language': target_language
         }
     
     def get_supported_languages(self) -> dict:
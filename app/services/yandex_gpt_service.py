@@ -1,20 +1,41 @@
 import random
 import logging
-from typing import List, Dict, Any
+import time
+import aiohttp
+from typing import List, Dict, Any, Optional, Tuple
 from yandex_cloud_ml_sdk import AsyncYCloudML
 from app.config import settings
+from app.utils.metrics import timed, upstream_responses, fallback_activations, gpt_prompt_tokens, gpt_latency
+from app.services.context_selector import estimate_tokens
+from app.utils.deadline import has_budget, within_budget
+from app.utils.performance import performance, gpt_limiter
+from app.utils.admission import admission, GPT
 
 logger = logging.getLogger(__name__)
 
+# Минимальный остаток бюджета запроса, при котором еще имеет смысл звать модель, сек
+SENTENCE_MIN_BUDGET = 1.0
+MEMORY_MIN_BUDGET = 2.5
+# Сколько последних предложений передавалось в промпт до выбора по сходству (context_mode=recent)
+RECENT_CONTEXT_SIZE = 5
+
 
 class YandexGPTService:
-    def __init__(self):
+    def __init__(self, local_generator=None, context_selector=None):
         self.key_id = settings.yandex_key_id
         self.secret_key = settings.yandex_secret_key
         self.folder_id = settings.yandex_folder_id
+        # REST-эндпоинт completion API (например, локальная заглушка для нагрузочных тестов)
+        self.api_url = settings.yandex_gpt_url
         self.sdk = None
+        # Первый уровень: готовые предложения из корпуса (LocalSentenceGenerator)
+        self.local_generator = local_generator
+        # Выбор предыдущих предложений для промпта (ContextSelector из DatabaseService)
+        self.context_selector = context_selector
 
-        if self.key_id and self.secret_key and self.folder_id:
+        if self.api_url and self.secret_key and self.folder_id:
+            logger.info(f"YandexGPT через REST API: {self.api_url}")
+        elif self.key_id and self.secret_key and self.folder_id:
             try:
                 self.sdk = AsyncYCloudML(
                     folder_id=self.folder_id,
@@ -28,48 +49,159 @@ class YandexGPTService:
         else:
             logger.warning("Yandex GPT сервисный аккаунт не настроен")
 
-    async def generate_sentence(self, objects: List[str], previous_sentences: List[str] = None) -> Dict[str, str]:
-        if not self.sdk:
-            return self._generate_fallback_sentence(objects)
+    @property
+    def configured(self) -> bool:
+        return self.sdk is not None or bool(self.api_url and self.secret_key and self.folder_id)
 
+    async def _complete(
+        self, prompt: str, temperature: float, max_tokens: int, kind: str, context: str = 'none'
+    ) -> str:
+        """Запрос к модели через SDK или REST API; возвращает текст первой альтернативы.
+
+        Длительность и токены промпта (usage ответа, без него - оценка) пишутся в метрики
+        с меткой режима контекста, чтобы сравнивать промпты до и после выбора по сходству.
+        """
+        queued = time.perf_counter()
         try:
-            prompt = self._create_prompt(objects, previous_sentences)
+            # Лимит одновременных запросов к YandexGPT (gpt_concurrency в /admin/performance)
+            async with gpt_limiter:
+                started = time.perf_counter()
+                if self.sdk is None:
+                    text, input_tokens = await self._complete_http(prompt, temperature, max_tokens)
+                else:
+                    text, input_tokens = await self._complete_sdk(prompt, temperature, max_tokens)
+        finally:
+            # Для контроля допуска - вместе с ожиданием в лимитере
+            admission.observe(GPT, time.perf_counter() - queued)
+        gpt_latency.observe(time.perf_counter() - started, kind, context)
+        gpt_prompt_tokens.observe(input_tokens or estimate_tokens(prompt), kind, context)
+        return text
 
+    async def _complete_sdk(self, prompt: str, temperature: float, max_tokens: int) -> Tuple[str, Optional[int]]:
+        try:
             model = self.sdk.models.completions(settings.yandex_model)
+            result = await model.configure(temperature=temperature, max_tokens=max_tokens).run(prompt)
+        except Exception:
+            upstream_responses.inc('yandex_gpt', 'error')
+            raise
 
-            result = await model.configure(temperature=0.8, max_tokens=150).run(prompt)
-
-            if result and hasattr(result, 'alternatives') and result.alternatives:
-                generated_text = result.alternatives[0].text.strip()
-                if generated_text:
-                    # Используем весь ответ LLM как предложение
-                    target_word = random.choice(objects)
-                    logger.info(f"Предложение создано через YandexGPT: {generated_text}")
-                    return {
-                        "sentence": generated_text,
-                        "target_word": target_word
-                    }
-                else:
-                    logger.warning("Пустой текст от YandexGPT")
-            else:
-                logger.warning("Пустой ответ от YandexGPT")
+        upstream_responses.inc('yandex_gpt', 'ok')
+        input_tokens = getattr(getattr(result, 'usage', None), 'input_text_tokens', None)
+        if result and hasattr(result, 'alternatives') and result.alternatives:
+            return result.alternatives[0].text.strip(), input_tokens
+        return "", input_tokens
+
+    async def _complete_http(self, prompt: str, temperature: float, max_tokens: int) -> Tuple[str, Optional[int]]:
+        body = {
+            "modelUri": f"gpt://{self.folder_id}/{settings.yandex_model}",
+            "completionOptions": {
+                "stream": False,
+                "temperature": temperature,
+                "maxTokens": str(max_tokens)
+            },
+            "messages": [{"role": "user", "text": prompt}]
+        }
+        headers = {
+            "Authorization": f"Api-Key {self.secret_key}",
+            "x-folder-id": self.folder_id
+        }
+
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(self.api_url, json=body, headers=headers) as response:
+                    upstream_responses.inc('yandex_gpt', str(response.status))
+                    if response.status != 200:
+                        error_text = await response.text()
+                        raise RuntimeError(f"Ошибка YandexGPT API {response.status}: {error_text}")
+                    data = await response.json()
+        except aiohttp.ClientError:
+            upstream_responses.inc('yandex_gpt', 'error')
+            raise
+
+        result = data.get('result') or {}
+        # Числа в usage API отдает строками
+        input_tokens = int((result.get('usage') or {}).get('inputTextTokens') or 0) or None
+        alternatives = result.get('alternatives') or []
+        if not alternatives:
+            return "", input_tokens
+        return alternatives[0].get('message', {}).get('text', '').strip(), input_tokens
+
+    @timed("generate_sentence")
+    async def generate_sentence(self, objects: List[str], previous_sentences: List[str] = None) -> Dict[str, Any]:
+        """Предложение по объектам; source - откуда оно: local, yandex_gpt или fallback.
+
+        previous_sentences - история клиента в хронологическом порядке; None - контекст
+        выбирается из последних сохраненных предложений.
+        У локального предложения есть translations: язык -> {русский текст: перевод}.
+        """
+        if self.local_generator is not None:
+            recent = previous_sentences
+            if recent is None and self.context_selector is not None:
+                recent = self.context_selector.recent(10)
+            local = self.local_generator.generate(objects, recent)
+            if local is not None:
+                logger.info(f"Предложение из локального корпуса (оценка {local['score']}): {local['sentence']}")
+                return local
+
+        if not self.configured:
+            return self._generate_fallback_sentence(objects)
+
+        if not has_budget("generate_sentence", SENTENCE_MIN_BUDGET):
+            logger.warning("Не хватает бюджета запроса на YandexGPT, используем fallback предложение")
+            return self._generate_fallback_sentence(objects)
+
+        try:
+            config = performance.get()
+            prompt = self._create_prompt(objects, self._select_context(objects, previous_sentences))
+
+            # Часть бюджета оставляем на перевод и запись результата
+            generated_text = await within_budget(
+                "generate_sentence",
+                self._complete(
+                    prompt, temperature=config.sentence_temperature, max_tokens=config.sentence_max_tokens,
+                    kind='sentence', context=config.context_mode
+                ),
+                reserve=settings.deadline_reserve
+            )
 
+            if generated_text:
+                # Используем весь ответ LLM как предложение
+                target_word = random.choice(objects)
+                logger.info(f"Предложение создано через YandexGPT: {generated_text}")
+                return {
+                    "sentence": generated_text,
+                    "target_word": target_word,
+                    "source": "yandex_gpt"
+                }
+
+            logger.warning("Пустой ответ от YandexGPT")
             logger.info("Используем fallback предложение")
             return self._generate_fallback_sentence(objects)
 
         except Exception as e:
-            logger.error(f"Ошибка генерации предложения через SDK: {e}")
+            logger.error(f"Ошибка генерации предложения через YandexGPT: {e}")
             logger.info("Используем fallback предложение")
             return self._generate_fallback_sentence(objects)
 
-    def _create_prompt(self, objects: List[str], previous_sentences: List[str] = None) -> str:
+    def _select_context(self, objects: List[str], previous_sentences: Optional[List[str]]) -> List[str]:
+        """Предыдущие предложения для промпта в хронологическом порядке"""
+        config = performance.get()
+        if config.context_mode == 'recent' or self.context_selector is None:
+            if previous_sentences is None and self.context_selector is not None:
+                previous_sentences = self.context_selector.recent(RECENT_CONTEXT_SIZE)[::-1]
+            return (previous_sentences or [])[-RECENT_CONTEXT_SIZE:]
+
+        return self.context_selector.select(
+            objects, config.context_max_tokens, config.context_max_sentences, candidates=previous_sentences
+        )
+
+    def _create_prompt(self, objects: List[str], context_sentences: List[str] = None) -> str:
         objects_str = ', '.join(objects)
 
         context = ""
-        if previous_sentences:
-            recent_sentences = previous_sentences[-5:]
+        if context_sentences:
             context = f"Предыдущие предложений для связанной истории:\n"
-            for sentence in recent_sentences:
+            for sentence in context_sentences:
                 context += f"- {sentence}\n"
             context += "\n"
 
@@ -103,11 +235,12 @@ class YandexGPTService:
 
 Создай аналогичное предложение с объектами: {objects_str}. {context}
 """
-        logger.info(prompt)
+        logger.debug("Промпт YandexGPT: %s", prompt)
         return prompt
 
-    def _generate_fallback_sentence(self, objects: List[str]) -> Dict[str, str]:
+    def _generate_fallback_sentence(self, objects: List[str]) -> Dict[str, Any]:
         target_word = random.choice(objects)
+        fallback_activations.inc('gpt_sentence')
         logger.info("Предложение замокано (fallback)")
 
         # Если несколько объектов, пытаемся создать предложение с 2-3 объектами
@@ -132,7 +265,7 @@ class YandexGPTService:
                     ])
 
                 sentence = random.choice(templates)
-                return {"sentence": sentence, "target_word": target_word}
+                return {"sentence": sentence, "target_word": target_word, "source": "fallback"}
 
         # Fallback для одного объекта
         single_templates = [
@@ -144,44 +277,50 @@ class YandexGPTService:
         ]
 
         sentence = random.choice(single_templates)
-        return {"sentence": sentence, "target_word": target_word}
+        return {"sentence": sentence, "target_word": target_word, "source": "fallback"}
     
+    @timed("generate_album_memory")
     async def generate_album_memory(self, objects: List[str], album_theme: str = "") -> Dict[str, Any]:
         """Генерирует абзац-воспоминание для альбома фотографий"""
-        if not self.sdk:
+        if not self.configured:
             logger.info("Используем fallback для абзаца-воспоминания")
             return self._generate_fallback_memory(objects, album_theme)
+
+        if not has_budget("generate_album_memory", MEMORY_MIN_BUDGET):
+            logger.warning("Не хватает бюджета запроса на YandexGPT, используем fallback для абзаца")
+            return self._generate_fallback_memory(objects, album_theme)
         
         try:
             prompt = self._create_memory_prompt(objects, album_theme)
-            model = self.sdk.models.completions(settings.yandex_model)
-            result = await model.configure(temperature=0.9, max_tokens=500).run(prompt)
-            
-            if result and hasattr(result, 'alternatives') and result.alternatives:
-                generated_text = result.alternatives[0].text.strip()
-                if generated_text:
-                    # Определяем какие объекты были использованы
-                    used_objects = []
-                    text_lower = generated_text.lower()
-                    for obj in objects:
-                        if obj.lower() in text_lower:
-                            used_objects.append(obj)
-                    
-                    logger.info(f"Абзац-воспоминание создан через YandexGPT: {generated_text[:50]}...")
-                    return {
-                        "memory": generated_text,
-                        "used_objects": used_objects or objects[:3]  # Fallback если не найдены
-                    }
-                else:
-                    logger.warning("Пустой текст от YandexGPT для абзаца")
-            else:
-                logger.warning("Пустой ответ от YandexGPT для абзаца")
+            config = performance.get()
+            generated_text = await within_budget(
+                "generate_album_memory",
+                self._complete(
+                    prompt, temperature=config.memory_temperature, max_tokens=config.memory_max_tokens, kind='memory'
+                ),
+                reserve=settings.deadline_reserve
+            )
             
+            if generated_text:
+                # Определяем какие объекты были использованы
+                used_objects = []
+                text_lower = generated_text.lower()
+                for obj in objects:
+                    if obj.lower() in text_lower:
+                        used_objects.append(obj)
+                
+                logger.info(f"Абзац-воспоминание создан через YandexGPT: {generated_text[:50]}...")
+                return {
+                    "memory": generated_text,
+                    "used_objects": used_objects or objects[:3]  # Fallback если не найдены
+                }
+
+            logger.warning("Пустой ответ от YandexGPT для абзаца")
             logger.info("Используем fallback для абзаца-воспоминания")
             return self._generate_fallback_memory(objects, album_theme)
                         
         except Exception as e:
-            logger.error(f"Ошибка генерации абзаца-воспоминания через SDK: {e}")
+            logger.error(f"Ошибка генерации абзаца-воспоминания через YandexGPT: {e}")
             logger.info("Используем fallback для абзаца-воспоминания")
             return self._generate_fallback_memory(objects, album_theme)
     
@@ -217,6 +356,7 @@ class YandexGPTService:
     
     def _generate_fallback_memory(self, objects: List[str], album_theme: str) -> Dict[str, Any]:
         """Генерирует fallback абзац-воспоминание"""
+        fallback_activations.inc('gpt_memory')
         logger.info("Абзац-воспоминание замокан (fallback)")
         
         # Выбираем 3-4 объекта для истории
@@ -1,34 +1,192 @@
 import asyncio
-from typing import List, Dict, Any
+import contextvars
+import functools
+import random
+import time
+from collections import deque
+from typing import Any, List, Dict, Optional, Tuple
 from ultralytics import YOLO
 import numpy as np
-from PIL import Image
 import logging
 from app.config import settings
+from app.models.detection import Detection
+from app.utils.image_processor import DecodedImage
+from app.utils.metrics import timed, model_inference, model_detections
+from app.utils.deadline import DeadlineExceeded, has_budget
+from app.utils.performance import performance, resize_executor
+from app.utils.admission import admission, INFERENCE
+from app.utils.shared_state import model_config
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+LOCAL_MODEL_PATH = "yolo11n.pt"
+SERVER_MODEL_PATH = "yolov8m-oiv7_openvino_model/"
+
+# Размер входа инференса по умолчанию; рабочие значения - в performance (yolo_imgsz)
+FULL_IMGSZ = 640
+# Остаток бюджета запроса (сек), ниже которого вход уменьшается до yolo_reduced_imgsz
+YOLO_FULL_BUDGET = 3.0
+YOLO_MIN_BUDGET = 0.3
+# Сколько последних замеров хранить на модель для перцентилей в /admin/model
+MODEL_STATS_WINDOW = 1000
+
+
+def configure_inference_threads(threads: int):
+    """Ограничивает потоки torch/OpenCV в текущем процессе (вызывать после fork)"""
+    if threads <= 0:
+        return
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+    logger.info(f"Потоков инференса на процесс: {threads}")
+
+
+class ModelStats:
+    """Задержка инференса и число детекций одной версии модели (для A/B сравнения)"""
 
-class YOLOService:
     def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.detections = 0
+        self.latencies = deque(maxlen=MODEL_STATS_WINDOW)
+
+    def record(self, latency: float, detections: int):
+        self.requests += 1
+        self.detections += detections
+        self.latencies.append(latency)
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2)
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_detections': round(self.detections / self.requests, 2) if self.requests else None,
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+                'p50': percentile(0.5),
+                'p95': percentile(0.95)
+            }
+        }
+
+
+class YOLOService:
+    """Детекция объектов с заменой модели без перезапуска.
+
+    Основная модель и необязательный кандидат с долей трафика задаются через
+    shared_state.model_config (админ-API). Новые версии загружаются и прогреваются в
+    фоне, затем подменяются одним присваиванием: запросы в обработке дорабатывают
+    на той модели, с которой начали.
+    """
+
+    def __init__(self, model_path: Optional[str] = None):
         self.model = None
+        self.model_path = ''
+        self.candidate = None
+        self.candidate_path = ''
+        self.candidate_percent = 0
         self.class_translations: Dict[str, str] = {}
-        self._load_model()
+        self.model_stats: Dict[str, ModelStats] = {}
+        self.load_error: Optional[str] = None
+        self._config_version = model_config.version
+        self._reload_task: Optional[asyncio.Task] = None
+        # None - default executor; размер задается inference_workers в /admin/performance
+        self._executor = None
+        self._load_model(model_path)
         self._load_class_translations()
 
-    def _load_model(self):
+    def _load_model(self, model_path: Optional[str] = None):
         try:
-            if settings.local:
-                self.model = YOLO("yolo11n.pt")
-                logger.info("YOLO модель загружена (локально): yolo11n.pt")
+            if model_path:
+                self.model = YOLO(model_path)
+                logger.info(f"YOLO модель загружена: {model_path}")
+            elif settings.local:
+                model_path = LOCAL_MODEL_PATH
+                self.model = YOLO(LOCAL_MODEL_PATH)
+                logger.info(f"YOLO модель загружена (локально): {LOCAL_MODEL_PATH}")
             else:
-                self.model = YOLO("yolov8m-oiv7_openvino_model/")
-                logger.info("YOLO модель загружена (сервер): yolo11n_openvino_model/")
+                model_path = SERVER_MODEL_PATH
+                self.model = YOLO(SERVER_MODEL_PATH)
+                logger.info(f"YOLO модель загружена (сервер): {SERVER_MODEL_PATH}")
+            self.model_path = self.boot_model_path = model_path
         except Exception as e:
             logger.error(f"Ошибка загрузки YOLO модели: {e}")
             raise
 
+    @staticmethod
+    def _load_and_warm_up(model_path: str):
+        """Загрузка и прогрев новой версии (в executor'е, вне event loop)"""
+        model = YOLO(model_path)
+        # Первый вызов инициализирует бэкенд (компиляция, выделение буферов) - не за счет запроса
+        imgsz = performance.get().yolo_imgsz
+        model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), verbose=False, imgsz=imgsz)
+        logger.info(f"YOLO модель загружена и прогрета: {model_path}")
+        return model
+
+    def sync_models(self):
+        """Запускает фоновую подгрузку, если конфигурация моделей изменилась (дешевая проверка)"""
+        if model_config.version == self._config_version:
+            return
+        if self._reload_task is None or self._reload_task.done():
+            self._reload_task = asyncio.create_task(self._apply_model_config())
+
+    async def _apply_model_config(self):
+        loop = asyncio.get_running_loop()
+        while model_config.version != self._config_version:
+            primary_path, candidate_path, candidate_percent, version = model_config.get()
+            primary_path = primary_path or self.boot_model_path
+            # Уже загруженные версии переиспользуются: promote и откат мгновенные
+            loaded = {self.model_path: self.model}
+            if self.candidate is not None:
+                loaded[self.candidate_path] = self.candidate
+            try:
+                models = {}
+                for path in filter(None, (primary_path, candidate_path)):
+                    models[path] = loaded.get(path) or await loop.run_in_executor(None, self._load_and_warm_up, path)
+            except Exception as e:
+                logger.error(f"Ошибка загрузки YOLO модели, остаемся на текущей: {e}")
+                self.load_error = f"{e}"
+                self._config_version = version
+                continue
+
+            # Подмена без await между присваиваниями - атомарна для event loop
+            self.model, self.model_path = models[primary_path], primary_path
+            if candidate_path:
+                self.candidate, self.candidate_path, self.candidate_percent = models[candidate_path], candidate_path, candidate_percent
+            else:
+                self.candidate, self.candidate_path, self.candidate_percent = None, '', 0
+            self.load_error = None
+            self._config_version = version
+            logger.info(f"YOLO модели: основная {primary_path}, кандидат {candidate_path or '-'} ({candidate_percent}%)")
+
+    def _pick_model(self) -> Tuple[str, Any]:
+        if self.candidate is not None and random.random() * 100 < self.candidate_percent:
+            return self.candidate_path, self.candidate
+        return self.model_path, self.model
+
+    def get_model_info(self) -> Dict[str, Any]:
+        return {
+            'primary': self.model_path,
+            'candidate': self.candidate_path or None,
+            'candidate_percent': self.candidate_percent,
+            'loading': self._reload_task is not None and not self._reload_task.done(),
+            'load_error': self.load_error,
+            'stats': {path: stats.to_dict() for path, stats in self.model_stats.items()}
+        }
+
     def _load_class_translations(self) -> None:
         """Загружает словарь классов из файла classes.txt в формате 'original:translation'."""
         try:
@@ -68,65 +226,92 @@ class YOLOService:
             logger.error(f"Ошибка загрузки classes.txt: {e}")
             self.class_translations = {}
 
-    async def classify_objects(self, image: Image.Image) -> List[Dict[str, Any]]:
-        """Возвращает до 10 детекций: [{class_ru, confidence, bbox[x1,y1,x2,y2]}]."""
+    @timed("classify_objects")
+    async def classify_objects(self, image: DecodedImage) -> List[Detection]:
+        """Возвращает до yolo_max_det детекций (class_ru, confidence, bbox [x1,y1,x2,y2] в долях)."""
         if self.model is None:
             raise RuntimeError("YOLO модель не загружена")
 
+        self.sync_models()
+        model_path, model = self._pick_model()
+        stats = self.model_stats.setdefault(model_path, ModelStats())
+
+        if not has_budget("yolo", YOLO_MIN_BUDGET):
+            raise DeadlineExceeded("Бюджет запроса исчерпан до распознавания объектов")
+
+        config = performance.get()
+        # При малом остатке бюджета - инференс на уменьшенном входе: быстрее, но менее точно
+        imgsz = config.yolo_imgsz if has_budget("yolo", YOLO_FULL_BUDGET) else config.yolo_reduced_imgsz
+        self._executor = resize_executor(self._executor, config.inference_workers, 'inference')
+
         try:
             loop = asyncio.get_event_loop()
+            # Копируем контекст, чтобы метрики в потоке знали текущий эндпоинт
+            ctx = contextvars.copy_context()
+            started = time.perf_counter()
             results = await loop.run_in_executor(
-                None,
-                self._run_inference,
-                image
+                self._executor,
+                functools.partial(
+                    ctx.run, self._run_inference, image.pixels,
+                    conf=config.yolo_conf, max_det=config.yolo_max_det, imgsz=imgsz, model=model
+                )
             )
+            latency = time.perf_counter() - started
+
+            # bbox нормализуются по декодированному буферу: он может быть меньше исходного
+            img_h, img_w = image.pixels.shape[:2]
+            detections = self._postprocess(results, img_w, img_h, model.names)
 
-            img_w, img_h = image.size
-
-            def _clamp01(v: float) -> float:
-                return 0.0 if v < 0 else 1.0 if v > 1 else v
-
-            detections: List[Dict[str, Any]] = []
-            for result in results:
-                boxes = getattr(result, 'boxes', None)
-                if boxes is None or len(boxes) == 0:
-                    continue
-                cls_list = boxes.cls.tolist()
-                conf_list = boxes.conf.tolist()
-                xyxy_list = boxes.xyxy.tolist()
-                for cls_id, conf, xyxy in zip(cls_list, conf_list, xyxy_list):
-                    class_en = self.model.names[int(cls_id)]
-                    x1, y1, x2, y2 = float(xyxy[0]), float(xyxy[1]), float(xyxy[2]), float(xyxy[3])
-                    # Нормализация
-                    nx1 = _clamp01(x1 / img_w)
-                    ny1 = _clamp01(y1 / img_h)
-                    nx2 = _clamp01(x2 / img_w)
-                    ny2 = _clamp01(y2 / img_h)
-                    detections.append({
-                        'class_en': class_en,
-                        'confidence': float(conf),
-                        'bbox': [nx1, ny1, nx2, ny2]
-                    })
-
-            # Переводим на русский и убираем class_en
-            if detections:
-                translated = self.translate_class_names([d['class_en'] for d in detections])
-                for d, name_ru in zip(detections, translated):
-                    d['class_ru'] = name_ru
-                    d.pop('class_en', None)
-
-            logger.info(f"Детекции (до 10, norm): {detections}")
+            stats.record(latency, len(detections))
+            admission.observe(INFERENCE, latency)
+            model_inference.observe(latency, model_path)
+            model_detections.observe(len(detections), model_path)
+
+            # Список детекций - только в режиме log_debug; %-аргументы не форматируются, если запись отброшена
+            logger.debug("Детекции (до %s, norm): %s", config.yolo_max_det, detections)
             return detections
 
         except Exception as e:
+            stats.errors += 1
             logger.error(f"Ошибка классификации объектов: {e}")
             raise
 
-    def _run_inference(self, image: Image.Image, conf: float = 0.25, max_det: int = 10):
-        image_array = np.array(image)
-        # Ограничиваем до 10 детекций и фильтруем по conf встроенными параметрами
-        return self.model(image_array, verbose=False, conf=conf, max_det=max_det)
+    @timed("yolo_postprocess")
+    def _postprocess(self, results, img_w: int, img_h: int, names: Optional[Dict[int, str]] = None) -> List[Detection]:
+        """Нормализует bbox в [0, 1] и переводит названия классов на русский"""
+        # Классы берутся у модели, сделавшей предсказание: у версий они могут отличаться
+        names = names or self.model.names
+
+        def _clamp01(v: float) -> float:
+            return 0.0 if v < 0 else 1.0 if v > 1 else v
+
+        detections: List[Detection] = []
+        for result in results:
+            boxes = getattr(result, 'boxes', None)
+            if boxes is None or len(boxes) == 0:
+                continue
+            cls_list = boxes.cls.tolist()
+            conf_list = boxes.conf.tolist()
+            xyxy_list = boxes.xyxy.tolist()
+            names_ru = self.translate_class_names([names[int(cls_id)] for cls_id in cls_list])
+            for name_ru, conf, xyxy in zip(names_ru, conf_list, xyxy_list):
+                x1, y1, x2, y2 = float(xyxy[0]), float(xyxy[1]), float(xyxy[2]), float(xyxy[3])
+                # Нормализация
+                detections.append(Detection(
+                    class_ru=name_ru,
+                    confidence=float(conf),
+                    bbox=[_clamp01(x1 / img_w), _clamp01(y1 / img_h), _clamp01(x2 / img_w), _clamp01(y2 / img_h)]
+                ))
+
+        return detections
+
+    @timed("yolo_inference")
+    def _run_inference(self, pixels: np.ndarray, conf: float = 0.25, max_det: int = 10, imgsz: int = FULL_IMGSZ, model=None):
+        # pixels - BGR буфер из ImageProcessor, передается в модель без копирования.
+        # Ограничиваем число детекций и фильтруем по conf встроенными параметрами
+        return (model or self.model)(pixels, verbose=False, conf=conf, max_det=max_det, imgsz=imgsz)
 
+    @timed("translate_class_names")
     def translate_class_names(self, objects: List[str]) -> List[str]:
         """Переводит список английских названий классов в русские по classes.txt.
         Если перевод не найден, возвращает оригинал.
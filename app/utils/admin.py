@@ -0,0 +1,14 @@
+import secrets
+
+from fastapi import Header, HTTPException
+
+from app.config import settings
+
+
+async def require_admin(x_admin_token: str = Header(None)):
+    """Зависимость для /admin ручек: токен из заголовка X-Admin-Token"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Админ-API отключено: не задан ADMIN_TOKEN")
+
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=401, detail="Неверный X-Admin-Token")
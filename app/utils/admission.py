@@ -0,0 +1,169 @@
+"""Контроль допуска: ранний отказ 503 с Retry-After вместо очереди, растущей до таймаутов.
+
+Дорогие эндпоинты объявляют классы ресурсов, которые занимают (инференс, YandexGPT,
+Translate, TTS). На класс считаются принятые и еще не завершенные запросы воркера и
+сглаженная задержка самого ресурса - ее сообщают сервисы через observe(): у YOLO, GPT и
+Translate вместе с ожиданием в пуле или лимитере, у TTS - только сам запрос. Запрос
+отклоняется до чтения тела, если у одного из его классов достигнут *_max_in_flight или
+задержка выше *_latency_target при незавершенных запросах:
+они дорабатывают и обновляют оценку, а когда завершатся все - следующий запрос принимается.
+Повтор с Idempotency-Key отдается из сохраненного ответа и ресурсы не занимает, поэтому для
+таких путей допуск проверяет сам эндпоинт после поиска ключа (admitted()), только при промахе.
+Остальные эндпоинты (чтение, статистика, health, задачи) принимаются всегда.
+"""
+import math
+from contextlib import asynccontextmanager
+from typing import Any, Collection, Dict, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+from app.utils.fast_json import FastJSONResponse
+from app.utils.metrics import admission_in_flight, admission_rejections
+from app.utils.performance import performance
+
+INFERENCE = 'inference'
+GPT = 'gpt'
+TRANSLATE = 'translate'
+TTS = 'tts'
+RESOURCES = (INFERENCE, GPT, TRANSLATE, TTS)
+# Вес нового замера в сглаженной задержке ресурса
+LATENCY_ALPHA = 0.2
+MAX_RETRY_AFTER = 30
+
+
+class ResourceClass:
+    def __init__(self, name: str):
+        self.name = name
+        self.in_flight = 0
+        self.latency = 0.0
+        self.rejected = 0
+
+    def limits(self) -> Tuple[int, float]:
+        config = performance.get()
+        return getattr(config, f'{self.name}_max_in_flight'), getattr(config, f'{self.name}_latency_target')
+
+    def overload_reason(self) -> Optional[str]:
+        max_in_flight, latency_target = self.limits()
+        if 0 < max_in_flight <= self.in_flight:
+            return 'in_flight'
+        if 0 < latency_target < self.latency and self.in_flight > 0:
+            return 'latency'
+        return None
+
+    def observe(self, seconds: float):
+        if self.latency == 0:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_ALPHA * (seconds - self.latency)
+
+
+class AdmissionController:
+    def __init__(self):
+        self.resources = {name: ResourceClass(name) for name in RESOURCES}
+
+    def try_admit(self, names: Sequence[str]) -> Optional[ResourceClass]:
+        """None - запрос принят и занимает классы names; иначе - перегруженный класс"""
+        for name in names:
+            resource = self.resources[name]
+            reason = resource.overload_reason()
+            if reason is not None:
+                resource.rejected += 1
+                admission_rejections.inc(name, reason)
+                return resource
+
+        for name in names:
+            self.resources[name].in_flight += 1
+            admission_in_flight.inc(name)
+        return None
+
+    def release(self, names: Sequence[str]):
+        for name in names:
+            self.resources[name].in_flight -= 1
+            admission_in_flight.dec(name)
+
+    def observe(self, name: str, seconds: float):
+        """Длительность обращения к ресурсу"""
+        self.resources[name].observe(seconds)
+
+    @asynccontextmanager
+    async def admitted(self, names: Sequence[str]):
+        """Допуск внутри эндпоинта: при перегрузке - HTTPException 503 с Retry-After"""
+        overloaded = self.try_admit(names)
+        if overloaded is not None:
+            raise HTTPException(
+                status_code=503, detail=overloaded_detail(overloaded),
+                headers={"Retry-After": str(self.retry_after(overloaded))}
+            )
+        try:
+            yield
+        finally:
+            self.release(names)
+
+    @staticmethod
+    def retry_after(resource: ResourceClass) -> int:
+        # Через время порядка текущей задержки ресурса часть принятых запросов завершится
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(resource.latency)))
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        stats = {}
+        for name, resource in self.resources.items():
+            max_in_flight, latency_target = resource.limits()
+            stats[name] = {
+                'in_flight': resource.in_flight,
+                'max_in_flight': max_in_flight,
+                'latency': round(resource.latency, 4),
+                'latency_target': latency_target,
+                'rejected': resource.rejected
+            }
+        return stats
+
+
+def overloaded_detail(resource: ResourceClass) -> str:
+    return f"Сервис перегружен ({resource.name}), повторите запрос позже"
+
+
+admission = AdmissionController()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware: допуск POST запросов к путям из routes (путь -> классы ресурсов).
+
+    Запросы с Idempotency-Key к путям из idempotent пропускаются: допуск после поиска ключа
+    проверяет эндпоинт через admission.admitted().
+    """
+
+    def __init__(self, app, routes: Dict[str, Sequence[str]], idempotent: Collection[str] = ()):
+        unknown = {name for names in routes.values() for name in names} - set(RESOURCES)
+        if unknown:
+            raise ValueError(f"Неизвестные классы ресурсов: {', '.join(sorted(unknown))}")
+        self.app = app
+        self.routes = routes
+        self.idempotent = frozenset(idempotent)
+
+    async def __call__(self, scope, receive, send):
+        names = None
+        if scope['type'] == 'http' and scope['method'] == 'POST':
+            names = self.routes.get(scope['path'])
+            if names and scope['path'] in self.idempotent and _has_idempotency_key(scope):
+                names = None
+        if not names:
+            await self.app(scope, receive, send)
+            return
+
+        overloaded = admission.try_admit(names)
+        if overloaded is not None:
+            response = FastJSONResponse(
+                {"detail": overloaded_detail(overloaded)},
+                status_code=503, headers={"Retry-After": str(admission.retry_after(overloaded))}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(names)
+
+
+def _has_idempotency_key(scope) -> bool:
+    return any(name == b'idempotency-key' and value for name, value in scope['headers'])
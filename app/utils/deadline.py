@@ -0,0 +1,137 @@
+"""Бюджет времени запроса (deadline) и деградация этапов при его нехватке.
+
+Deadline задается на запрос заголовком X-Request-Timeout-Ms (или для всех запросов
+REQUEST_TIMEOUT, по умолчанию выключен) и
+доступен этапам через contextvar. Этап перед дорогим вызовом проверяет остаток:
+если его не хватает, выбирает дешевый путь (шаблонное предложение, непереведенный
+текст, уменьшенный инференс) и отмечает себя в degraded_stages ответа.
+"""
+import asyncio
+import contextvars
+import math
+import time
+from typing import Awaitable, List, Optional, TypeVar
+
+from app.config import settings
+
+DEADLINE_HEADER = 'X-Request-Timeout-Ms'
+DEGRADED_HEADER = 'X-Degraded-Stages'
+_DEADLINE_HEADER_KEY = DEADLINE_HEADER.lower().encode('latin-1')
+_DEGRADED_HEADER_KEY = DEGRADED_HEADER.lower().encode('latin-1')
+
+T = TypeVar('T')
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    pass
+
+
+class Deadline:
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+        # Изменяемый список: этапы в дочерних контекстах (executor, задачи) дописывают сюда
+        self.degraded: List[str] = []
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def mark_degraded(self, stage: str):
+        if stage not in self.degraded:
+            self.degraded.append(stage)
+
+
+current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar('current_deadline', default=None)
+
+
+def remaining() -> Optional[float]:
+    """Остаток бюджета в секундах; None - у запроса нет deadline"""
+    deadline = current_deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def has_budget(stage: str, min_seconds: float) -> bool:
+    """Хватает ли бюджета на полноценный этап; если нет - этап отмечается деградировавшим"""
+    deadline = current_deadline.get()
+    if deadline is None or deadline.remaining() >= min_seconds:
+        return True
+    deadline.mark_degraded(stage)
+    return False
+
+
+def mark_degraded(stage: str):
+    deadline = current_deadline.get()
+    if deadline is not None:
+        deadline.mark_degraded(stage)
+
+
+def degraded_stages() -> List[str]:
+    deadline = current_deadline.get()
+    return list(deadline.degraded) if deadline is not None else []
+
+
+async def within_budget(stage: str, awaitable: Awaitable[T], reserve: float = 0.0) -> T:
+    """Ждет awaitable не дольше остатка бюджета минус reserve (время на следующие этапы).
+
+    При нехватке времени отменяет вызов, отмечает этап и бросает DeadlineExceeded.
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(0.0, left - reserve))
+    except asyncio.TimeoutError as e:
+        mark_degraded(stage)
+        raise DeadlineExceeded(f"Бюджет запроса исчерпан на этапе {stage}") from e
+
+
+def timeout_from_header(value: Optional[str]) -> Optional[float]:
+    """Бюджет запроса в секундах: из заголовка (ограничен request_timeout_max) или по умолчанию"""
+    timeout = settings.request_timeout
+    if value:
+        try:
+            # Дробные миллисекунды ("1500.5") допустимы; nan/inf считаем некорректным значением
+            milliseconds = float(value)
+            if math.isfinite(milliseconds):
+                timeout = min(milliseconds / 1000, settings.request_timeout_max)
+        except ValueError:
+            pass
+    return timeout if timeout > 0 else None
+
+
+class DeadlineMiddleware:
+    """ASGI middleware: deadline на каждый HTTP запрос и заголовок с деградировавшими этапами"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        header_value = None
+        for name, value in scope['headers']:
+            if name == _DEADLINE_HEADER_KEY:
+                header_value = value.decode('latin-1')
+                break
+
+        timeout = timeout_from_header(header_value)
+        if timeout is None:
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(timeout)
+        token = current_deadline.set(deadline)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start' and deadline.degraded:
+                headers = list(message.get('headers', []))
+                headers.append((_DEGRADED_HEADER_KEY, ','.join(deadline.degraded).encode('latin-1')))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_deadline.reset(token)
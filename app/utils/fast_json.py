@@ -0,0 +1,31 @@
+"""Быстрая сериализация горячих ответов через orjson.
+
+Эндпоинты возвращают FastJSONResponse напрямую: FastAPI в этом случае не валидирует
+результат по response_model (модель остается только для схемы OpenAPI), а orjson
+сериализует dict, dataclass (Detection) и datetime без промежуточных объектов.
+"""
+from typing import Any, Dict, List
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def _default(value: Any):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode='json')
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default)
+
+
+def sentence_records(sentences: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Приводит created_at из SQLite ('YYYY-MM-DD HH:MM:SS') к ISO 8601, как SentenceRecord"""
+    for sentence in sentences:
+        created_at = sentence['created_at']
+        if isinstance(created_at, str):
+            sentence['created_at'] = created_at.replace(' ', 'T', 1)
+    return sentences
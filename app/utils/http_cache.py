@@ -0,0 +1,222 @@
+"""HTTP-кэширование и сжатие ответов для часто опрашиваемых GET-ручек.
+
+- ETag (слабый) и Last-Modified строятся из версии данных/конфигурации, а не из тела,
+  поэтому условный запрос с совпавшей версией получает 304 без обращения к базе;
+- тела ответов кэшируются в памяти процесса по (путь + query, версия): новая версия
+  после save_sentence или смены направления перевода делает старые записи недостижимыми;
+- сжатые варианты тела (br/gzip) хранятся в той же записи и считаются один раз.
+"""
+import gzip
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.config import settings
+from app.utils.performance import performance
+from app.utils.shared_state import BOOT_ID
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, без него отдаем только gzip
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """br, если клиент и сервер его поддерживают, иначе gzip; None - без сжатия"""
+    accepted = set()
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0'):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+class CacheEntry:
+    __slots__ = ('body', 'created', 'encoded')
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.created = time.monotonic()
+        self.encoded: Dict[str, bytes] = {}
+
+    def body_for(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.body
+        encoded = self.encoded.get(encoding)
+        if encoded is None:
+            encoded = self.encoded[encoding] = _compress(self.body, encoding)
+        return encoded
+
+
+class ResponseCache:
+    """LRU кэш тел ответов с TTL; запись действительна только для своей версии.
+
+    Размер и TTL читаются из performance при каждом обращении и меняются на лету.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, version: str) -> Optional[CacheEntry]:
+        ttl = performance.get().response_cache_ttl
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[0] != version or time.monotonic() - item[1].created > ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: str, version: str, entry: CacheEntry):
+        max_entries = performance.get().response_cache_size
+        with self._lock:
+            if max_entries > 0:
+                self._entries[key] = (version, entry)
+                self._entries.move_to_end(key)
+            # После уменьшения размера лишние записи вытесняются здесь же
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._entries)
+        return {'entries': size, 'hits': self.hits, 'misses': self.misses}
+
+
+response_cache = ResponseCache()
+
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[float]) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        # If-None-Match приоритетнее If-Modified-Since (RFC 9110, 13.1.3)
+        candidates = {tag.strip() for tag in if_none_match.split(',')}
+        return '*' in candidates or etag in candidates or etag[2:] in candidates
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def cached_json(
+    request: Request,
+    version: str,
+    produce: Callable[[], Awaitable[Any]],
+    last_modified: Optional[float] = None,
+    cache_control: str = 'no-cache'
+) -> Response:
+    """JSON-ответ с ETag/Last-Modified, 304, кэшем тела и сжатием.
+
+    version - строка, которая меняется при любом изменении данных ответа;
+    produce вызывается только при промахе кэша.
+    """
+    etag = f'W/"{version}.{BOOT_ID}"'
+    headers = {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+    if last_modified is not None:
+        headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    key = request.url.path + '?' + request.url.query
+    entry = response_cache.get(key, version)
+    if entry is None:
+        entry = CacheEntry(orjson.dumps(await produce()))
+        response_cache.put(key, version, entry)
+
+    encoding = None
+    if len(entry.body) >= settings.compression_min_size:
+        encoding = choose_encoding(request.headers.get('accept-encoding', ''))
+    if encoding:
+        headers['Content-Encoding'] = encoding
+
+    return Response(entry.body_for(encoding), media_type='application/json', headers=headers)
+
+
+class CompressionMiddleware:
+    """ASGI middleware: br/gzip для остальных ответов больше порога.
+
+    Сжимает только ответы целиком (без потоковой передачи) и без Content-Encoding,
+    поэтому NDJSON-экспорт и уже сжатые cached_json ответы проходят как есть.
+    """
+
+    def __init__(self, app, minimum_size: int):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ''
+        for name, value in scope['headers']:
+            if name == b'accept-encoding':
+                accept_encoding = value.decode('latin-1')
+                break
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message['type'] == 'http.response.start':
+                start_message = message
+                return
+            if message['type'] != 'http.response.body' or start_message is None:
+                await send(message)
+                return
+
+            pending, start_message = start_message, None
+            headers = [(name, value) for name, value in pending['headers']]
+            body = message.get('body', b'')
+            already_encoded = any(name == b'content-encoding' for name, _ in headers)
+            if message.get('more_body', False) or already_encoded or len(body) < self.minimum_size:
+                await send(pending)
+                await send(message)
+                return
+
+            body = _compress(body, encoding)
+            headers = [(name, value) for name, value in headers if name != b'content-length']
+            headers.append((b'content-encoding', encoding.encode('ascii')))
+            headers.append((b'content-length', str(len(body)).encode('ascii')))
+            headers.append((b'vary', b'Accept-Encoding'))
+            await send({**pending, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+from starlette.routing import Match
+
+from app.utils.metrics import current_endpoint, http_request_duration, http_in_flight
+from app.utils.tracing import current_trace
+
+# Шаблон маршрута по (метод, путь): перебор маршрутов только при первом запросе к пути.
+# Ограничен, чтобы пути с параметрами (/jobs/{job_id}) и сканеры не раздували память
+ENDPOINT_CACHE_SIZE = 1024
+_endpoint_cache: 'OrderedDict[Tuple[str, str], str]' = OrderedDict()
+
+
+def _resolve_endpoint(scope) -> str:
+    key = (scope['method'], scope['path'])
+    endpoint = _endpoint_cache.get(key)
+    if endpoint is not None:
+        _endpoint_cache.move_to_end(key)
+        return endpoint
+
+    endpoint = _match_endpoint(scope)
+    _endpoint_cache[key] = endpoint
+    if len(_endpoint_cache) > ENDPOINT_CACHE_SIZE:
+        _endpoint_cache.popitem(last=False)
+    return endpoint
+
+
+def _match_endpoint(scope) -> str:
+    """Шаблон маршрута (например /jobs/{job_id}), чтобы не раздувать кардинальность меток"""
+    app = scope.get('app')
+    router = getattr(app, 'router', None)
+    if router is not None:
+        for route in router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, 'path', scope['path'])
+    return 'unmatched'
+
+
+class MetricsMiddleware:
+    """ASGI middleware: длительность и число выполняющихся запросов по эндпоинтам"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = _resolve_endpoint(scope)
+        token = current_endpoint.set(endpoint)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.endpoint = endpoint
+        status = {'code': 500}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        http_in_flight.inc(endpoint)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_duration.observe(
+                time.perf_counter() - started, scope['method'], endpoint, str(status['code'])
+            )
+            http_in_flight.dec(endpoint)
+            current_endpoint.reset(token)
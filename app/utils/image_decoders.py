@@ -0,0 +1,250 @@
+"""Бэкенды декодирования изображений: Pillow, OpenCV (cv2.imdecode) и libjpeg-turbo.
+
+Все бэкенды возвращают HxWx3 uint8 BGR без учета EXIF: ориентация читается из
+заголовка один раз и применяется общей функцией apply_exif_orientation, поэтому
+результат не зависит от выбранного бэкенда. Бэкенд для каждого формата задается
+IMAGE_DECODERS или выбирается самотестом при старте (самый быстрый из доступных).
+"""
+import io
+import logging
+import statistics
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+try:
+    import cv2
+except ImportError:  # OpenCV необязателен, без него остается Pillow
+    cv2 = None
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+except ImportError:  # PyTurboJPEG и libturbojpeg необязательны
+    TurboJPEG = None
+
+logger = logging.getLogger(__name__)
+
+EXIF_ORIENTATION = 0x0112
+FORMATS = ('JPEG', 'PNG', 'WEBP')
+# Порядок при выключенном самотесте
+DEFAULT_PRIORITY = ('turbojpeg', 'opencv', 'pillow')
+REDUCTION_FACTORS = (8, 4, 2)
+# Режимы, которые Image.reduce обрабатывает напрямую; палитру (GIF, PNG-8), 1-бит и
+# 16-битные изображения сначала переводим в RGB
+REDUCIBLE_MODES = ('RGB', 'RGBA', 'L', 'LA')
+
+BENCHMARK_SIZE = (640, 480)
+BENCHMARK_REPEATS = 3
+
+
+def apply_exif_orientation(pixels: np.ndarray, orientation: int) -> np.ndarray:
+    """Поворот/отражение по тегу EXIF Orientation (как ImageOps.exif_transpose)"""
+    if orientation not in range(2, 9):
+        return pixels
+    if cv2 is not None:
+        # Те же преобразования в OpenCV в несколько раз быстрее копии strided-вида numpy
+        if orientation == 2:
+            return cv2.flip(pixels, 1)
+        if orientation == 3:
+            return cv2.rotate(pixels, cv2.ROTATE_180)
+        if orientation == 4:
+            return cv2.flip(pixels, 0)
+        if orientation == 5:
+            return cv2.transpose(pixels)
+        if orientation == 6:
+            return cv2.rotate(pixels, cv2.ROTATE_90_CLOCKWISE)
+        if orientation == 7:
+            return cv2.flip(cv2.transpose(pixels), -1)
+        return cv2.rotate(pixels, cv2.ROTATE_90_COUNTERCLOCKWISE)
+
+    if orientation == 2:
+        pixels = pixels[:, ::-1]
+    elif orientation == 3:
+        pixels = pixels[::-1, ::-1]
+    elif orientation == 4:
+        pixels = pixels[::-1]
+    elif orientation == 5:
+        pixels = pixels.transpose(1, 0, 2)
+    elif orientation == 6:
+        pixels = np.rot90(pixels, -1)
+    elif orientation == 7:
+        pixels = pixels[::-1, ::-1].transpose(1, 0, 2)
+    else:
+        pixels = np.rot90(pixels, 1)
+    return np.ascontiguousarray(pixels)
+
+
+def reduction_factor(width: int, height: int, max_side: int) -> int:
+    """Во сколько раз можно уменьшить изображение при декодировании, не опускаясь ниже max_side"""
+    if max_side <= 0:
+        return 1
+    for factor in REDUCTION_FACTORS:
+        if max(width, height) // factor >= max_side:
+            return factor
+    return 1
+
+
+class PillowDecoder:
+    name = 'pillow'
+    formats = FORMATS
+
+    def decode(self, data: bytes, factor: int = 1) -> np.ndarray:
+        image = Image.open(io.BytesIO(data))
+        if factor > 1:
+            if image.format == 'JPEG':
+                # draft: libjpeg сразу декодирует в 1/factor размера
+                image.draft('RGB', (image.width // factor, image.height // factor))
+            else:
+                if image.mode not in REDUCIBLE_MODES:
+                    image = image.convert('RGB')
+                image = image.reduce(factor)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        # Pillow сразу выгружает пиксели в BGR. Массив поверх bytes был бы только для чтения,
+        # а OpenCV и libjpeg-turbo отдают изменяемый: bytearray дает такой же
+        buffer = bytearray(image.tobytes('raw', 'BGR'))
+        return np.frombuffer(buffer, dtype=np.uint8).reshape(image.height, image.width, 3)
+
+
+class OpenCVDecoder:
+    name = 'opencv'
+    formats = FORMATS
+
+    def __init__(self):
+        # Ориентацию применяем сами, чтобы она не зависела от бэкенда
+        self._flags = {
+            1: cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION,
+            2: cv2.IMREAD_REDUCED_COLOR_2 | cv2.IMREAD_IGNORE_ORIENTATION,
+            4: cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION,
+            8: cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION,
+        }
+
+    def decode(self, data: bytes, factor: int = 1) -> np.ndarray:
+        pixels = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), self._flags[factor])
+        if pixels is None:
+            raise ValueError("cv2.imdecode не смог декодировать изображение")
+        return pixels
+
+
+class TurboJPEGDecoder:
+    name = 'turbojpeg'
+    formats = ('JPEG',)
+
+    def __init__(self):
+        self._jpeg = TurboJPEG()
+
+    def decode(self, data: bytes, factor: int = 1) -> np.ndarray:
+        scaling_factor = (1, factor) if factor > 1 else None
+        return self._jpeg.decode(data, pixel_format=TJPF_BGR, scaling_factor=scaling_factor)
+
+
+def available_decoders() -> Dict[str, object]:
+    decoders = {'pillow': PillowDecoder()}
+    if cv2 is not None:
+        decoders['opencv'] = OpenCVDecoder()
+    if TurboJPEG is not None:
+        try:
+            decoders['turbojpeg'] = TurboJPEGDecoder()
+        except Exception as e:
+            # Пакет есть, но libturbojpeg не найдена
+            logger.warning(f"libjpeg-turbo недоступен: {e}")
+    return decoders
+
+
+def parse_decoder_config(value: str) -> Dict[str, str]:
+    """'jpeg=turbojpeg,png=opencv' -> {'JPEG': 'turbojpeg', 'PNG': 'opencv'}; auto - самотест"""
+    config = {}
+    for part in value.split(','):
+        fmt, _, name = part.partition('=')
+        fmt, name = fmt.strip().upper(), name.strip().lower()
+        if fmt and name and name != 'auto':
+            config[fmt] = name
+    return config
+
+
+def _sample_images() -> Dict[str, bytes]:
+    width, height = BENCHMARK_SIZE
+    rng = np.random.default_rng(0)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None, None]
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    pixels = np.clip((x + y) / 2 + rng.normal(0, 12, size=(height, width, 3)), 0, 255).astype(np.uint8)
+    image = Image.fromarray(pixels)
+    samples = {}
+    for fmt in FORMATS:
+        buffer = io.BytesIO()
+        image.save(buffer, fmt, **({'quality': 90} if fmt != 'PNG' else {}))
+        samples[fmt] = buffer.getvalue()
+    return samples
+
+
+class ImageDecoders:
+    """Выбор бэкенда по формату с откатом на Pillow при ошибке бэкенда"""
+
+    def __init__(self, config: str = ''):
+        self.decoders = available_decoders()
+        self.configured = parse_decoder_config(config)
+        self.selected: Dict[str, str] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self._select(self._by_priority)
+
+    def _by_priority(self, fmt: str, candidates: List[str]) -> str:
+        return next(name for name in DEFAULT_PRIORITY if name in candidates)
+
+    def _select(self, choose):
+        for fmt in FORMATS:
+            name = self.configured.get(fmt)
+            if name is not None and (name not in self.decoders or fmt not in self.decoders[name].formats):
+                logger.warning(f"Декодер {name} для {fmt} недоступен, выбираем автоматически")
+                name = None
+            if name is None:
+                candidates = [n for n, decoder in self.decoders.items() if fmt in decoder.formats]
+                name = choose(fmt, candidates)
+            self.selected[fmt] = name
+
+    def benchmark(self) -> Dict[str, str]:
+        """Самотест: для форматов без явной настройки выбирает самый быстрый бэкенд"""
+        samples = _sample_images()
+
+        def fastest(fmt: str, candidates: List[str]) -> str:
+            timings = {}
+            for name in candidates:
+                decoder = self.decoders[name]
+                try:
+                    decoder.decode(samples[fmt])  # прогрев
+                    runs = []
+                    for _ in range(BENCHMARK_REPEATS):
+                        started = time.perf_counter()
+                        decoder.decode(samples[fmt])
+                        runs.append(time.perf_counter() - started)
+                    timings[name] = round(statistics.median(runs) * 1000, 3)
+                except Exception as e:
+                    logger.warning(f"Декодер {name} не прошел самотест на {fmt}: {e}")
+            self.timings[fmt] = timings
+            return min(timings, key=timings.get) if timings else 'pillow'
+
+        self._select(fastest)
+        logger.info(f"Декодеры изображений: {self.selected}, медиана, мс: {self.timings}")
+        return self.selected
+
+    def decode(self, fmt: Optional[str], data: bytes, factor: int = 1) -> np.ndarray:
+        name = self.selected.get(fmt, 'pillow')
+        try:
+            return self.decoders[name].decode(data, factor)
+        except Exception as e:
+            if name == 'pillow':
+                raise
+            # Например, CMYK JPEG в libjpeg-turbo
+            logger.warning(f"Декодер {name} не справился ({e}), используем Pillow")
+            return self.decoders['pillow'].decode(data, factor)
+
+    def get_info(self) -> Dict[str, object]:
+        return {'available': list(self.decoders), 'selected': dict(self.selected), 'timings_ms': self.timings}
+
+
+def read_header(data: bytes) -> Tuple[Optional[str], int, int, int]:
+    """Формат, размер и EXIF Orientation без декодирования пикселей"""
+    image = Image.open(io.BytesIO(data))
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    return image.format, image.width, image.height, orientation
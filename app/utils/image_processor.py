@@ -1,35 +1,88 @@
+import asyncio
+import contextvars
+import functools
 import io
 import logging
+from dataclasses import dataclass
+from typing import Optional
 from PIL import Image
 import numpy as np
-from PIL import ImageOps
+from app.config import settings
+from app.utils.image_decoders import ImageDecoders, apply_exif_orientation, read_header, reduction_factor
+from app.utils.metrics import timed
+from app.utils.performance import performance, resize_executor
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass(slots=True)
+class DecodedImage:
+    """Декодированное изображение: HxWx3 uint8 в порядке BGR, C-contiguous.
+
+    BGR - порядок каналов, который ultralytics ожидает от ndarray, поэтому
+    буфер передается в модель как есть, без копий и перестановки каналов.
+    width/height - размер исходного изображения с учетом EXIF; pixels может быть
+    меньше, если декодер уменьшил его (DECODE_MAX_SIDE).
+    """
+    pixels: np.ndarray
+    width: int
+    height: int
+    format: Optional[str] = None
+
+
 class ImageProcessor:
     def __init__(self):
         self.max_size = (2048, 2048)
         self.supported_formats = ['JPEG', 'PNG', 'JPG', 'WEBP']
+        # Отдельный ограниченный пул: декодирование не блокирует event loop
+        # и не занимает потоки default executor'а, где идет инференс YOLO
+        self._executor = resize_executor(None, performance.get().decode_workers, 'decode')
+        self.decoders = ImageDecoders(settings.image_decoders)
+        self.max_side = settings.decode_max_side
+
+    async def select_decoders(self):
+        """Самотест декодеров при старте (в пуле декодирования, чтобы не держать event loop)"""
+        if not settings.decoder_benchmark:
+            logger.info(f"Декодеры изображений: {self.decoders.selected}")
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.decoders.benchmark)
     
-    async def process_uploaded_image(self, image_data: bytes) -> Image.Image:
+    @timed("process_uploaded_image")
+    async def process_uploaded_image(self, image_data: bytes) -> DecodedImage:
+        # Размер пула меняется на лету через /admin/performance
+        self._executor = resize_executor(self._executor, performance.get().decode_workers, 'decode')
+        loop = asyncio.get_running_loop()
+        # Копируем контекст, чтобы метрики в потоке знали текущий эндпоинт
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, functools.partial(ctx.run, self.decode, image_data))
+
+    @timed("image_decode")
+    def decode(self, image_data: bytes) -> DecodedImage:
+        """Синхронное декодирование (выполняется в пуле декодирования)"""
         try:
-            # image = Image.open(io.BytesIO(image_data))
-            image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_data)))
-            if image.format not in self.supported_formats:
-                logger.warning(f"Неподдерживаемый формат изображения: {image.format}")
-            
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-                logger.info(f"Изображение конвертировано в RGB режим")
-            
-            #image = self._resize_image(image)
+            image_format, width, height, orientation = read_header(image_data)
+            if image_format not in self.supported_formats:
+                logger.warning(f"Неподдерживаемый формат изображения: {image_format}")
 
-            logger.info(f"Изображение обработано: размер {image.size}, режим {image.mode}")
-            return image
+            # Модель все равно уменьшит вход до imgsz: крупные снимки сразу декодируем в 1/2-1/8
+            factor = reduction_factor(width, height, self.max_side)
+            pixels = self.decoders.decode(image_format, image_data, factor)
+
+            # Ориентация одна для всех бэкендов: они декодируют без учета EXIF
+            pixels = apply_exif_orientation(pixels, orientation)
+            if orientation in (5, 6, 7, 8):
+                width, height = height, width
+
+            logger.info(f"Изображение обработано: размер {width}x{height}, декодировано {pixels.shape[1]}x{pixels.shape[0]}, формат {image_format}")
+            return DecodedImage(pixels=pixels, width=width, height=height, format=image_format)
             
         except Exception as e:
             logger.error(f"Ошибка обработки изображения: {e}")
             raise ValueError(f"Не удалось обработать изображение: {e}")
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
     
     def _resize_image(self, image: Image.Image) -> Image.Image:
         if image.size[0] <= self.max_size[0] and image.size[1] <= self.max_size[1]:
@@ -60,24 +113,9 @@ class ImageProcessor:
             logger.error(f"Ошибка валидации изображения: {e}")
             return False
     
-    def get_image_info(self, image: Image.Image) -> dict:
+    def get_image_info(self, image: DecodedImage) -> dict:
         return {
-            'width': image.size[0],
-            'height': image.size[1],
-            'mode': image.mode,
-            'format': getattr(image, 'format', 'Unknown')
+            'width': image.width,
+            'height': image.height,
+            'format': image.format or 'Unknown'
         }
-    
-    async def prepare_for_yolo(self, image: Image.Image) -> np.ndarray:
-        try:
-            image_array = np.array(image)
-            
-            if len(image_array.shape) == 3 and image_array.shape[2] == 3:
-                image_array = image_array[:, :, ::-1]
-            
-            logger.info(f"Изображение подготовлено для YOLO: форма {image_array.shape}")
-            return image_array
-            
-        except Exception as e:
-            logger.error(f"Ошибка подготовки изображения для YOLO: {e}")
-            raise
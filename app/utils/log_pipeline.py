@@ -0,0 +1,176 @@
+"""Неблокирующие логи: запись уходит в очередь, в stderr ее пишет фоновый поток.
+
+На потоке запроса остается только фильтр (уровень, выборка, обрезка, request ID) и
+put_nowait; форматирование JSON и запись в поток - в QueueListener. При переполнении
+очереди запись отбрасывается, а не блокирует event loop. WARNING и выше не сэмплируются.
+При prefork поток писателя запускается заново в каждом воркере после fork.
+"""
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+import orjson
+
+from app.config import settings
+from app.utils.metrics import log_records_dropped
+from app.utils.performance import performance
+from app.utils.tracing import request_id_var
+
+# Прежний формат по умолчанию; request_id есть в JSON (LOG_FORMAT=json)
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Логгеры, которые пишут и без приложения: направляются в ту же очередь
+UVICORN_LOGGERS = ('uvicorn', 'uvicorn.error', 'uvicorn.access')
+
+
+def parse_sampling(value: str) -> Dict[str, float]:
+    """'app.services.translator_service=0.1,uvicorn.access=0.05' -> {логгер: доля}"""
+    rates = {}
+    for part in value.split(','):
+        name, _, rate = part.partition('=')
+        if name.strip() and rate.strip():
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class RecordFilter(logging.Filter):
+    """Фильтр на стороне вызывающего потока: уровень, выборка, обрезка и request ID"""
+
+    def __init__(self, level: int, sampling: Dict[str, float], max_message: int):
+        super().__init__()
+        self.level = level
+        self.sampling = sampling
+        self.max_message = max_message
+        self._rates: Dict[str, float] = {}
+        self._debug: Optional[bool] = None
+
+    def _rate(self, name: str) -> float:
+        # Доля задается для логгера или любого его родителя; результат кэшируется по имени
+        rate = self._rates.get(name)
+        if rate is None:
+            rate, parent = 1.0, name
+            while parent:
+                if parent in self.sampling:
+                    rate = self.sampling[parent]
+                    break
+                parent = parent.rpartition('.')[0]
+            self._rates[name] = rate
+        return rate
+
+    def _apply_debug(self, debug: bool):
+        # DEBUG записи приложения создаются только при log_debug; переключатель из
+        # /admin/performance замечается на первой же записи после изменения
+        self._debug = debug
+        logging.getLogger('app').setLevel(logging.DEBUG if debug else logging.NOTSET)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        debug = performance.get().log_debug
+        if debug != self._debug:
+            self._apply_debug(debug)
+        if not debug and record.levelno < logging.WARNING:
+            if record.levelno < self.level:
+                return False
+            if random.random() >= self._rate(record.name):
+                log_records_dropped.inc('sampled')
+                return False
+
+        record.request_id = request_id_var.get() or '-'
+        if not debug and self.max_message > 0:
+            message = record.getMessage()
+            if len(message) > self.max_message:
+                record.msg = f"{message[:self.max_message]}... (+{len(message) - self.max_message} симв.)"
+                record.args = None
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Текст исключения собирается здесь: traceback ссылается на кадры вызывающего потока
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg, record.args, record.message = message, None, message
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc('queue_full')
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+            'pid': record.process
+        }
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return orjson.dumps(entry).decode()
+
+
+class LogPipeline:
+    def __init__(self):
+        self.handler: Optional[NonBlockingQueueHandler] = None
+        self.listener: Optional[QueueListener] = None
+
+    def configure(self):
+        level = logging.getLevelName(settings.log_level)
+        if not isinstance(level, int):
+            level = logging.INFO
+
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter() if settings.log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+
+        self.handler = NonBlockingQueueHandler(queue.Queue(settings.log_queue_size))
+        record_filter = RecordFilter(level, parse_sampling(settings.log_sampling), settings.log_max_message)
+        self.handler.addFilter(record_filter)
+        self.listener = QueueListener(self.handler.queue, output)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(level)
+        record_filter._apply_debug(performance.get().log_debug)
+        # Имена потока и процесса в записях не используются - не собираем их на каждый вызов
+        logging.logThreads = False
+        logging.logMultiprocessing = False
+        for name in UVICORN_LOGGERS:
+            logger = logging.getLogger(name)
+            logger.handlers = []
+            logger.propagate = True
+
+        self.listener.start()
+        atexit.register(self.stop)
+        os.register_at_fork(after_in_child=self._restart_after_fork)
+
+    def _restart_after_fork(self):
+        # Поток писателя не переживает fork, а очередь могла остаться с захваченной блокировкой
+        self.handler.queue = queue.Queue(settings.log_queue_size)
+        self.listener = QueueListener(self.handler.queue, *self.listener.handlers)
+        self.listener.start()
+
+    def stop(self):
+        """Дописывает записи из очереди и останавливает поток"""
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+
+log_pipeline = LogPipeline()
+
+
+def configure_logging():
+    log_pipeline.configure()
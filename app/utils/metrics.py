@@ -0,0 +1,268 @@
+"""Легковесные метрики в формате Prometheus (text exposition 0.0.4).
+
+Без внешних зависимостей: счетчики, гистограммы и gauge с метками,
+потокобезопасные (наблюдения приходят и из потоков executor'а).
+
+Значения живут в памяти процесса. При prefork (WORKERS > 1) /metrics отдает счетчики
+того воркера, который принял запрос, поэтому у всех серий есть метка worker (pid):
+без нее Prometheus видел бы сброс счетчиков между опросами разных воркеров.
+Суммировать по воркерам - sum without (worker) (...).
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from app.config import settings
+from app.utils.tracing import record_span
+
+# Шаблон маршрута текущего HTTP запроса (выставляет middleware)
+current_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar('current_endpoint', default='')
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], *extra: str) -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    parts.extend(label for label in extra if label)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def render(self, const: str = '') -> List[str]:
+        """const - метки процесса, общие для всех серий (worker)"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples(const))
+        return lines
+
+    def _samples(self, const: str) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self, const: str) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f'{self.name}{_format_labels(self.labelnames, labels, const)} {_format_value(value)}'
+            for labels, value in items
+        ]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def _samples(self, const: str) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f'{self.name}{_format_labels(self.labelnames, labels, const)} {_format_value(value)}'
+            for labels, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики по бакетам (+Inf последним), сумма, количество]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self, const: str) -> List[str]:
+        with self._lock:
+            items = [(labels, (list(state[0]), state[1], state[2])) for labels, state in self._values.items()]
+
+        lines = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, labels, const, f'le="{_format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            plain = _format_labels(self.labelnames, labels, const)
+            lines.append(f'{self.name}_sum{plain} {_format_value(total)}')
+            lines.append(f'{self.name}_count{plain} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        # pid читается при каждом опросе: воркеры получают registry мастера через fork
+        const = f'worker="{os.getpid()}"' if settings.workers > 1 else ''
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render(const))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    'vibetel_http_request_duration_seconds', 'Длительность HTTP запросов',
+    ('method', 'endpoint', 'status')
+))
+http_in_flight = registry.register(Gauge(
+    'vibetel_http_requests_in_flight', 'HTTP запросы в обработке', ('endpoint',)
+))
+stage_duration = registry.register(Histogram(
+    'vibetel_stage_duration_seconds', 'Длительность этапов обработки запроса', ('endpoint', 'stage')
+))
+stage_in_flight = registry.register(Gauge(
+    'vibetel_stage_in_flight', 'Этапы обработки, выполняемые в данный момент', ('stage',)
+))
+upstream_responses = registry.register(Counter(
+    'vibetel_upstream_responses_total', 'Ответы внешних сервисов по статусу', ('upstream', 'status')
+))
+fallback_activations = registry.register(Counter(
+    'vibetel_fallback_total', 'Срабатывания fallback-веток', ('kind',)
+))
+gpt_prompt_tokens = registry.register(Histogram(
+    'vibetel_gpt_prompt_tokens', 'Токены промпта YandexGPT (usage ответа или оценка)', ('kind', 'context'),
+    buckets=(100, 200, 300, 400, 500, 600, 800, 1000, 1500, 2000)
+))
+gpt_latency = registry.register(Histogram(
+    'vibetel_gpt_latency_seconds', 'Длительность запроса к YandexGPT', ('kind', 'context')
+))
+local_generator_lookups = registry.register(Counter(
+    'vibetel_local_generator_total', 'Поиск предложения в локальном корпусе', ('result',)
+))
+log_records_dropped = registry.register(Counter(
+    'vibetel_log_records_dropped_total', 'Записи лога, отброшенные выборкой или при переполнении очереди',
+    ('reason',)
+))
+db_pool_wait = registry.register(Histogram(
+    'vibetel_db_pool_wait_seconds', 'Ожидание свободного read-соединения SQLite',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+))
+db_pool_in_use = registry.register(Gauge(
+    'vibetel_db_pool_connections_in_use', 'Занятые read-соединения SQLite'
+))
+job_queue_depth = registry.register(Gauge(
+    'vibetel_job_queue_depth', 'Незавершенные задачи в очереди (queued + running)'
+))
+job_wait = registry.register(Histogram(
+    'vibetel_job_wait_seconds', 'Время задачи в очереди до начала выполнения', ('kind',)
+))
+job_duration = registry.register(Histogram(
+    'vibetel_job_duration_seconds', 'Длительность выполнения задачи', ('kind',)
+))
+jobs_finished = registry.register(Counter(
+    'vibetel_jobs_finished_total', 'Завершенные задачи по результату', ('kind', 'state')
+))
+admission_in_flight = registry.register(Gauge(
+    'vibetel_admission_in_flight', 'Принятые запросы по классу ресурса', ('resource',)
+))
+admission_rejections = registry.register(Counter(
+    'vibetel_admission_rejected_total', 'Запросы, отклоненные контролем допуска (503)', ('resource', 'reason')
+))
+model_inference = registry.register(Histogram(
+    'vibetel_model_inference_seconds', 'Длительность инференса по версии модели YOLO', ('model',)
+))
+model_detections = registry.register(Histogram(
+    'vibetel_model_detections', 'Число детекций на изображение по версии модели YOLO', ('model',),
+    buckets=(0, 1, 2, 3, 5, 7, 10)
+))
+
+
+def timed(stage: str) -> Callable:
+    """Декоратор: пишет длительность функции в vibetel_stage_duration_seconds.
+
+    Работает и для корутин, и для обычных функций (в т.ч. выполняемых в executor).
+    Этап также попадает в трассу текущего запроса, если она есть.
+    """
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                stage_in_flight.inc(stage)
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    duration = time.perf_counter() - started
+                    stage_duration.observe(duration, current_endpoint.get(), stage)
+                    stage_in_flight.dec(stage)
+                    record_span(stage, started, duration)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stage_in_flight.inc(stage)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - started
+                stage_duration.observe(duration, current_endpoint.get(), stage)
+                stage_in_flight.dec(stage)
+                record_span(stage, started, duration)
+        return wrapper
+
+    return decorator
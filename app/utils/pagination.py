@@ -0,0 +1,18 @@
+import base64
+import json
+from typing import Tuple
+
+
+def encode_cursor(created_at: str, sentence_id: int) -> str:
+    """Кодирует позицию (created_at, id) последней выданной строки в непрозрачный курсор"""
+    raw = json.dumps([str(created_at), sentence_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, sentence_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return str(created_at), int(sentence_id)
+    except Exception as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
@@ -0,0 +1,179 @@
+"""Параметры производительности, которые меняются на лету (PATCH /admin/performance).
+
+Начальные значения берутся из Settings (переменные окружения) и значений по умолчанию
+ниже. Изменения проверяются целиком (PerformanceConfig) и записываются в разделяемую
+память, поэтому при prefork действуют во всех воркерах. Сервисы читают performance.get()
+в момент использования (дешевое сравнение версии), пулы потоков пересоздаются при
+изменении размера.
+"""
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+from app.config import settings
+from app.utils.shared_state import performance_document
+
+logger = logging.getLogger(__name__)
+
+
+class PerformanceConfig(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
+    # YOLO
+    yolo_imgsz: int = Field(640, ge=128, le=1920, description="Размер входа инференса (кратен 32)")
+    yolo_reduced_imgsz: int = Field(320, ge=128, le=1920, description="Размер входа при нехватке бюджета запроса")
+    yolo_conf: float = Field(0.25, gt=0, le=1, description="Порог уверенности детекций")
+    yolo_max_det: int = Field(10, ge=1, le=300, description="Максимум детекций на изображение")
+    # Пулы потоков (0 у инференса - default executor event loop'а)
+    inference_workers: int = Field(0, ge=0, le=64)
+    decode_workers: int = Field(default_factory=lambda: max(1, settings.decode_threads), ge=1, le=64)
+    # YandexGPT
+    sentence_temperature: float = Field(0.8, ge=0, le=1)
+    sentence_max_tokens: int = Field(150, ge=16, le=2000)
+    memory_temperature: float = Field(0.9, ge=0, le=1)
+    memory_max_tokens: int = Field(500, ge=16, le=2000)
+    # Контекст промпта: similarity - похожие на объекты предложения в пределах бюджета токенов,
+    # recent - последние пять как раньше (для сравнения)
+    context_mode: Literal['similarity', 'recent'] = 'similarity'
+    context_max_tokens: int = Field(60, ge=0, le=2000)
+    context_max_sentences: int = Field(3, ge=0, le=20)
+    # Локальный генератор предложений (первый уровень перед YandexGPT)
+    local_generator: bool = Field(default_factory=lambda: settings.local_generator)
+    local_generator_min_score: float = Field(default_factory=lambda: settings.local_generator_min_score, ge=0, le=1)
+    # Одновременные запросы к внешним сервисам на воркер (0 - без ограничения)
+    gpt_concurrency: int = Field(0, ge=0, le=1000)
+    translate_concurrency: int = Field(0, ge=0, le=1000)
+    tts_concurrency: int = Field(0, ge=0, le=1000)
+    # Контроль допуска на воркер: сверх лимита принятых запросов класса или при задержке
+    # ресурса выше цели (сек) новые запросы получают 503 (0 - без ограничения)
+    inference_max_in_flight: int = Field(0, ge=0, le=10000)
+    gpt_max_in_flight: int = Field(0, ge=0, le=10000)
+    translate_max_in_flight: int = Field(0, ge=0, le=10000)
+    tts_max_in_flight: int = Field(0, ge=0, le=10000)
+    inference_latency_target: float = Field(0, ge=0)
+    gpt_latency_target: float = Field(0, ge=0)
+    translate_latency_target: float = Field(0, ge=0)
+    tts_latency_target: float = Field(0, ge=0)
+    # Кэши
+    response_cache_size: int = Field(default_factory=lambda: settings.response_cache_size, ge=0, le=100000)
+    response_cache_ttl: float = Field(default_factory=lambda: settings.response_cache_ttl, ge=0)
+    idempotency_cache_size: int = Field(default_factory=lambda: settings.idempotency_cache_size, ge=0, le=100000)
+    # Полные логи: DEBUG приложения, без выборки и обрезки сообщений
+    log_debug: bool = Field(default_factory=lambda: settings.log_debug)
+
+    @model_validator(mode='after')
+    def _check_imgsz(self):
+        for name in ('yolo_imgsz', 'yolo_reduced_imgsz'):
+            if getattr(self, name) % 32:
+                raise ValueError(f"{name} должен быть кратен 32")
+        if self.yolo_reduced_imgsz > self.yolo_imgsz:
+            raise ValueError("yolo_reduced_imgsz не может быть больше yolo_imgsz")
+        return self
+
+
+class PerformanceSettings:
+    def __init__(self):
+        self._config = PerformanceConfig()
+        self._version = performance_document.version
+
+    def get(self) -> PerformanceConfig:
+        """Текущая конфигурация; при новой версии в разделяемой памяти - перечитывает ее"""
+        if performance_document.version != self._version:
+            self._reload()
+        return self._config
+
+    def _reload(self):
+        raw, version = performance_document.get()
+        self._version = version
+        try:
+            self._config = PerformanceConfig.model_validate_json(raw) if raw else PerformanceConfig()
+        except ValueError as e:
+            logger.error(f"Некорректная конфигурация производительности, оставляем текущую: {e}")
+            return
+        logger.info(f"Конфигурация производительности обновлена (версия {version})")
+
+    def update(self, changes: Dict[str, Any]) -> PerformanceConfig:
+        """Проверяет изменения вместе с текущими значениями; ValidationError - ничего не меняется"""
+        config = PerformanceConfig.model_validate({**self.get().model_dump(), **changes})
+        performance_document.set(config.model_dump_json().encode())
+        return self.get()
+
+    def reset(self) -> PerformanceConfig:
+        performance_document.set(b'')
+        return self.get()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+
+performance = PerformanceSettings()
+
+
+def resize_executor(executor: Optional[ThreadPoolExecutor], workers: int, prefix: str) -> Optional[ThreadPoolExecutor]:
+    """Новый пул нужного размера (0 - None, т.е. default executor); старый дорабатывает задачи и завершается"""
+    current = executor._max_workers if executor is not None else 0
+    if current == workers:
+        return executor
+    if executor is not None:
+        executor.shutdown(wait=False)
+    logger.info(f"Пул {prefix}: {current} -> {workers} потоков")
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=prefix) if workers > 0 else None
+
+
+class ConcurrencyLimiter:
+    """Ограничение одновременных вызовов с изменяемым на лету лимитом (0 - без ограничения).
+
+    asyncio.Semaphore нельзя перенастроить, поэтому лимит читается при каждом входе.
+    """
+
+    def __init__(self, name: str, limit: Callable[[], int]):
+        self.name = name
+        self._limit = limit
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def __aenter__(self):
+        while 0 < self._limit() <= self.active:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Место уже отдано этому вызову - передаем его следующему
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+            finally:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+        self.active += 1
+
+    async def __aexit__(self, *exc_info):
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        # Будим ожидающих по числу свободных мест (при увеличении лимита - сразу нескольких)
+        limit = self._limit()
+        free = limit - self.active if limit > 0 else len(self._waiters)
+        for waiter in list(self._waiters):
+            if free <= 0:
+                break
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'limit': self._limit(), 'active': self.active, 'waiting': len(self._waiters)}
+
+
+gpt_limiter = ConcurrencyLimiter('yandex_gpt', lambda: performance.get().gpt_concurrency)
+translate_limiter = ConcurrencyLimiter('yandex_translate', lambda: performance.get().translate_concurrency)
+tts_limiter = ConcurrencyLimiter('tts', lambda: performance.get().tts_concurrency)
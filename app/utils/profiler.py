@@ -0,0 +1,62 @@
+"""Сэмплирующий профилировщик всех потоков процесса (включая потоки executor'а с YOLO).
+
+Результат - свернутые стеки (collapsed/folded), которые понимают flamegraph.pl,
+speedscope и inferno: строка "поток;кадр;кадр;... количество".
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """Профилирует по запросу; одновременно выполняется не больше одного профиля"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self, seconds: float, interval: float = 0.01) -> str:
+        """Блокирующий сбор сэмплов (вызывать через asyncio.to_thread)"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Профилирование уже выполняется")
+
+        try:
+            samples = self._collect(seconds, interval)
+        finally:
+            self._lock.release()
+
+        return ''.join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+    def _collect(self, seconds: float, interval: float) -> Counter:
+        own_id = threading.get_ident()
+        samples: Counter = Counter()
+        deadline = time.monotonic() + seconds
+
+        while time.monotonic() < deadline:
+            names: Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                samples[';'.join(reversed(stack))] += 1
+            time.sleep(interval)
+
+        return samples
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,217 @@
+"""Состояние, общее для всех воркеров при запуске через prefork (run.py, WORKERS > 1).
+
+Объекты создаются при импорте модуля. Gunicorn с preload_app импортирует приложение в
+мастер-процессе до fork, поэтому воркеры наследуют одну и ту же разделяемую память.
+В однопроцессном режиме это просто память текущего процесса.
+"""
+import multiprocessing
+import os
+import time
+from typing import Tuple
+
+_LANGUAGE_FIELD_SIZE = 16
+_MODEL_PATH_SIZE = 512
+
+# Метка запуска: версии ниже живут в памяти и обнуляются при рестарте,
+# поэтому ETag включает ее, чтобы не совпасть с версией прошлого запуска
+BOOT_ID = format(int(time.time()), 'x')
+
+
+class SharedTranslationDirection:
+    """Направление перевода в разделяемой памяти + счетчик версий изменений"""
+
+    def __init__(self, source_language: str, target_language: str):
+        self._lock = multiprocessing.Lock()
+        self._source = multiprocessing.RawArray('c', _LANGUAGE_FIELD_SIZE)
+        self._target = multiprocessing.RawArray('c', _LANGUAGE_FIELD_SIZE)
+        self._version = multiprocessing.RawValue('L', 0)
+        self._modified_at = multiprocessing.RawValue('d', time.time())
+        self._write(self._source, source_language)
+        self._write(self._target, target_language)
+
+    @staticmethod
+    def _write(field, value: str):
+        encoded = value.encode('ascii')
+        if len(encoded) >= _LANGUAGE_FIELD_SIZE:
+            raise ValueError(f"Слишком длинный код языка: {value}")
+        field.value = encoded
+
+    def get(self) -> Tuple[str, str]:
+        with self._lock:
+            return self._source.value.decode('ascii'), self._target.value.decode('ascii')
+
+    def set(self, source_language: str = None, target_language: str = None):
+        with self._lock:
+            if source_language is not None:
+                self._write(self._source, source_language)
+            if target_language is not None:
+                self._write(self._target, target_language)
+            self._version.value += 1
+            self._modified_at.value = time.time()
+
+    @property
+    def version(self) -> int:
+        return self._version.value
+
+    @property
+    def modified_at(self) -> float:
+        return self._modified_at.value
+
+
+class SharedDataVersion:
+    """Версия данных предложений для ETag и кэша ответов.
+
+    last_sentence_id растет при сохранении предложений, generation - при прочих
+    изменениях (ретеншн, пересборка статистики).
+    """
+
+    def __init__(self):
+        self._lock = multiprocessing.Lock()
+        self._last_sentence_id = multiprocessing.RawValue('q', 0)
+        self._generation = multiprocessing.RawValue('L', 0)
+        self._modified_at = multiprocessing.RawValue('d', time.time())
+
+    def record_sentence(self, sentence_id: int):
+        with self._lock:
+            if sentence_id > self._last_sentence_id.value:
+                self._last_sentence_id.value = sentence_id
+            self._modified_at.value = time.time()
+
+    def observe_sentence_id(self, sentence_id: int):
+        """Учитывает уже существующие строки при старте, не меняя modified_at"""
+        with self._lock:
+            if sentence_id > self._last_sentence_id.value:
+                self._last_sentence_id.value = sentence_id
+
+    def bump(self):
+        with self._lock:
+            self._generation.value += 1
+            self._modified_at.value = time.time()
+
+    @property
+    def last_sentence_id(self) -> int:
+        return self._last_sentence_id.value
+
+    @property
+    def generation(self) -> int:
+        return self._generation.value
+
+    @property
+    def tag(self) -> str:
+        with self._lock:
+            return f"s{self._last_sentence_id.value}.g{self._generation.value}"
+
+    @property
+    def modified_at(self) -> float:
+        return self._modified_at.value
+
+
+class SharedModelConfig:
+    """Какие модели YOLO должны обслуживать трафик: основная, кандидат и его доля в процентах.
+
+    Пустой путь основной модели - модель, загруженная при старте. Воркеры сравнивают
+    version со своей и подгружают изменения в фоне.
+    """
+
+    def __init__(self):
+        self._lock = multiprocessing.Lock()
+        self._primary = multiprocessing.RawArray('c', _MODEL_PATH_SIZE)
+        self._candidate = multiprocessing.RawArray('c', _MODEL_PATH_SIZE)
+        self._candidate_percent = multiprocessing.RawValue('i', 0)
+        self._version = multiprocessing.RawValue('L', 0)
+
+    @staticmethod
+    def _write(field, value: str):
+        encoded = value.encode('utf-8')
+        if len(encoded) >= _MODEL_PATH_SIZE:
+            raise ValueError(f"Слишком длинный путь к модели: {value}")
+        field.value = encoded
+
+    def get(self) -> Tuple[str, str, int, int]:
+        """(основная, кандидат, доля кандидата в %, версия)"""
+        with self._lock:
+            return (
+                self._primary.value.decode('utf-8'),
+                self._candidate.value.decode('utf-8'),
+                self._candidate_percent.value,
+                self._version.value
+            )
+
+    def set(self, primary: str, candidate: str = '', candidate_percent: int = 0):
+        with self._lock:
+            self._write(self._primary, primary)
+            self._write(self._candidate, candidate)
+            self._candidate_percent.value = candidate_percent if candidate else 0
+            self._version.value += 1
+
+    @property
+    def version(self) -> int:
+        return self._version.value
+
+
+class SharedDocument:
+    """Небольшой документ (JSON) в разделяемой памяти + счетчик версий изменений"""
+
+    def __init__(self, size: int):
+        self._lock = multiprocessing.Lock()
+        self._data = multiprocessing.RawArray('c', size)
+        self._length = multiprocessing.RawValue('i', 0)
+        self._version = multiprocessing.RawValue('L', 0)
+
+    def get(self) -> Tuple[bytes, int]:
+        with self._lock:
+            return self._data.raw[:self._length.value], self._version.value
+
+    def set(self, data: bytes):
+        with self._lock:
+            if len(data) > len(self._data):
+                raise ValueError(f"Документ больше {len(self._data)} байт")
+            self._data[:len(data)] = data
+            self._length.value = len(data)
+            self._version.value += 1
+
+    @property
+    def version(self) -> int:
+        return self._version.value
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MaintenanceOwner:
+    """Выбирает один воркер для фоновых задач (сверка статистики, ретеншн)"""
+
+    def __init__(self):
+        self._lock = multiprocessing.Lock()
+        self._pid = multiprocessing.RawValue('i', 0)
+
+    def claim(self) -> bool:
+        """True, если текущий процесс стал (или уже был) владельцем фоновых задач"""
+        pid = os.getpid()
+        with self._lock:
+            owner = self._pid.value
+            if owner == pid:
+                return True
+            if owner and process_alive(owner):
+                return False
+            self._pid.value = pid
+            return True
+
+    def release(self):
+        with self._lock:
+            if self._pid.value == os.getpid():
+                self._pid.value = 0
+
+
+translation_direction = SharedTranslationDirection('ru', 'tt')
+data_version = SharedDataVersion()
+maintenance_owner = MaintenanceOwner()
+model_config = SharedModelConfig()
+performance_document = SharedDocument(4096)
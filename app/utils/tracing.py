@@ -0,0 +1,122 @@
+"""Трассировка отдельных запросов: request ID и тайминги этапов пайплайна."""
+import contextvars
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar('request_id', default='')
+current_trace: contextvars.ContextVar[Optional['Trace']] = contextvars.ContextVar('current_trace', default=None)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+
+class Trace:
+    def __init__(self, request_id: str, method: str, path: str):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.endpoint = ''
+        self.status = 0
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        # (этап, начало относительно запроса, длительность) - в секундах
+        self.spans: List[tuple] = []
+
+    def add_span(self, stage: str, started: float, duration: float):
+        # list.append атомарен под GIL, этапы приходят и из потоков executor'а
+        self.spans.append((stage, started - self.started, duration))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'request_id': self.request_id,
+            'method': self.method,
+            'path': self.path,
+            'endpoint': self.endpoint,
+            'status': self.status,
+            'duration_ms': round(self.duration * 1000, 3),
+            'spans': [
+                {
+                    'stage': stage,
+                    'start_ms': round(offset * 1000, 3),
+                    'duration_ms': round(duration * 1000, 3)
+                }
+                for stage, offset, duration in sorted(self.spans, key=lambda span: span[1])
+            ]
+        }
+
+
+class TraceStore:
+    """Ограниченное хранилище последних завершенных трасс"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._traces: 'OrderedDict[str, Trace]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces[trace.request_id] = trace
+            self._traces.move_to_end(trace.request_id)
+            while len(self._traces) > self.capacity:
+                self._traces.popitem(last=False)
+
+    def get(self, request_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(request_id)
+
+    def recent(self, limit: int) -> List[Trace]:
+        with self._lock:
+            traces = list(self._traces.values())
+        return traces[::-1][:limit]
+
+
+trace_store = TraceStore(settings.trace_buffer_size)
+
+
+def record_span(stage: str, started: float, duration: float):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_span(stage, started, duration)
+
+
+class RequestTracingMiddleware:
+    """ASGI middleware: назначает request ID (или берет из X-Request-ID) и сохраняет трассу"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = ''
+        for name, value in scope['headers']:
+            if name == b'x-request-id':
+                request_id = value.decode('latin-1')[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+
+        trace = Trace(request_id, scope['method'], scope['path'])
+        id_token = request_id_var.set(request_id)
+        trace_token = current_trace.set(trace)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                trace.status = message['status']
+                message['headers'] = list(message.get('headers', [])) + [
+                    (REQUEST_ID_HEADER.lower().encode('latin-1'), request_id.encode('latin-1'))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            trace.duration = time.perf_counter() - trace.started
+            trace_store.add(trace)
+            current_trace.reset(trace_token)
+            request_id_var.reset(id_token)
@@ -0,0 +1,436 @@
+"""Нагрузочный тест API против локальных заглушек внешних сервисов.
+
+Поднимает заглушки YandexGPT / Yandex Translate / TTS (benchmarks/stub_upstreams.py),
+запускает приложение через uvicorn во временной базе, гоняет смешанную нагрузку
+и пишет JSON-отчет: пропускная способность, перцентили задержки и ресурсы сервера
+по каждому эндпоинту. Отчеты разных коммитов сравниваются через --compare.
+
+Пример:
+    python -m benchmarks.load_test --duration 60 --concurrency 32 --images ./photos
+    python -m benchmarks.load_test --compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from benchmarks.stub_upstreams import add_latency_arguments, config_from_args, start_stub_server
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = PROJECT_ROOT / "benchmarks" / "results"
+IMAGE_EXTENSIONS = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+DEFAULT_MIX = "process-image=3,extract-objects=3,generate-sentence-bilingual=2,audio=2"
+SAMPLE_OBJECTS = ["кот", "стул", "книга", "чашка", "человек", "стол", "телефон", "собака"]
+
+
+# --- изображения ---------------------------------------------------------------
+
+def load_images(directory: Optional[str]) -> List[tuple]:
+    """Возвращает [(имя, байты, content-type)] из каталога или синтетические изображения"""
+    images = []
+    if directory:
+        for path in sorted(Path(directory).iterdir()):
+            content_type = IMAGE_EXTENSIONS.get(path.suffix.lower())
+            if content_type:
+                images.append((path.name, path.read_bytes(), content_type))
+
+    if images:
+        return images
+
+    print("Внимание: реальные изображения не заданы (--images), используются синтетические 1280x960",
+          file=sys.stderr)
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, size=(960, 1280, 3), dtype=np.uint8)
+    for fmt, content_type in (("JPEG", "image/jpeg"), ("PNG", "image/png"), ("WEBP", "image/webp")):
+        buffer = io.BytesIO()
+        Image.fromarray(base).save(buffer, fmt)
+        images.append((f"synthetic.{fmt.lower()}", buffer.getvalue(), content_type))
+    return images
+
+
+# --- ресурсы сервера (Linux /proc) ------------------------------------------------
+
+class ProcessTreeSampler:
+    """Периодически снимает CPU время и RSS процесса сервера и его потомков"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self.rss_samples: List[float] = []
+        self.cpu_start: Optional[float] = None
+        self.cpu_end: Optional[float] = None
+
+    def _tree_pids(self) -> List[int]:
+        children = defaultdict(list)
+        for entry in Path("/proc").iterdir():
+            if not entry.name.isdigit():
+                continue
+            try:
+                fields = (entry / "stat").read_text().rsplit(")", 1)[1].split()
+                children[int(fields[1])].append(int(entry.name))
+            except (OSError, IndexError, ValueError):
+                continue
+        pids, stack = [], [self.pid]
+        while stack:
+            pid = stack.pop()
+            pids.append(pid)
+            stack.extend(children.get(pid, []))
+        return pids
+
+    def _snapshot(self):
+        cpu, rss = 0.0, 0
+        for pid in self._tree_pids():
+            try:
+                fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+                cpu += (int(fields[11]) + int(fields[12])) / self.clock_ticks
+                rss += int(fields[21]) * self.page_size
+            except (OSError, IndexError, ValueError):
+                continue
+        return cpu, rss
+
+    @property
+    def available(self) -> bool:
+        return Path(f"/proc/{self.pid}/stat").exists()
+
+    async def run(self, stop: asyncio.Event):
+        if not self.available:
+            return
+        self.cpu_start, _ = self._snapshot()
+        while not stop.is_set():
+            cpu, rss = self._snapshot()
+            self.cpu_end = cpu
+            self.rss_samples.append(rss / (1024 * 1024))
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+        self.cpu_end, _ = self._snapshot()
+
+    def report(self, duration: float) -> Dict:
+        if self.cpu_start is None or not self.rss_samples:
+            return {"available": False}
+        cpu_seconds = (self.cpu_end or self.cpu_start) - self.cpu_start
+        return {
+            "available": True,
+            "cpu_seconds": round(cpu_seconds, 3),
+            "cpu_utilization": round(cpu_seconds / duration, 3) if duration else 0.0,
+            "rss_mb_max": round(max(self.rss_samples), 1),
+            "rss_mb_avg": round(sum(self.rss_samples) / len(self.rss_samples), 1),
+        }
+
+
+# --- нагрузка ------------------------------------------------------------------
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, images: List[tuple], mix: Dict[str, float], seed: int):
+        self.base_url = base_url.rstrip("/")
+        self.images = images
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.random = random.Random(seed)
+        self.results: Dict[str, List[tuple]] = defaultdict(list)
+        self.recording = False
+
+    async def _request(self, session: aiohttp.ClientSession, endpoint: str) -> int:
+        if endpoint in ("process-image", "extract-objects"):
+            name, data, content_type = self.random.choice(self.images)
+            form = aiohttp.FormData()
+            form.add_field("file", data, filename=name, content_type=content_type)
+            async with session.post(f"{self.base_url}/{endpoint}", data=form) as response:
+                await response.read()
+                return response.status
+
+        if endpoint in ("generate-sentence", "generate-sentence-bilingual"):
+            payload = {"objects": self.random.sample(SAMPLE_OBJECTS, self.random.randint(1, 3))}
+        elif endpoint == "generate-album-memory":
+            payload = {"objects": self.random.sample(SAMPLE_OBJECTS, 3)}
+        elif endpoint == "audio":
+            payload = {"text": "Кеше уңайлы урындыкта утыра", "speaker": "alsu"}
+        elif endpoint == "translate":
+            payload = {"text": "Кот спит на стуле"}
+        else:
+            async with session.get(f"{self.base_url}/{endpoint}") as response:
+                await response.read()
+                return response.status
+
+        async with session.post(f"{self.base_url}/{endpoint}", json=payload) as response:
+            await response.read()
+            return response.status
+
+    async def _worker(self, session: aiohttp.ClientSession, stop: asyncio.Event):
+        while not stop.is_set():
+            endpoint = self.random.choices(self.endpoints, self.weights)[0]
+            started = time.perf_counter()
+            try:
+                status = await self._request(session, endpoint)
+            except Exception:
+                status = 0
+            latency = time.perf_counter() - started
+            if self.recording:
+                self.results[endpoint].append((latency, status))
+
+    async def run(self, concurrency: int, warmup: float, duration: float, timeout: float) -> float:
+        stop = asyncio.Event()
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            workers = [asyncio.create_task(self._worker(session, stop)) for _ in range(concurrency)]
+            await asyncio.sleep(warmup)
+            self.recording = True
+            started = time.perf_counter()
+            await asyncio.sleep(duration)
+            self.recording = False
+            measured = time.perf_counter() - started
+            stop.set()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return measured
+
+    def report(self, duration: float) -> Dict:
+        endpoints = {}
+        all_latencies, total_errors = [], 0
+        for endpoint, samples in sorted(self.results.items()):
+            latencies = sorted(latency * 1000 for latency, _ in samples)
+            statuses = defaultdict(int)
+            for _, status in samples:
+                statuses[str(status)] += 1
+            errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+            total_errors += errors
+            all_latencies.extend(latencies)
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": errors,
+                "status_codes": dict(statuses),
+                "throughput_rps": round(len(samples) / duration, 3),
+                "latency_ms": latency_summary(latencies),
+            }
+
+        all_latencies.sort()
+        return {
+            "endpoints": endpoints,
+            "total": {
+                "requests": len(all_latencies),
+                "errors": total_errors,
+                "throughput_rps": round(len(all_latencies) / duration, 3),
+                "latency_ms": latency_summary(all_latencies),
+            },
+        }
+
+
+def latency_summary(sorted_latencies: List[float]) -> Dict[str, float]:
+    if not sorted_latencies:
+        return {}
+    return {
+        "mean": round(sum(sorted_latencies) / len(sorted_latencies), 3),
+        "p50": round(percentile(sorted_latencies, 50), 3),
+        "p90": round(percentile(sorted_latencies, 90), 3),
+        "p95": round(percentile(sorted_latencies, 95), 3),
+        "p99": round(percentile(sorted_latencies, 99), 3),
+        "max": round(sorted_latencies[-1], 3),
+    }
+
+
+# --- сервер приложения -----------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app_server(port: int, stub_url: str, db_path: str, extra_env: Dict[str, str]) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "URL": f"{stub_url}/gpt",
+        "YANDEX_KEY_ID": "stub",
+        "YANDEX_SECRET_KEY": "stub",
+        "YANDEX_FOLDER_ID": "stub",
+        "TRANSLATER_API_KEY": "stub",
+        "TRANSLATER_FOLDER_ID": "stub",
+        "TRANSLATE_API_URL": f"{stub_url}/translate",
+        "TTS_BASE_URL": stub_url,
+    })
+    env.update(extra_env)
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "--no-access-log",
+    ]
+    return subprocess.Popen(command, cwd=PROJECT_ROOT, env=env)
+
+
+async def wait_for_health(base_url: str, process: Optional[subprocess.Popen], timeout: float):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"Сервер завершился с кодом {process.returncode}")
+            try:
+                async with session.get(f"{base_url}/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError("Сервер не ответил на /health")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict:
+    images = load_images(args.images)
+    mix = parse_mix(args.mix)
+
+    stub_runner, stub_url = await start_stub_server(config_from_args(args))
+    process = None
+    workdir = tempfile.TemporaryDirectory(prefix="vibetel-bench-")
+    try:
+        if args.base_url:
+            base_url = args.base_url
+        else:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            extra_env = dict(item.split("=", 1) for item in args.env)
+            process = start_app_server(port, stub_url, os.path.join(workdir.name, "bench.db"), extra_env)
+        await wait_for_health(base_url, process, args.startup_timeout)
+
+        sampler = ProcessTreeSampler(process.pid) if process is not None else None
+        stop_sampling = asyncio.Event()
+        sampler_task = asyncio.create_task(sampler.run(stop_sampling)) if sampler else None
+
+        generator = LoadGenerator(base_url, images, mix, args.seed)
+        duration = await generator.run(args.concurrency, args.warmup, args.duration, args.request_timeout)
+
+        stop_sampling.set()
+        if sampler_task:
+            await sampler_task
+
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "images": [name for name, _, _ in images],
+            },
+            "config": {
+                "duration_s": args.duration,
+                "warmup_s": args.warmup,
+                "concurrency": args.concurrency,
+                "mix": mix,
+                "upstream_latency_ms": {
+                    "gpt": [args.gpt_latency_ms, args.gpt_jitter_ms],
+                    "translate": [args.translate_latency_ms, args.translate_jitter_ms],
+                    "tts": [args.tts_latency_ms, args.tts_jitter_ms],
+                },
+                "upstream_error_rate": args.upstream_error_rate,
+                "server_env": args.env,
+            },
+            **generator.report(duration),
+            "resources": sampler.report(duration) if sampler else {"available": False},
+        }
+        return report
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        await stub_runner.cleanup()
+        workdir.cleanup()
+
+
+def compare_reports(old_path: str, new_path: str):
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    print(f"{'endpoint':32} {'metric':14} {old['meta']['commit']:>12} {new['meta']['commit']:>12} {'change':>9}")
+    names = sorted(set(old["endpoints"]) | set(new["endpoints"])) + ["total"]
+    for name in names:
+        old_data = old["total"] if name == "total" else old["endpoints"].get(name, {})
+        new_data = new["total"] if name == "total" else new["endpoints"].get(name, {})
+        rows = [("throughput_rps", old_data.get("throughput_rps"), new_data.get("throughput_rps"))]
+        for key in ("p50", "p99"):
+            rows.append((f"{key}_ms", old_data.get("latency_ms", {}).get(key), new_data.get("latency_ms", {}).get(key)))
+        for metric, before, after in rows:
+            change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else "n/a"
+            print(f"{name:32} {metric:14} {before if before is not None else '-':>12} "
+                  f"{after if after is not None else '-':>12} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест VibeTel API с локальными заглушками")
+    parser.add_argument("--duration", type=float, default=30, help="Длительность измерения, сек")
+    parser.add_argument("--warmup", type=float, default=5, help="Прогрев (не попадает в отчет), сек")
+    parser.add_argument("--concurrency", type=int, default=16, help="Число параллельных клиентов")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Веса эндпоинтов: имя=вес,...")
+    parser.add_argument("--images", help="Каталог с образцами изображений (jpg/png/webp)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--request-timeout", type=float, default=60)
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--base-url", help="Нагружать уже запущенный сервер (заглушки он должен видеть сам)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Дополнительные переменные окружения сервера")
+    parser.add_argument("--output", help="Путь к JSON отчету (по умолчанию benchmarks/results/)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Сравнить два отчета и выйти")
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_reports(*args.compare)
+        return
+
+    report = asyncio.run(run_benchmark(args))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"load-{report['meta']['commit']}-{int(time.time())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+
+    for name, data in report["endpoints"].items():
+        latency = data["latency_ms"]
+        print(f"{name:32} {data['throughput_rps']:8.2f} rps  p50 {latency.get('p50', 0):8.1f} ms  "
+              f"p99 {latency.get('p99', 0):8.1f} ms  errors {data['errors']}")
+    print(f"Отчет: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""Микробенчмарки CPU-пути: декодирование изображений и детекция.
+
+Этапы:
+- decode/<формат>/<разрешение>: ImageProcessor.decode для JPEG/PNG/WEBP
+  с EXIF-поворотом (orientation=6, как у снимков с телефона);
+- decoder/<бэкенд>/<формат>/<разрешение>: отдельные бэкенды (Pillow, OpenCV, libjpeg-turbo)
+  в полном размере, без поворота;
+- decode/<вариант>/<разрешение>: GIF и PNG с палитрой, 1-битный и 16-битный PNG через
+  ImageProcessor.decode и Pillow с уменьшением при декодировании (ошибка прерывает запуск);
+- inference/<модель>: YOLOService._run_inference для обеих поставляемых моделей;
+- postprocess: нормализация bbox и перевод классов (YOLOService._postprocess);
+- translate_class_names: поиск по словарю classes.txt.
+
+Для каждого этапа - медиана/p90 времени и пиковая память: tracemalloc (Python и numpy)
+и прирост пикового RSS процесса (Linux, учитывает буферы Pillow и модели).
+
+Базовая линия сохраняется в benchmarks/baselines/micro.json (--save-baseline); --check
+завершится с кодом 1, если медиана или память этапа выросли больше порога.
+
+Запуск из корня проекта:
+    python -m benchmarks.micro_bench --save-baseline
+    python -m benchmarks.micro_bench --check --threshold 0.15
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_BASELINE = PROJECT_ROOT / "benchmarks" / "baselines" / "micro.json"
+DEFAULT_RESOLUTIONS = "4032x3024,1920x1440"
+EXIF_ORIENTATION_TAG = 0x0112
+
+# Классы, которые чаще всего встречаются в детекциях (для этапа перевода)
+SAMPLE_CLASSES = ["person", "chair", "cup", "book", "cell phone", "dining table", "cat", "dog", "laptop", "bottle"]
+
+
+# --- входные данные --------------------------------------------------------------
+
+def make_photo(width: int, height: int) -> Image.Image:
+    """Синтетический "снимок": плавный градиент с шумом, сжимается как реальное фото"""
+    rng = np.random.default_rng(width * height)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    base = np.stack([(x + y) / 2, np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width))], axis=-1)
+    noise = rng.normal(0, 12, size=(height, width, 3)).astype(np.float32)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+
+
+def mode_variants(photo: Image.Image) -> Dict[str, bytes]:
+    """Изображения в режимах, которые Pillow не уменьшает напрямую (P, 1, I;16)"""
+    variants = {}
+    for name, fmt, image in (
+        ("gif-p", "GIF", photo.quantize(256)),
+        ("png-p", "PNG", photo.quantize(256)),
+        ("png-1", "PNG", photo.convert("1")),
+        ("png-i16", "PNG", Image.fromarray(np.asarray(photo.convert("L"), dtype=np.uint16) * 257)),
+    ):
+        buffer = io.BytesIO()
+        image.save(buffer, fmt)
+        variants[name] = buffer.getvalue()
+    return variants
+
+
+def encode(image: Image.Image, fmt: str) -> bytes:
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION_TAG] = 6
+    buffer = io.BytesIO()
+    options = {"quality": 90} if fmt in ("JPEG", "WEBP") else {}
+    image.save(buffer, fmt, exif=exif.tobytes(), **options)
+    return buffer.getvalue()
+
+
+class _FakeTensor:
+    def __init__(self, array: np.ndarray):
+        self._array = array
+
+    def tolist(self):
+        return self._array.tolist()
+
+
+class _FakeBoxes:
+    """Повторяет интерфейс ultralytics Boxes, используемый в _postprocess"""
+
+    def __init__(self, count: int, width: int, height: int, num_classes: int):
+        rng = np.random.default_rng(count)
+        x1 = rng.uniform(0, width * 0.8, count)
+        y1 = rng.uniform(0, height * 0.8, count)
+        self.xyxy = _FakeTensor(np.stack([x1, y1, x1 + width * 0.2, y1 + height * 0.2], axis=1))
+        self.conf = _FakeTensor(rng.uniform(0.25, 1.0, count))
+        self.cls = _FakeTensor(rng.integers(0, num_classes, count).astype(np.float32))
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+
+class _FakeResult:
+    def __init__(self, boxes: _FakeBoxes):
+        self.boxes = boxes
+
+
+# --- измерение -------------------------------------------------------------------
+
+def _read_status_kb(field: str) -> Optional[int]:
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    """Сбрасывает VmHWM (Linux >= 4.0); без этого пик RSS накапливается за весь процесс"""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def measure(func: Callable[[], object], iterations: int, warmup: int) -> Dict:
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    # Память снимается отдельным прогоном: tracemalloc заметно замедляет выполнение
+    rss_before = _read_status_kb("VmRSS") if _reset_peak_rss() else None
+    tracemalloc.start()
+    func()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_peak = _read_status_kb("VmHWM") if rss_before is not None else None
+
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "median_ms": round(statistics.median(timings), 4),
+        "p90_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.9))], 4),
+        "min_ms": round(timings[0], 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+        "tracemalloc_peak_kb": round(traced_peak / 1024, 1),
+        "rss_peak_delta_kb": max(0, rss_peak - rss_before) if rss_peak is not None else None,
+    }
+
+
+# --- этапы ---------------------------------------------------------------------------
+
+def decode_stages(resolutions: List[tuple]) -> Dict[str, Callable]:
+    from app.utils.image_decoders import reduction_factor
+    from app.utils.image_processor import ImageProcessor
+
+    processor = ImageProcessor()
+    stages = {}
+    for width, height in resolutions:
+        photo = make_photo(width, height)
+        for fmt in ("JPEG", "PNG", "WEBP"):
+            data = encode(photo, fmt)
+            stages[f"decode/{fmt.lower()}/{width}x{height}"] = (
+                lambda data=data: processor.decode(data)
+            )
+            for name, decoder in processor.decoders.decoders.items():
+                if fmt in decoder.formats:
+                    stages[f"decoder/{name}/{fmt.lower()}/{width}x{height}"] = (
+                        lambda data=data, decoder=decoder: decoder.decode(data)
+                    )
+        # Регрессия: уменьшение при декодировании не должно падать на палитре и 16 битах
+        pillow = processor.decoders.decoders["pillow"]
+        factor = reduction_factor(width, height, processor.max_side)
+        for variant, data in mode_variants(photo).items():
+            stages[f"decode/{variant}/{width}x{height}"] = lambda data=data: processor.decode(data)
+            stages[f"decoder/pillow/{variant}/{width}x{height}"] = (
+                lambda data=data: pillow.decode(data, factor)
+            )
+    return stages
+
+
+def detection_stages(models: List[str], resolutions: List[tuple]) -> Dict[str, Callable]:
+    try:
+        from app.services.yolo_service import YOLOService, LOCAL_MODEL_PATH, SERVER_MODEL_PATH
+    except ImportError as e:
+        print(f"Пропуск этапов детекции: {e}", file=sys.stderr)
+        return {}
+
+    from app.utils.image_processor import ImageProcessor
+
+    width, height = resolutions[0]
+    image = ImageProcessor().decode(encode(make_photo(width, height), "JPEG"))
+
+    stages = {}
+    services = []
+    for model_path in models or [LOCAL_MODEL_PATH, SERVER_MODEL_PATH]:
+        try:
+            service = YOLOService(model_path=model_path)
+        except Exception as e:
+            print(f"Пропуск модели {model_path}: {e}", file=sys.stderr)
+            continue
+        services.append(service)
+        stages[f"inference/{model_path.rstrip('/')}"] = lambda service=service: service._run_inference(image.pixels)
+
+    if services:
+        service = services[0]
+        results = [_FakeResult(_FakeBoxes(10, width, height, len(service.model.names)))]
+        stages["postprocess/10"] = lambda: service._postprocess(results, width, height)
+        stages["translate_class_names/10"] = lambda: service.translate_class_names(SAMPLE_CLASSES)
+
+    return stages
+
+
+# --- базовая линия -----------------------------------------------------------------
+
+def check_regressions(results: Dict, baseline: Dict, threshold: float, memory_threshold: float) -> List[str]:
+    problems = []
+    for stage, current in results["stages"].items():
+        base = baseline["stages"].get(stage)
+        if not base:
+            continue
+        if base["median_ms"] and current["median_ms"] > base["median_ms"] * (1 + threshold):
+            problems.append(
+                f"{stage}: медиана {current['median_ms']:.3f} ms против {base['median_ms']:.3f} ms "
+                f"(+{(current['median_ms'] / base['median_ms'] - 1) * 100:.1f}%)"
+            )
+        for key in ("tracemalloc_peak_kb", "rss_peak_delta_kb"):
+            before, after = base.get(key), current.get(key)
+            # Мелкие значения шумят - сравниваем только от 1 МБ
+            if before and after is not None and before >= 1024 and after > before * (1 + memory_threshold):
+                problems.append(f"{stage}: {key} {after} KB против {before} KB")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки декодирования и детекции")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--resolutions", default=DEFAULT_RESOLUTIONS, help="Список ШxВ через запятую")
+    parser.add_argument("--models", default="",
+                        help="Модели YOLO через запятую (по умолчанию обе поставляемые)")
+    parser.add_argument("--stages", help="Запускать только этапы, содержащие подстроку")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true", help="Сохранить результаты как базовую линию")
+    parser.add_argument("--check", action="store_true", help="Сравнить с базовой линией, код 1 при регрессии")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Допустимый рост медианы (доля)")
+    parser.add_argument("--memory-threshold", type=float, default=0.25, help="Допустимый рост памяти (доля)")
+    parser.add_argument("--output", help="Дополнительно записать результаты в JSON")
+    args = parser.parse_args()
+
+    resolutions = [tuple(int(v) for v in item.lower().split("x")) for item in args.resolutions.split(",")]
+    models = [model for model in args.models.split(",") if model]
+
+    stages = {**decode_stages(resolutions), **detection_stages(models, resolutions)}
+    if args.stages:
+        stages = {name: func for name, func in stages.items() if args.stages in name}
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "stages": {},
+    }
+    for name, func in stages.items():
+        results["stages"][name] = stats = measure(func, args.iterations, args.warmup)
+        rss = stats["rss_peak_delta_kb"]
+        print(f"{name:40} median {stats['median_ms']:10.3f} ms  p90 {stats['p90_ms']:10.3f} ms  "
+              f"heap {stats['tracemalloc_peak_kb']:10.1f} KB  rss {rss if rss is not None else '-':>8} KB")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2))
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(results, ensure_ascii=False, indent=2))
+        print(f"Базовая линия сохранена: {baseline_path}")
+
+    if args.check:
+        if not baseline_path.exists():
+            print(f"Нет базовой линии: {baseline_path} (запустите с --save-baseline)", file=sys.stderr)
+            sys.exit(2)
+        problems = check_regressions(
+            results, json.loads(baseline_path.read_text()), args.threshold, args.memory_threshold
+        )
+        if problems:
+            print("Регрессии относительно базовой линии:", file=sys.stderr)
+            for problem in problems:
+                print(f"  {problem}", file=sys.stderr)
+            sys.exit(1)
+        print("Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Локальные заглушки внешних сервисов для нагрузочных тестов.
+
+- POST /gpt          - YandexGPT completion API (REST формат)
+- POST /translate    - Yandex Translate v2
+- GET  /listening/   - TTS сервис (wav_base64)
+
+Задержка каждого сервиса настраивается: базовое значение + равномерный джиттер.
+Запуск отдельно: python -m benchmarks.stub_upstreams --port 9100 --gpt-latency-ms 800
+"""
+import argparse
+import asyncio
+import base64
+import random
+from dataclasses import dataclass
+
+from aiohttp import web
+
+STUB_SENTENCES = [
+    "Кот спит на стуле",
+    "Мама держит мобильный телефон",
+    "На столе лежат чашка и книга",
+    "Папа читает книгу дома",
+]
+
+# Короткий валидный WAV (44 байта заголовка + тишина)
+_SILENT_WAV = (
+    b"RIFF" + (36 + 1600).to_bytes(4, "little") + b"WAVEfmt "
+    + (16).to_bytes(4, "little") + (1).to_bytes(2, "little") + (1).to_bytes(2, "little")
+    + (8000).to_bytes(4, "little") + (16000).to_bytes(4, "little")
+    + (2).to_bytes(2, "little") + (16).to_bytes(2, "little")
+    + b"data" + (1600).to_bytes(4, "little") + b"\x00" * 1600
+)
+SILENT_WAV_BASE64 = base64.b64encode(_SILENT_WAV).decode("ascii")
+
+
+@dataclass
+class Latency:
+    base_ms: float = 0.0
+    jitter_ms: float = 0.0
+
+    async def wait(self):
+        delay = self.base_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+
+@dataclass
+class StubConfig:
+    gpt: Latency
+    translate: Latency
+    tts: Latency
+    error_rate: float = 0.0
+
+
+def create_app(config: StubConfig) -> web.Application:
+    def maybe_fail():
+        if config.error_rate and random.random() < config.error_rate:
+            raise web.HTTPServiceUnavailable(text="stub: injected error")
+
+    async def gpt(request: web.Request) -> web.Response:
+        await request.json()
+        await config.gpt.wait()
+        maybe_fail()
+        return web.json_response({
+            "result": {
+                "alternatives": [{
+                    "message": {"role": "assistant", "text": random.choice(STUB_SENTENCES)},
+                    "status": "ALTERNATIVE_STATUS_FINAL"
+                }],
+                "usage": {"inputTextTokens": "0", "completionTokens": "0", "totalTokens": "0"},
+                "modelVersion": "stub"
+            }
+        })
+
+    async def translate(request: web.Request) -> web.Response:
+        body = await request.json()
+        await config.translate.wait()
+        maybe_fail()
+        target = body.get("targetLanguageCode", "tt")
+        return web.json_response({
+            "translations": [{"text": f"[{target}] {text}"} for text in body.get("texts", [])]
+        })
+
+    async def listening(request: web.Request) -> web.Response:
+        await config.tts.wait()
+        maybe_fail()
+        return web.json_response({"wav_base64": SILENT_WAV_BASE64})
+
+    app = web.Application()
+    app.router.add_post("/gpt", gpt)
+    app.router.add_post("/translate", translate)
+    app.router.add_get("/listening/", listening)
+    return app
+
+
+async def start_stub_server(config: StubConfig, host: str = "127.0.0.1", port: int = 0):
+    """Запускает заглушки в текущем event loop; возвращает (runner, base_url)"""
+    runner = web.AppRunner(create_app(config), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}"
+
+
+def add_latency_arguments(parser: argparse.ArgumentParser):
+    for name, default in (("gpt", 800.0), ("translate", 80.0), ("tts", 300.0)):
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=default,
+                            help=f"Базовая задержка заглушки {name}")
+        parser.add_argument(f"--{name}-jitter-ms", type=float, default=default * 0.25,
+                            help=f"Равномерный джиттер заглушки {name}")
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0,
+                        help="Доля ответов 503 от заглушек")
+
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        gpt=Latency(args.gpt_latency_ms, args.gpt_jitter_ms),
+        translate=Latency(args.translate_latency_ms, args.translate_jitter_ms),
+        tts=Latency(args.tts_latency_ms, args.tts_jitter_ms),
+        error_rate=args.upstream_error_rate,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушки YandexGPT, Yandex Translate и TTS")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(create_app(config_from_args(args)), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
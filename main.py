@@ -1,37 +1,82 @@
 import os
+import asyncio
 import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+import time
+from typing import Any, Dict, Tuple
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Depends, Request, Header, Body
+from pydantic import ValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from dotenv import load_dotenv
 
-from app.services.yolo_service import YOLOService
+from app.services.yolo_service import YOLOService, configure_inference_threads
 from app.services.yandex_gpt_service import YandexGPTService
 from app.services.translator_service import TranslatorService
 from app.services.database_service import DatabaseService
+from app.services.local_generator_service import LocalSentenceGenerator
+from app.services.retention_service import RetentionService
+from app.services.idempotency_service import IdempotencyService, request_fingerprint
+from app.services.pipeline_service import PipelineService
+from app.services.job_queue_service import JobQueueService, QueueFullError
 from app.models.responses import (
     ProcessImageResponse, SentencesResponse, TranslationDirectionResponse,
     TranslationDirectionRequest, ObjectsResponse, SentenceGenerationRequest,
     SentenceGenerationResponse, TranslationRequest, TranslationResponse, AudioRequest, AudioResponse,
-    BilingualSentenceResponse, AlbumMemoryRequest, AlbumMemoryResponse
+    BilingualSentenceRequest, TranslationBatchRequest, TranslationBatchResponse,
+    BilingualSentenceResponse, AlbumMemoryRequest, AlbumMemoryResponse, TopObjectsResponse, ModelDeployRequest,
+    JobSubmitResponse, JobResponse
 )
+from app.models.detection import encode_detections
 from app.utils.image_processor import ImageProcessor
+from app.utils.fast_json import FastJSONResponse, sentence_records
+from app.utils.http_cache import cached_json, response_cache, CompressionMiddleware
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.http_metrics import MetricsMiddleware
+from app.utils import metrics
+from app.utils.tracing import RequestTracingMiddleware, trace_store
+from app.utils.deadline import DeadlineMiddleware, DeadlineExceeded, degraded_stages
+from app.utils.performance import performance, gpt_limiter, translate_limiter, tts_limiter
+from app.utils.admission import AdmissionMiddleware, admission, INFERENCE, GPT, TRANSLATE, TTS
+from app.utils.profiler import profiler
+from app.utils.log_pipeline import configure_logging
+from app.utils.admin import require_admin
+from app.utils.shared_state import maintenance_owner, data_version, translation_direction, model_config
 from app.services import audio_generator
+from app.config import settings
 
 load_dotenv()
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # При prefork lifespan выполняется в каждом воркере уже после fork
+    configure_inference_threads(settings.inference_threads)
+    await image_processor.select_decoders()
     await database_service.init_db()
+    await local_generator.start()
+    await idempotency_service.start()
+    await job_queue_service.start()
+    background_tasks = []
+    # Фоновое обслуживание базы - только в одном воркере
+    if maintenance_owner.claim():
+        background_tasks = [
+            asyncio.create_task(database_service.run_statistics_reconciler(settings.stats_reconcile_interval)),
+            asyncio.create_task(retention_service.run())
+        ]
     yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    if background_tasks:
+        maintenance_owner.release()
+    await job_queue_service.close()
+    await idempotency_service.close()
     await database_service.close()
+    image_processor.close()
 
 
 app = FastAPI(
@@ -41,6 +86,20 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Внутри остальных: отказ 503 проходит через CORS, метрики и трассировку.
+# Дорогие эндпоинты и классы ресурсов, которые они занимают; остальные (и /jobs) принимаются всегда.
+# Повтор /process-image с Idempotency-Key допускается в эндпоинте после поиска ключа
+PROCESS_IMAGE_RESOURCES = (INFERENCE, GPT, TRANSLATE)
+app.add_middleware(AdmissionMiddleware, idempotent={"/process-image"}, routes={
+    "/process-image": PROCESS_IMAGE_RESOURCES,
+    "/extract-objects": (INFERENCE, TRANSLATE),
+    "/generate-sentence": (GPT,),
+    "/generate-sentence-bilingual": (GPT, TRANSLATE),
+    "/generate-album-memory": (GPT, TRANSLATE),
+    "/translate": (TRANSLATE,),
+    "/translate/batch": (TRANSLATE,),
+    "/audio": (TTS,)
+})
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -48,12 +107,36 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_min_size)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestTracingMiddleware)
+# Снаружи остальных: бюджет отсчитывается от входа запроса
+app.add_middleware(DeadlineMiddleware)
 
 yolo_service = YOLOService()
-yandex_gpt_service = YandexGPTService()
-translator_service = TranslatorService()
 database_service = DatabaseService()
+local_generator = LocalSentenceGenerator(database_service)
+yandex_gpt_service = YandexGPTService(local_generator, database_service.context_selector)
+translator_service = TranslatorService()
+retention_service = RetentionService(database_service)
+idempotency_service = IdempotencyService(database_service)
 image_processor = ImageProcessor()
+pipeline_service = PipelineService(
+    yolo_service, yandex_gpt_service, translator_service, database_service, image_processor
+)
+job_queue_service = JobQueueService(database_service)
+job_queue_service.register(
+    'process_image',
+    lambda params, payload: pipeline_service.process_image(
+        payload, params['detections_format'], params.get('source_language'), params.get('target_language')
+    )
+)
+job_queue_service.register(
+    'album_memory',
+    lambda params, payload: pipeline_service.album_memory(
+        params['objects'], params['album_theme'], params.get('source_language'), params.get('target_language')
+    )
+)
 
 
 @app.get("/")
@@ -61,70 +144,77 @@ async def root():
     return {"message": "VibeTel API работает!"}
 
 
-@app.post("/process-image", response_model=ProcessImageResponse)
-async def process_image(file: UploadFile = File(..., description="Изображение для обработки (без ограничений размера)")):
-    try:
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="Файл должен быть изображением")
+DETECTIONS_FORMAT = Query(
+    "objects", pattern="^(objects|compact)$",
+    description="objects - список детекций, compact - параллельные массивы class_ru/confidence/bbox"
+)
+SOURCE_LANGUAGE = Query(None, description="Исходный язык перевода (по умолчанию - из /translator/direction)")
+TARGET_LANGUAGE = Query(None, description="Язык перевода (по умолчанию - из /translator/direction)")
 
-        image_data = await file.read()
 
-        image = await image_processor.process_uploaded_image(image_data)
+def _check_languages(*language_codes: str):
+    supported_languages = translator_service.get_supported_languages()
+    for language_code in language_codes:
+        if language_code is not None and language_code not in supported_languages:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Неподдерживаемый язык {language_code}. Доступные языки: {list(supported_languages.keys())}"
+            )
 
-        # Получаем детекции с координатами
-        detections = await yolo_service.classify_objects(image)
-        if not detections:
-            raise HTTPException(status_code=400, detail="Объекты на изображении не обнаружены")
 
-        # Список уникальных русских названий объектов по убыванию уверенности
-        objects_ru = []
-        for d in detections:
-            name = d.get('class_ru')
-            if name and name not in objects_ru:
-                objects_ru.append(name)
+def _request_direction(source_language: str = None, target_language: str = None) -> Tuple[str, str]:
+    """Направление перевода для запроса: переданные языки или текущие по умолчанию"""
+    _check_languages(source_language, target_language)
+    return translator_service.resolve_direction(source_language, target_language)
 
-        previous_sentences = await database_service.get_recent_sentences(limit=10)
 
-        sentence_data = await yandex_gpt_service.generate_sentence(
-            objects=objects_ru,
-            previous_sentences=previous_sentences
-        )
+@app.post("/process-image", response_model=ProcessImageResponse)
+async def process_image(
+    file: UploadFile = File(..., description="Изображение для обработки (без ограничений размера)"),
+    detections_format: str = DETECTIONS_FORMAT,
+    source_language: str = SOURCE_LANGUAGE,
+    target_language: str = TARGET_LANGUAGE,
+    idempotency_key: str = Header(
+        None, max_length=255,
+        description="Повтор запроса с тем же ключом вернет сохраненный ответ без повторной обработки"
+    )
+):
+    if not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="Файл должен быть изображением")
 
-        # Переводим с русского на татарский
-        objects_tt = await translator_service.translate_multiple(objects_ru)
-        sentence_tt = await translator_service.translate_text(sentence_data["sentence"])
-        target_word_tt = await translator_service.translate_text(sentence_data["target_word"])
+    direction = _request_direction(source_language, target_language)
+    image_data = await file.read()
 
-        await database_service.save_sentence(
-            sentence=sentence_data["sentence"],
-            target_word=sentence_data["target_word"],
-            objects=objects_ru
-        )
+    if not idempotency_key:
+        return await _process_image(image_data, detections_format, direction)
 
-        return ProcessImageResponse(
-            objects_ru=objects_ru,
-            objects_tt=objects_tt,
-            sentence_ru=sentence_data["sentence"],
-            sentence_tt=sentence_tt,
-            target_word_ru=sentence_data["target_word"],
-            target_word_tt=target_word_tt,
-            detections=detections,
-            image_width=image.width,
-            image_height=image.height
-        )
+    fingerprint = request_fingerprint(image_data, detections_format.encode(), ':'.join(direction).encode())
+    return await idempotency_service.execute(
+        idempotency_key, fingerprint, lambda: _admitted_process_image(image_data, detections_format, direction)
+    )
 
-    except HTTPException as e:
-        # Пробрасываем уже сформированные 4xx/5xx ошибки как есть
-        raise e
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка обработки: {str(e)}")
+
+async def _process_image(image_data: bytes, detections_format: str, direction: Tuple[str, str]):
+    return FastJSONResponse(await pipeline_service.process_image(image_data, detections_format, *direction))
+
+
+async def _admitted_process_image(image_data: bytes, detections_format: str, direction: Tuple[str, str]):
+    # Вызывается только при промахе по ключу: сохраненный ответ отдается и при перегрузке
+    async with admission.admitted(PROCESS_IMAGE_RESOURCES):
+        return await _process_image(image_data, detections_format, direction)
 
 
 # Новые разделенные ручки для фронта
 
 @app.post("/extract-objects", response_model=ObjectsResponse)
-async def extract_objects(file: UploadFile = File(..., description="Изображение для извлечения объектов (без ограничений размера)")):
+async def extract_objects(
+    file: UploadFile = File(..., description="Изображение для извлечения объектов (без ограничений размера)"),
+    detections_format: str = DETECTIONS_FORMAT,
+    source_language: str = SOURCE_LANGUAGE,
+    target_language: str = TARGET_LANGUAGE
+):
     """Ручка для выделения объектов из изображения с координатами bbox"""
+    source_lang, target_lang = _request_direction(source_language, target_language)
     try:
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="Файл должен быть изображением")
@@ -139,24 +229,31 @@ async def extract_objects(file: UploadFile = File(..., description="Изобра
         # Список уникальных русских названий объектов по убыванию уверенности
         objects_ru = []
         for d in detections:
-            name = d.get('class_ru')
+            name = d.class_ru
             if name and name not in objects_ru:
                 objects_ru.append(name)
 
-        # Перевод объектов на татарский
-        objects_tt = await translator_service.translate_multiple(objects_ru)
-
-        return ObjectsResponse(
-            objects=objects_ru,
-            objects_tt=objects_tt,
-            detections=detections,
-            image_width=image.width,
-            image_height=image.height
-        )
+        # Перевод объектов (по умолчанию на татарский)
+        objects_tt = await translator_service.translate_multiple(objects_ru, target_lang, source_lang)
+
+        return FastJSONResponse({
+            "objects": objects_ru,
+            "objects_tt": objects_tt,
+            "detections": encode_detections(detections, detections_format),
+            "image_width": image.width,
+            "image_height": image.height,
+            "bbox_format": "xyxy",
+            "normalized": True,
+            "source_language": source_lang,
+            "target_language": target_lang,
+            "degraded_stages": degraded_stages()
+        })
 
     except HTTPException as e:
         # Пробрасываем 4xx ошибки, чтобы не превращались в 500
         raise e
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка обработки: {str(e)}")
 
@@ -168,24 +265,24 @@ async def generate_sentence(request: SentenceGenerationRequest):
         if not request.objects:
             raise HTTPException(status_code=400, detail="Список объектов не может быть пустым")
 
-        previous_sentences = request.previous_sentences if request.previous_sentences else await database_service.get_recent_sentences(
-            limit=10)
-
+        # Без истории клиента контекст выбирается из последних сохраненных предложений
         sentence_data = await yandex_gpt_service.generate_sentence(
             objects=request.objects,
-            previous_sentences=previous_sentences
+            previous_sentences=request.previous_sentences or None
         )
 
         # Сохраняем предложение в базу данных
         await database_service.save_sentence(
             sentence=sentence_data["sentence"],
             target_word=sentence_data["target_word"],
-            objects=request.objects
+            objects=request.objects,
+            source=sentence_data.get("source")
         )
 
         return SentenceGenerationResponse(
             sentence=sentence_data["sentence"],
-            target_word=sentence_data["target_word"]
+            target_word=sentence_data["target_word"],
+            degraded_stages=degraded_stages()
         )
 
     except Exception as e:
@@ -194,37 +291,51 @@ async def generate_sentence(request: SentenceGenerationRequest):
 
 # Новый эндпоинт: сразу русское и татарское предложение
 @app.post("/generate-sentence-bilingual", response_model=BilingualSentenceResponse)
-async def generate_sentence_bilingual(request: SentenceGenerationRequest):
+async def generate_sentence_bilingual(request: BilingualSentenceRequest):
+    source_lang, target_lang = _request_direction(request.source_language, request.target_language)
     try:
         if not request.objects:
             raise HTTPException(status_code=400, detail="Список объектов не может быть пустым")
 
-        previous_sentences = request.previous_sentences if request.previous_sentences else await database_service.get_recent_sentences(limit=10)
-
+        # Без истории клиента контекст выбирается из последних сохраненных предложений
         sentence_data = await yandex_gpt_service.generate_sentence(
             objects=request.objects,
-            previous_sentences=previous_sentences
+            previous_sentences=request.previous_sentences or None
         )
 
         sentence_ru = sentence_data["sentence"]
         target_word_ru = sentence_data["target_word"]
 
-        # Перевод в соответствии с текущими настройками TranslatorService
-        sentence_tt = await translator_service.translate_text(sentence_ru)
-        target_word_tt = await translator_service.translate_text(target_word_ru)
+        # Предложение и слово переводятся одним запросом;
+        # у предложения из локального корпуса переводы уже есть
+        translated = await pipeline_service.translate_with_glossary(
+            [sentence_ru, target_word_ru],
+            sentence_data.get("translations", {}).get(target_lang, {}),
+            source_lang, target_lang
+        )
+        sentence_tt, target_word_tt = translated[sentence_ru], translated[target_word_ru]
+
+        translation = None
+        if sentence_data.get("source") == "yandex_gpt" and sentence_tt != sentence_ru:
+            translation = {"language": target_lang, "sentence": sentence_tt, "target_word": target_word_tt}
 
         # Сохраняем русскую версию в БД
         await database_service.save_sentence(
             sentence=sentence_ru,
             target_word=target_word_ru,
-            objects=request.objects
+            objects=request.objects,
+            source=sentence_data.get("source"),
+            translation=translation
         )
 
         return BilingualSentenceResponse(
             sentence_ru=sentence_ru,
             sentence_tt=sentence_tt,
             target_word_ru=target_word_ru,
-            target_word_tt=target_word_tt
+            target_word_tt=target_word_tt,
+            source_language=source_lang,
+            target_language=target_lang,
+            degraded_stages=degraded_stages()
         )
 
     except Exception as e:
@@ -233,41 +344,86 @@ async def generate_sentence_bilingual(request: SentenceGenerationRequest):
 
 @app.post("/generate-album-memory", response_model=AlbumMemoryResponse)
 async def generate_album_memory(request: AlbumMemoryRequest):
-    try:
-        if not request.objects:
-            raise HTTPException(status_code=400, detail="Список объектов не может быть пустым")
-        
-        if len(request.objects) < 2:
-            raise HTTPException(status_code=400, detail="Для альбома нужно минимум 2 объекта")
-
-        memory_data = await yandex_gpt_service.generate_album_memory(
-            objects=request.objects,
-            album_theme=request.album_theme,
-        )
+    source_lang, target_lang = _request_direction(request.source_language, request.target_language)
+    return await pipeline_service.album_memory(request.objects, request.album_theme, source_lang, target_lang)
 
-        memory_ru = memory_data["memory"]
-        used_objects = memory_data["used_objects"]
 
-        # Переводим абзац на татарский
-        memory_tt = await translator_service.translate_text(memory_ru)
+def _job_accepted(job_id: str) -> FastJSONResponse:
+    return FastJSONResponse({
+        "job_id": job_id,
+        "state": "queued",
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events"
+    }, status_code=202, headers={"Location": f"/jobs/{job_id}"})
 
-        # Сохраняем русскую версию в БД как специальное воспоминание альбома
-        await database_service.save_sentence(
-            sentence=memory_ru,
-            target_word="album_memory",  # Специальный маркер для абзацев альбома
-            objects=used_objects
-        )
 
-        return AlbumMemoryResponse(
-            memory_ru=memory_ru,
-            memory_tt=memory_tt,
-            used_objects=used_objects
+async def _submit_job(kind: str, params: dict, payload: bytes = None) -> FastJSONResponse:
+    try:
+        job_id = await job_queue_service.submit(kind, params, payload)
+    except QueueFullError as e:
+        # Отказ сразу вместо таймаута: клиент повторит позже
+        raise HTTPException(
+            status_code=429, detail=str(e),
+            headers={"Retry-After": str(max(1, int(settings.job_poll_interval * 4)))}
         )
-
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка генерации воспоминания альбома: {str(e)}")
+    return _job_accepted(job_id)
+
+
+@app.post("/jobs/process-image", response_model=JobSubmitResponse, status_code=202)
+async def submit_process_image_job(
+    file: UploadFile = File(..., description="Изображение для обработки"),
+    detections_format: str = DETECTIONS_FORMAT,
+    source_language: str = SOURCE_LANGUAGE,
+    target_language: str = TARGET_LANGUAGE
+):
+    """Асинхронный /process-image: возвращает id задачи, результат - через /jobs/{job_id}"""
+    if not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="Файл должен быть изображением")
+
+    # Направление фиксируется при постановке задачи
+    source_lang, target_lang = _request_direction(source_language, target_language)
+    image_data = await file.read()
+    return await _submit_job('process_image', {
+        "detections_format": detections_format,
+        "source_language": source_lang,
+        "target_language": target_lang
+    }, image_data)
+
+
+@app.post("/jobs/album-memory", response_model=JobSubmitResponse, status_code=202)
+async def submit_album_memory_job(request: AlbumMemoryRequest):
+    """Асинхронный /generate-album-memory"""
+    source_lang, target_lang = _request_direction(request.source_language, request.target_language)
+    return await _submit_job('album_memory', {
+        "objects": request.objects,
+        "album_theme": request.album_theme,
+        "source_language": source_lang,
+        "target_language": target_lang
+    })
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=30, description="Long polling: ждать завершения до N секунд")):
+    job = await job_queue_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+
+    deadline = time.monotonic() + wait
+    while job['state'] not in ('done', 'failed') and time.monotonic() < deadline:
+        await job_queue_service.wait(job_id, deadline - time.monotonic())
+        job = await job_queue_service.get(job_id)
+
+    return FastJSONResponse(job)
+
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    """Server-Sent Events: событие при каждой смене состояния задачи, последнее - done/failed"""
+    return StreamingResponse(
+        job_queue_service.events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.post("/translate", response_model=TranslationResponse)
@@ -287,29 +443,117 @@ async def translate_text(request: TranslationRequest):
             original_text=request.text,
             translated_text=translated_text,
             source_language=request.source_language,
-            target_language=request.target_language
+            target_language=request.target_language,
+            degraded_stages=degraded_stages()
         )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка перевода: {str(e)}")
 
 
-@app.get("/sentences")
-async def get_sentences(limit: int = 20):
-    sentences = await database_service.get_sentences_with_details(limit=limit)
-    return SentencesResponse(sentences=sentences)
+@app.post("/translate/batch", response_model=TranslationBatchResponse)
+async def translate_batch(request: TranslationBatchRequest):
+    """Перевод нескольких текстов сразу на несколько языков: по одному запросу к API на язык"""
+    _check_languages(request.source_language, *request.target_languages)
+    source_lang, _ = translator_service.resolve_direction(request.source_language)
+
+    translations = await translator_service.translate_batch(request.texts, request.target_languages, source_lang)
+    return FastJSONResponse({
+        "source_language": source_lang,
+        "translations": translations,
+        "degraded_stages": degraded_stages()
+    })
+
+
+@app.get("/sentences", response_model=SentencesResponse)
+async def get_sentences(
+    request: Request,
+    limit: int = Query(20, ge=1, le=500),
+    cursor: str = Query(None, description="Курсор next_cursor из предыдущей страницы")
+):
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def produce():
+        sentences = await database_service.get_sentences_with_details(limit=limit, before=before)
+
+        next_cursor = None
+        if len(sentences) == limit:
+            last = sentences[-1]
+            next_cursor = encode_cursor(last['created_at'], last['id'])
+
+        return {"sentences": sentence_records(sentences), "next_cursor": next_cursor}
+
+    return await cached_json(request, data_version.tag, produce, last_modified=data_version.modified_at)
+
+
+@app.get("/sentences/export")
+async def export_sentences():
+    """Потоковый экспорт всех предложений в формате NDJSON"""
+    return StreamingResponse(
+        database_service.iter_sentences_ndjson(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="sentences.ndjson"'}
+    )
 
 
 @app.get("/sentences/search")
-async def search_sentences(word: str = Query(..., description="Слово для поиска"), limit: int = 10):
-    sentences = await database_service.get_sentences_by_word(word=word, limit=limit)
-    return {"sentences": sentences}
+async def search_sentences(request: Request, word: str = Query(..., description="Слово для поиска"), limit: int = 10):
+    async def produce():
+        return {"sentences": await database_service.get_sentences_by_word(word=word, limit=limit)}
+
+    return await cached_json(request, data_version.tag, produce, last_modified=data_version.modified_at)
+
+
+@app.get("/sentences/archive", response_model=SentencesResponse)
+async def get_archived_sentences(
+    word: str = Query(None, description="Фильтр по target_word"),
+    limit: int = Query(20, ge=1, le=500)
+):
+    """Предложения, перенесенные ретеншном в архив"""
+    sentences = await database_service.get_archived_sentences(word=word, limit=limit)
+    return FastJSONResponse({"sentences": sentence_records(sentences), "next_cursor": None})
+
+
+@app.get("/sentences/by-object", response_model=SentencesResponse)
+async def get_sentences_by_object(object: str = Query(..., description="Название объекта (как в objects)"), limit: int = 10):
+    sentences = await database_service.get_sentences_by_object(object_name=object, limit=limit)
+    return FastJSONResponse({"sentences": sentence_records(sentences), "next_cursor": None})
+
+
+@app.get("/objects/top", response_model=TopObjectsResponse)
+async def get_top_objects(hours: int = Query(24, ge=1, description="Окно в часах"), limit: int = 10):
+    objects = await database_service.get_top_objects(hours=hours, limit=limit)
+    return TopObjectsResponse(hours=hours, objects=objects)
 
 
 @app.get("/statistics")
-async def get_statistics():
-    stats = await database_service.get_statistics()
-    return stats
+async def get_statistics(request: Request):
+    # sentences_today считается по часовым бакетам - версия меняется и со сменой часа
+    hour_started = time.time() // 3600 * 3600
+    return await cached_json(
+        request,
+        f"{data_version.tag}.h{int(hour_started)}",
+        database_service.get_statistics,
+        last_modified=max(data_version.modified_at, hour_started)
+    )
+
+
+@app.get("/cache/stats")
+async def get_response_cache_stats():
+    """Кэш ответов GET-ручек и хранилище Idempotency-Key этого процесса"""
+    return {
+        "responses": response_cache.get_stats(),
+        "idempotency": idempotency_service.get_stats()
+    }
+
+
+@app.get("/database/pool")
+async def get_database_pool_stats():
+    """Состояние пула read-соединений и время ожидания свободного соединения"""
+    return database_service.get_pool_stats()
 
 
 @app.post("/translator/language")
@@ -330,14 +574,22 @@ async def set_translation_language(language_code: str = Query(..., description="
 
 
 @app.get("/translator/languages")
-async def get_supported_languages():
-    return translator_service.get_supported_languages()
+async def get_supported_languages(request: Request):
+    # Список статичен: меняется только с новой версией приложения (BOOT_ID в ETag)
+    async def produce():
+        return translator_service.get_supported_languages()
+
+    return await cached_json(request, "languages", produce, cache_control="public, max-age=3600")
 
 
 @app.get("/translator/direction", response_model=TranslationDirectionResponse)
-async def get_translation_direction():
-    direction = translator_service.get_translation_direction()
-    return TranslationDirectionResponse(**direction)
+async def get_translation_direction(request: Request):
+    async def produce():
+        return translator_service.get_translation_direction()
+
+    return await cached_json(
+        request, f"t{translation_direction.version}", produce, last_modified=translation_direction.modified_at
+    )
 
 
 @app.post("/translator/direction")
@@ -375,6 +627,9 @@ async def generate_audio(request: AudioRequest):
         return result
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except asyncio.TimeoutError:
+        # Таймаут TTS или исчерпанный бюджет запроса
+        raise HTTPException(status_code=504, detail="TTS сервис не ответил за отведенное время")
     except RuntimeError as e:
         # Ошибки внешнего TTS сервиса
         raise HTTPException(status_code=502, detail=str(e))
@@ -382,6 +637,120 @@ async def generate_audio(request: AudioRequest):
         raise HTTPException(status_code=500, detail=f"Ошибка генерации аудио: {str(e)}")
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Метрики в формате Prometheus"""
+    metrics.db_pool_in_use.set(database_service.get_pool_stats()['in_use'])
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/admin/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def profile_process(
+    seconds: float = Query(10, gt=0, le=120, description="Длительность профилирования"),
+    interval_ms: float = Query(10, ge=1, le=1000, description="Период сэмплирования")
+):
+    """Сэмплирующий профиль всех потоков в формате collapsed stacks (flamegraph.pl, speedscope)"""
+    if profiler.busy:
+        raise HTTPException(status_code=409, detail="Профилирование уже выполняется")
+
+    try:
+        folded = await asyncio.to_thread(profiler.profile, seconds, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return PlainTextResponse(folded)
+
+
+@app.get("/admin/traces", dependencies=[Depends(require_admin)])
+async def get_recent_traces(limit: int = Query(20, ge=1, le=1000)):
+    return {"traces": [trace.as_dict() for trace in trace_store.recent(limit)]}
+
+
+@app.get("/admin/traces/{request_id}", dependencies=[Depends(require_admin)])
+async def get_trace(request_id: str):
+    """Тайминги этапов запроса по его X-Request-ID"""
+    trace = trace_store.get(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Трасса не найдена")
+    return trace.as_dict()
+
+
+@app.get("/admin/model", dependencies=[Depends(require_admin)])
+async def get_model_info():
+    """Текущие модели YOLO, доля кандидата и статистика задержек/детекций по версиям"""
+    yolo_service.sync_models()
+    return yolo_service.get_model_info()
+
+
+def _set_models(primary: str, candidate: str = '', candidate_percent: int = 0):
+    try:
+        model_config.set(primary, candidate, candidate_percent)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Этот воркер начинает загрузку сразу, остальные - на ближайшем запросе
+    yolo_service.sync_models()
+    return yolo_service.get_model_info()
+
+
+@app.post("/admin/model", status_code=202, dependencies=[Depends(require_admin)])
+async def deploy_model(request: ModelDeployRequest):
+    """Загружает и прогревает модель в фоне; трафик переключается после готовности"""
+    primary, _, _, _ = model_config.get()
+    if request.traffic_percent == 100:
+        return _set_models(request.path)
+    return _set_models(primary, request.path, request.traffic_percent)
+
+
+@app.post("/admin/model/promote", dependencies=[Depends(require_admin)])
+async def promote_model():
+    """Кандидат становится основной моделью для всего трафика"""
+    _, candidate, _, _ = model_config.get()
+    if not candidate:
+        raise HTTPException(status_code=409, detail="Модель-кандидат не задана")
+    return _set_models(candidate)
+
+
+@app.delete("/admin/model/candidate", dependencies=[Depends(require_admin)])
+async def remove_candidate_model():
+    """Откат A/B: весь трафик возвращается на основную модель"""
+    primary, _, _, _ = model_config.get()
+    return _set_models(primary)
+
+
+def _performance_info() -> dict:
+    return {
+        "version": performance.version,
+        "config": performance.get().model_dump(),
+        "upstream_limits": {
+            limiter.name: limiter.get_stats() for limiter in (gpt_limiter, translate_limiter, tts_limiter)
+        },
+        "admission": admission.get_stats()
+    }
+
+
+@app.get("/admin/performance", dependencies=[Depends(require_admin)])
+async def get_performance_config():
+    """Текущие параметры производительности, загрузка лимитов внешних сервисов и контроль допуска"""
+    return _performance_info()
+
+
+@app.patch("/admin/performance", dependencies=[Depends(require_admin)])
+async def update_performance_config(changes: Dict[str, Any] = Body(..., examples=[{"yolo_imgsz": 480, "gpt_concurrency": 8}])):
+    """Меняет часть параметров на лету во всех воркерах; при ошибке проверки не меняется ничего"""
+    try:
+        performance.update(changes)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    return _performance_info()
+
+
+@app.delete("/admin/performance", dependencies=[Depends(require_admin)])
+async def reset_performance_config():
+    """Возврат к значениям из переменных окружения и умолчаниям"""
+    performance.reset()
+    return _performance_info()
+
+
 @app.get("/health")
 async def health_check():
     return {
@@ -389,6 +758,8 @@ async def health_check():
         "services": {
             "yolo": "OK" if yolo_service.model else "ERROR",
             "database": "OK" if database_service.connection else "ERROR",
-            "yandex_gpt": "OK" if yandex_gpt_service.sdk else "NOT_CONFIGURED"
-        }
+            "yandex_gpt": "OK" if yandex_gpt_service.configured else "NOT_CONFIGURED"
+        },
+        "image_decoders": image_processor.decoders.get_info(),
+        "local_generator": local_generator.get_stats()
     }
@@ -3,8 +3,13 @@
 Скрипт для запуска VibeTel API сервера
 """
 import os
+import gc
+import asyncio
 from dotenv import load_dotenv
 
+HOST = "0.0.0.0"
+PORT = 8000
+
 def check_environment():
     """Проверка переменных окружения"""
     load_dotenv()
@@ -33,20 +38,12 @@ def check_environment():
         print("Приложение будет работать с ограниченным функционалом")
         print("-" * 50)
 
-def main():
-    check_environment()
-
-    print("Запуск VibeTel API...")
-    print("Сервер будет доступен на: http://localhost:8000")
-    print("Документация API: http://localhost:8000/docs")
-    print("Для остановки нажмите Ctrl+C")
-    print("-" * 50)
-    
+def run_single():
     import uvicorn
     uvicorn.run(
         "main:app",
-        host="0.0.0.0",
-        port=8000,
+        host=HOST,
+        port=PORT,
         reload=False,
         log_level="info",
         # Увеличиваем лимиты для больших файлов
@@ -54,5 +51,64 @@ def main():
         timeout_keep_alive=30
     )
 
+
+def run_prefork(workers: int):
+    """Gunicorn + UvicornWorker с preload: модель и словарь классов загружаются
+    один раз в мастере, воркеры получают веса через copy-on-write после fork."""
+    from gunicorn.app.base import BaseApplication
+
+    def pre_fork(server, worker):
+        # Объекты мастера уходят в постоянное поколение GC: сборщик в воркерах
+        # не трогает их заголовки, и страницы с ними остаются общими
+        gc.freeze()
+
+    class PreforkApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{HOST}:{PORT}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "uvicorn.workers.UvicornWorker")
+            self.cfg.set("preload_app", True)
+            self.cfg.set("keepalive", 30)
+            self.cfg.set("max_requests", 1000)
+            self.cfg.set("max_requests_jitter", 100)
+            # Инференс на больших изображениях не должен приводить к перезапуску воркера
+            self.cfg.set("timeout", 120)
+            self.cfg.set("pre_fork", pre_fork)
+
+        def load(self):
+            import main
+            # Схема, миграции и статистика готовятся до fork, чтобы воркеры
+            # не выполняли их одновременно: после этого schema_ready, и init_db
+            # в lifespan воркера только открывает соединения; сами соединения закрываются до fork
+            asyncio.run(_prepare_database(main.database_service))
+            return main.app
+
+    PreforkApplication().run()
+
+
+async def _prepare_database(database_service):
+    await database_service.init_db()
+    await database_service.close()
+
+
+def main():
+    check_environment()
+
+    from app.config import settings
+    workers = max(1, settings.workers)
+
+    print("Запуск VibeTel API...")
+    print(f"Сервер будет доступен на: http://localhost:{PORT}")
+    print(f"Документация API: http://localhost:{PORT}/docs")
+    if workers > 1:
+        print(f"Воркеров: {workers}, потоков инференса на воркер: {settings.inference_threads or 'по умолчанию'}")
+    print("Для остановки нажмите Ctrl+C")
+    print("-" * 50)
+
+    if workers > 1:
+        run_prefork(workers)
+    else:
+        run_single()
+
 if __name__ == "__main__":
     main()
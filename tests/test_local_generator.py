@@ -0,0 +1,30 @@
+import asyncio
+
+from app.config import settings
+from app.services.local_generator_service import LocalSentenceGenerator
+from app.services.yandex_gpt_service import YandexGPTService
+from app.utils.performance import performance
+
+
+def test_default_config_reaches_llm(monkeypatch):
+    """С настройками по умолчанию предложение генерирует модель, даже если корпус подходит"""
+    assert settings.local_generator is False
+    assert performance.get().local_generator is False
+
+    generator = LocalSentenceGenerator(database_service=None)
+    generator.add(1, 'Кот спит на стуле', 'кот', ['кот', 'стул'])
+    service = YandexGPTService(local_generator=generator)
+    service.api_url, service.secret_key, service.folder_id = 'http://gpt.test', 'key', 'folder'
+
+    prompts = []
+
+    async def complete(prompt, **kwargs):
+        prompts.append(prompt)
+        return 'Кот лежит под стулом'
+
+    monkeypatch.setattr(service, '_complete', complete)
+    result = asyncio.run(service.generate_sentence(['кот', 'стул'], previous_sentences=[]))
+
+    assert result['source'] == 'yandex_gpt'
+    assert result['sentence'] == 'Кот лежит под стулом'
+    assert len(prompts) == 1